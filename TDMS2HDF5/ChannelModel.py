@@ -19,17 +19,35 @@ __status__ = "Development"
 
 import os
 import sys
-from datetime import datetime
+import ast
+from datetime import datetime, timedelta
+from functools import partial
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from fnmatch import fnmatchcase
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import pytz
 
 import numpy as np
+import numexpr
 import pandas as pd
 import csv
 from scipy import stats
 
-from nptdms.tdms import TdmsFile
-
 from TDMS2HDF5.Calculations import new_interpolate_bfield
+from TDMS2HDF5.TimeBase import TimeBase, time_base
+from TDMS2HDF5.ChunkedArray import ChunkedArray, owned_nbytes
+from TDMS2HDF5.StepArray import StepArray, step_encode
+from TDMS2HDF5.History import (processing_step, OffsetDelta, MaskDelta,
+                               StateDelta, ListenerDelta)
+from TDMS2HDF5.MemoryBudget import MemoryBudget
+from TDMS2HDF5.TDMSReader import (TDMSReader, NpTDMSReader,
+                                  UnsupportedTDMSError, CHUNK_LENGTH,
+                                  PREVIEW_POINTS, scratch_memmap)
+
+# The number of values of each chunk of a FusedCalculation, small enough for
+# the chunks of all its channels to stay in the processor's cache
+FUSED_CHUNK_LENGTH = 1 << 16
 
 ADWIN_DICT = {"ISample": ["IAmp"], "VSample": ["VAmp"],
               "dISample": ["IAmp", "LISens"], "dVSample": ["VAmp", "LVSens"],
@@ -78,6 +96,680 @@ def replace_name(name, dict=CHANNEL_DICT):
     return name
 
 
+def split_key(key):
+    """Split a channel registry key into its parent, device and channel.
+
+    Parameters
+    ----------
+    key : str
+        A key like 'proc01/ADWin/ISample'.
+
+    Returns
+    -------
+    tuple
+        (parent, device, channel). The device is '' for keys without one,
+        like 'proc/R'.
+
+    """
+    parts = key.split('/', 2)
+    if len(parts) == 3:
+        return tuple(parts)
+    return (parts[0], '', parts[-1])
+
+
+def is_time_track(name):
+    """Return whether a channel name is the name of a device's time track."""
+    return name.startswith(('time', 'Time'))
+
+
+def expression_names(expression):
+    """Return the variable names used in an expression.
+
+    Parameters
+    ----------
+    expression : str
+        An expression numexpr can evaluate, e.g.
+        'dVSample / dISample * LVSens / 10'.
+
+    Returns
+    -------
+    list
+        The names in the order they first appear. The names of functions,
+        like sqrt, are left out.
+
+    Raises
+    ------
+    ValueError
+        If the expression is not valid Python syntax.
+
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as err:
+        raise ValueError('Invalid expression {0!r}: {1}'
+                         .format(expression, err.msg))
+
+    functions = set(id(node.func) for node in ast.walk(tree)
+                    if isinstance(node, ast.Call))
+    # The position each name first appears at
+    positions = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and id(node) not in functions:
+            position = (node.lineno, node.col_offset)
+            positions[node.id] = min(position,
+                                     positions.get(node.id, position))
+
+    return sorted(positions, key=positions.get)
+
+
+def channel_selected(name, include=None, exclude=None):
+    """Return whether a channel matches the include and exclude patterns.
+
+    A pattern is a shell-style wildcard pattern like 'ADWin/*' or
+    'IPS/Magnetfield'. It matches a channel if it matches the channel's
+    '<device>/<channel>' name, or its device name alone.
+
+    Parameters
+    ----------
+    name : str
+        The channel's name, i.e. '<device>/<channel>'.
+    include : list, optional
+        The channel has to match one of these patterns. None matches every
+        channel.
+    exclude : list, optional
+        The channel must not match any of these patterns.
+
+    Returns
+    -------
+    bool
+        Whether the channel should be loaded.
+
+    """
+    candidates = (name, name.split('/')[0])
+
+    def matches(patterns):
+        return any(fnmatchcase(candidate, pattern)
+                   for pattern in patterns for candidate in candidates)
+
+    if include is not None and not matches(include):
+        return False
+    return not (exclude is not None and matches(exclude))
+
+
+def window_time(value, reference):
+    """Return the start or end of a time window as an absolute time.
+
+    Parameters
+    ----------
+    value : numpy.datetime64, datetime, str, numpy.timedelta64, timedelta or
+            float
+        Absolute times are given as datetimes or ISO 8601 strings. Times
+        relative to reference are given as timedeltas or as a number of
+        seconds.
+    reference : numpy.datetime64
+        The time relative times are measured from, usually the file's start
+        time.
+
+    Returns
+    -------
+    numpy.datetime64
+        The absolute time.
+
+    """
+    if isinstance(value, (np.timedelta64, timedelta)):
+        return np.datetime64(reference) + np.timedelta64(value)
+    if isinstance(value, (int, float, np.number)):
+        return (np.datetime64(reference) +
+                np.timedelta64(int(round(value * 1E6)), 'us'))
+    return np.datetime64(value)
+
+
+def sample_window(startTime, timeStep, windowStart=None, windowEnd=None):
+    """Return the indices of the samples of a waveform inside a time window.
+
+    Parameters
+    ----------
+    startTime : numpy.datetime64
+        The time of the waveform's first sample.
+    timeStep : numpy.timedelta64
+        The time between two samples.
+    windowStart : numpy.datetime64, optional
+        The start of the window. None means the start of the waveform.
+    windowEnd : numpy.datetime64, optional
+        The end of the window, inclusive. None means the end of the waveform.
+
+    Returns
+    -------
+    tuple
+        The index of the first sample in the window and the index after the
+        last one, or None if the window extends to the end of the waveform.
+
+    """
+    first = 0
+    if windowStart is not None:
+        first = max(0, int(np.ceil((windowStart - startTime) / timeStep)))
+
+    stop = None
+    if windowEnd is not None:
+        stop = max(first,
+                   int(np.floor((windowEnd - startTime) / timeStep)) + 1)
+
+    return (first, stop)
+
+
+def storage_array(array, dtype=None):
+    """Return a floating point array in the dtype it is stored in.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        The values of a channel.
+    dtype : numpy.dtype, optional
+        The dtype floating point channels are stored in, e.g. numpy.float32.
+        None keeps the values as they are.
+
+    Returns
+    -------
+    numpy.ndarray
+        The array, or a copy converted to dtype if it holds wider floats.
+        Integer values, e.g. counts, are never converted.
+
+    """
+    if (dtype is None or array.dtype.kind != 'f' or
+            array.dtype.itemsize <= np.dtype(dtype).itemsize):
+        return array
+    return array.astype(dtype)
+
+
+def build_tdms_channel(tdmsReader, spec, lazy=False, memmap=False,
+                       scratch_dir=None, dtype=None, step_encoding=False):
+    """Read a waveform channel of a TDMS file and build its Channel.
+
+    This is the part of loading a TDMS file that is independent for every
+    channel, so that it can run on a pool of workers.
+
+    Parameters
+    ----------
+    tdmsReader : TDMSReader
+        The reader of the TDMS file.
+    spec : dict
+        The channel's 'name', 'device', TDMS 'path', 'start_time',
+        'time_step', the 'first' and 'stop' sample index to read and the
+        'attributes' to set.
+    lazy : bool, optional
+        Defer reading the data until it is accessed.
+    memmap : bool, optional
+        Memory map the data instead of reading it.
+    scratch_dir : str, optional
+        The directory for scratch files of memory mapped channels.
+    dtype : numpy.dtype, optional
+        Store floating point data in this dtype, see storage_array. Memory
+        mapped data keeps the dtype of the file.
+    step_encoding : bool, optional
+        Keep data that was read, and changes rarely, step encoded, see
+        Channel.setSteps.
+
+    Returns
+    -------
+    Channel
+        The new channel.
+
+    """
+    (chanPath, first, stop) = (spec['path'], spec['first'], spec['stop'])
+
+    chunks = partial(tdmsReader.iterChannel, chanPath, first, stop)
+    if memmap:
+        read = partial(tdmsReader.mapChannel, chanPath, scratch_dir, first,
+                       stop)
+    else:
+        read = partial(tdmsReader.readChannel, chanPath, first, stop)
+
+    if dtype is not None and not memmap:
+        (readFile, iterFile) = (read, chunks)
+
+        def read():
+            return storage_array(readFile(), dtype)
+
+        def chunks(chunk_length):
+            for chunk in iterFile(chunk_length):
+                yield storage_array(chunk, dtype)
+
+    if lazy:
+        length = tdmsReader.channelLength(chanPath)
+        if stop is not None:
+            length = min(stop, length)
+        newChannel = Channel(spec['name'], device=spec['device'])
+        newChannel.setLoader(read, max(length - first, 0), chunks,
+                             detached=True)
+    else:
+        data = read()
+        steps = None
+        if step_encoding and not memmap:
+            steps = step_encode([data], len(data))
+        if steps is not None:
+            newChannel = Channel(spec['name'], device=spec['device'])
+            newChannel.setSteps(steps)
+        else:
+            newChannel = Channel(spec['name'], device=spec['device'],
+                                 meas_array=data)
+    newChannel.setParent('proc01')
+
+    newChannel.setStartTime(spec['start_time'])
+    newChannel.setTimeStep(spec['time_step'])
+    newChannel.attributes.update(spec['attributes'])
+
+    return newChannel
+
+
+def chunked_calculation(calculation, arrays, scratch_dir=None,
+                        chunk_length=CHUNK_LENGTH):
+    """Evaluate an element-wise calculation chunk by chunk.
+
+    The result is written into a memory map backed by a scratch file, so that
+    memory mapped channels never have to be read into memory as a whole.
+
+    Parameters
+    ----------
+    calculation : callable
+        Calculates the result from parts of the arrays.
+    arrays : list
+        The numpy arrays of equal length the calculation works on.
+    scratch_dir : str, optional
+        The directory for the scratch file.
+    chunk_length : int, optional
+        The number of values calculated at a time.
+
+    Returns
+    -------
+    numpy.memmap
+        The read-only result of the calculation.
+
+    """
+    length = len(arrays[0])
+
+    if length == 0:
+        return calculation(*arrays)
+
+    first = np.asarray(calculation(*[a[:chunk_length] for a in arrays]))
+    result = scratch_memmap(first.dtype, length, scratch_dir)
+    result[:len(first)] = first
+
+    for start in range(chunk_length, length, chunk_length):
+        stop = start + chunk_length
+        result[start:stop] = calculation(*[a[start:stop] for a in arrays])
+
+    result.flush()
+    result.flags.writeable = False
+
+    return result
+
+
+def rechunk(chunks, chunk_length):
+    """Regroup consecutive array parts into parts of chunk_length values.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Consecutive parts of an array of arbitrary lengths.
+    chunk_length : int
+        The number of values of each part that is yielded. Only the last part
+        may be shorter.
+
+    Yields
+    ------
+    numpy.ndarray
+        Consecutive parts of the array.
+
+    """
+    pending = []
+    filled = 0
+
+    for chunk in chunks:
+        while len(chunk):
+            take = min(chunk_length - filled, len(chunk))
+            pending.append(chunk[:take])
+            filled += take
+            chunk = chunk[take:]
+            if filled == chunk_length:
+                yield pending[0] if len(pending) == 1 else \
+                    np.concatenate(pending)
+                pending = []
+                filled = 0
+
+    if pending:
+        yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+
+
+class FusedCalculation(object):
+    """Calculate several derived channels in one pass over their inputs.
+
+    The input channels that are not calculated here themselves are streamed
+    chunk by chunk. Each chunk is read once and every channel is calculated
+    from it, channels derived from other channels here from their freshly
+    calculated chunks. Input channels that were not read yet are never held
+    in memory as a whole. The result of every channel is handed to it as
+    soon as it is calculated, see Channel.setLoadedData, so that no result
+    is kept here.
+
+    Parameters
+    ----------
+    scratch_dir : str, optional
+        The directory for the scratch files of memory mapped results.
+    chunk_length : int, optional
+        The number of values calculated at a time.
+
+    Methods
+    -------
+    add(key : str, chan : Channel, calculation : callable, inputs : list)
+        Add a derived channel to the calculation, return its loader.
+
+    """
+
+    __slots__ = ('scratch_dir', 'chunk_length', '_members')
+
+    def __init__(self, scratch_dir=None, chunk_length=FUSED_CHUNK_LENGTH):
+        super(FusedCalculation, self).__init__()
+
+        self.scratch_dir = scratch_dir
+        self.chunk_length = chunk_length
+        # (chan, calculation, inputs, loader) by key, in the order they were
+        # added
+        self._members = OrderedDict()
+
+    def add(self, key, chan, calculation, inputs):
+        """Add a derived channel to the calculation.
+
+        Parameters
+        ----------
+        key : str
+            The key of the derived channel.
+        chan : Channel
+            The derived channel.
+        calculation : callable
+            Returns the derived data given the data arrays of inputs.
+        inputs : list
+            The input channels. Channels added before are calculated here,
+            channels added later can not be inputs.
+
+        Returns
+        -------
+        callable
+            The loader of the channel, see Channel.setLoader. Only the
+            channels whose loader it still is are calculated in the pass.
+
+        """
+        loader = partial(self._result, key)
+        self._members[key] = (chan, calculation, inputs, loader)
+        return loader
+
+    def _result(self, key):
+        """Calculate the channels, return the data of key.
+
+        The results of the other channels are handed to them.
+
+        """
+        results = self._calculate(key)
+        for (other, result) in results.items():
+            if other != key:
+                self._members[other][0].setLoadedData(result)
+        return results[key]
+
+    def _calculate(self, key):
+        """Calculate key and the channels that still have their loader."""
+        # Channels that were read or replaced are inputs like any other
+        members = OrderedDict(
+            (other, member) for (other, member) in self._members.items()
+            if other == key or member[0].getLoader() is member[3])
+        calculated = [chan for (chan, _, _, _) in members.values()]
+        sources = []
+        for (_, _, inputs, _) in members.values():
+            for inp in inputs:
+                if not any(inp is chan for chan in calculated + sources):
+                    sources.append(inp)
+
+        length = min(inp.attributes['Length'] for inp in sources)
+        memmapped = any(inp.isMemmapped() for inp in sources)
+        results = OrderedDict()
+
+        start = 0
+        for chunks in zip(*[inp.iterData(self.chunk_length)
+                            for inp in sources]):
+            stop = min(start + len(chunks[0]), length)
+            values = dict((id(inp), chunk[:stop - start])
+                          for (inp, chunk) in zip(sources, chunks))
+            for (other, (chan, calculation, inputs, _)) in members.items():
+                part = np.asarray(calculation(*[values[id(inp)]
+                                                for inp in inputs]))
+                if other not in results:
+                    results[other] = (
+                        scratch_memmap(part.dtype, length, self.scratch_dir)
+                        if memmapped else np.empty(length, part.dtype))
+                results[other][start:stop] = part
+                values[id(chan)] = results[other][start:stop]
+            start = stop
+            if start >= length:
+                break
+
+        for (other, (chan, calculation, inputs, _)) in members.items():
+            if other not in results:
+                results[other] = np.asarray(calculation(
+                    *[np.empty(0) for inp in inputs]))
+            elif memmapped:
+                results[other].flush()
+                results[other].flags.writeable = False
+
+        return results
+
+
+class ChannelStatistics(object):
+    """Summary statistics of a channel's values, accumulated chunk by chunk.
+
+    NaN values are counted and otherwise ignored. The statistics of
+    consecutive chunks are merged with the pairwise update of Chan et al., so
+    that they can be accumulated while streaming a channel.
+
+    Attributes
+    ----------
+    count : int
+        The number of values that are not NaN.
+    nan_count : int
+        The number of NaN values.
+    minimum, maximum : float
+        The extreme values, NaN if there are none.
+    mean : float
+        The mean of the values, NaN if there are none.
+
+    Methods
+    -------
+    add(values : numpy.ndarray)
+        Add the statistics of more values.
+    merge(other : ChannelStatistics)
+        Add the statistics of other values.
+    asDict()
+        Return the statistics as a dict.
+
+    """
+
+    __slots__ = ('count', 'nan_count', 'minimum', 'maximum', 'mean', '_m2')
+
+    def __init__(self, values=None):
+        super(ChannelStatistics, self).__init__()
+
+        self.count = 0
+        self.nan_count = 0
+        self.minimum = np.nan
+        self.maximum = np.nan
+        self.mean = np.nan
+        # The sum of the squared differences from the mean
+        self._m2 = 0.0
+
+        if values is not None:
+            self.add(values)
+
+    @property
+    def std(self):
+        """The standard deviation of the values, NaN if there are none."""
+        if not self.count:
+            return np.nan
+        return np.sqrt(self._m2 / self.count)
+
+    def add(self, values):
+        """Add the statistics of more values.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            The next chunk of the channel's values.
+
+        """
+        values = np.asarray(values)
+        if values.dtype.kind in 'fc':
+            nans = np.isnan(values)
+            nanCount = int(np.count_nonzero(nans))
+            if nanCount:
+                self.nan_count += nanCount
+                values = values[~nans]
+        if not len(values):
+            return
+
+        other = ChannelStatistics()
+        other.count = len(values)
+        other.minimum = float(values.min())
+        other.maximum = float(values.max())
+        other.mean = float(values.mean(dtype=np.float64))
+        other._m2 = float(np.var(values, dtype=np.float64)) * other.count
+        self.merge(other)
+
+    def merge(self, other):
+        """Add the statistics of other values.
+
+        Parameters
+        ----------
+        other : ChannelStatistics
+            The statistics of the values following the ones of self.
+
+        """
+        self.nan_count += other.nan_count
+        if not other.count:
+            return
+        if not self.count:
+            (self.count, self.minimum, self.maximum, self.mean, self._m2) = \
+                (other.count, other.minimum, other.maximum, other.mean,
+                 other._m2)
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def asDict(self):
+        """Return the statistics as a dict.
+
+        Returns
+        -------
+        dict
+            'min', 'max', 'mean', 'std', 'count' and 'nan_count'.
+
+        """
+        return {'min': self.minimum, 'max': self.maximum, 'mean': self.mean,
+                'std': self.std, 'count': self.count,
+                'nan_count': self.nan_count}
+
+
+class ChannelAttributes(MutableMapping):
+    """The attributes of a channel.
+
+    Behaves like a dict. Device, TimeInterval, Length and StartTime, which
+    every channel has, are kept in typed fields, any other attributes, e.g.
+    the amplifier settings in ADWIN_DICT, in a small overflow dict that is
+    only created when the first of them is set. Setting or removing one of
+    the latter tells the channel's listeners that the channel changed.
+
+    Parameters
+    ----------
+    device : str
+        The name of the recording device.
+    time_interval : numpy.timedelta64
+        The time between two measurement points.
+    length : int
+        The number of measurement points.
+    start_time : numpy.datetime64
+        The time of the first measurement point.
+    channel : Channel, optional
+        The channel the attributes belong to.
+
+    """
+
+    __slots__ = ('_device', '_timeInterval', '_length', '_startTime',
+                 '_extra', '_channel')
+
+    # The standard attributes, the fields they are kept in and their types
+    _FIELDS = OrderedDict([('Device', ('_device', str)),
+                           ('TimeInterval', ('_timeInterval',
+                                             np.timedelta64)),
+                           ('Length', ('_length', int)),
+                           ('StartTime', ('_startTime', np.datetime64))])
+
+    def __init__(self, device, time_interval, length, start_time,
+                 channel=None):
+        self._device = str(device)
+        self._timeInterval = np.timedelta64(time_interval)
+        self._length = int(length)
+        self._startTime = np.datetime64(start_time)
+        self._extra = None
+        self._channel = channel
+
+    def __getitem__(self, key):
+        field = self._FIELDS.get(key)
+        if field is not None:
+            return getattr(self, field[0])
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        field = self._FIELDS.get(key)
+        if field is not None:
+            setattr(self, field[0], field[1](value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+            if self._channel is not None:
+                self._channel._changed()
+
+    def __delitem__(self, key):
+        if key in self._FIELDS:
+            raise KeyError('{0} can not be removed'.format(key))
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+        if self._channel is not None:
+            self._channel._changed()
+
+    def __contains__(self, key):
+        return key in self._FIELDS or (self._extra is not None and
+                                       key in self._extra)
+
+    def __iter__(self):
+        for key in self._FIELDS:
+            yield key
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return len(self._FIELDS) + (0 if self._extra is None else
+                                    len(self._extra))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 class Channel(object):
     """A measurement channel containing a waveform and meta data.
 
@@ -96,7 +788,7 @@ class Channel(object):
 
     Attributes
     ----------
-    attributes : dictionary_like
+    attributes : ChannelAttributes
        The channel's attributes correspond to the attributes found with
        a channel in a HDF5 file. Here they are stored as key-value pairs.
        Device : string
@@ -110,11 +802,17 @@ class Channel(object):
     name : string
        The channel's name.
     data : numpy.ndarray
-       The measurement data array.
+       The measurement data array. If the channel was given a loader, the
+       data is only read the first time it is accessed. Once values have
+       been appended, they are kept in a ChunkedArray and only joined into
+       one array when data is accessed. Data spilled to a scratch file is
+       read back on access.
     time : numpy.ndarray
-       The absolute time array of the measurement.
+       The absolute time array of the measurement. It is calculated by the
+       channel's time base on first access.
     elapsed_time : numpy.ndarray
-       The elapsed time array of the measurement.
+       The elapsed time array of the measurement in minutes, calculated by
+       the channel's time base on first access.
     parent : string
        The name of the parent group of the channel in the HDF5 file.
     write_to_file : boolean
@@ -142,10 +840,59 @@ class Channel(object):
         Return the elapsed time track of the measurement (numpy.ndarry)
     getTimeTrack()
         Return the time track of the channel measurement (numpy.ndarray)
+    getTimeBase()
+        Return the shared time base of the channel (TimeBase)
     toggleWrite()
         Toggle's the channels write_to_file value
     getDevice()
         Return the name of the device that recorded the channel.
+    setLoader(loader : callable, length : int, chunks : callable,
+              detached : bool)
+        Defer reading the measurement data until it is first accessed.
+    addListener(listener : callable)
+        Call listener whenever the channel's data is replaced.
+    removeListener(listener : callable)
+        Stop calling a listener.
+    getListeners()
+        Return the listeners of the channel.
+    getLoader()
+        Return the callable that will produce the channel's data.
+    setLoadedData(data : numpy.ndarray)
+        Set the data the channel's loader would return.
+    isDetached()
+        Return whether the loader can run on another thread.
+    getChunks()
+        Return the callable that streams the channel's data.
+    iterData(chunk_length : int)
+        Iterate over the measurement data in chunks.
+    readData(start : int, stop : int)
+        Return a range of the measurement data.
+    getStatistics()
+        Return the summary statistics of the measurement data (dict).
+    setSteps(steps : StepArray)
+        Keep the measurement data step encoded until it is accessed.
+    getSteps()
+        Return the step encoded measurement data (StepArray).
+    isLoaded()
+        Return whether the measurement data has been read.
+    spill(scratch_dir : str)
+        Move the measurement data to scratch files until it is accessed.
+    isSpilled()
+        Return whether the measurement data is in scratch files.
+    getResidentBytes()
+        Return the number of bytes of measurement data held in memory.
+    getSpilledBytes()
+        Return the number of bytes of measurement data in scratch files.
+    isMemmapped()
+        Return whether the measurement data is a memory map.
+    appendData(newData : numpy.ndarray)
+        Append values to the measurement data and the time tracks.
+    setPreview(indices : numpy.ndarray, values : numpy.ndarray)
+        Set a decimated subset of the data to show until it is read.
+    getPreview()
+        Return the indices and values of the decimated subset of the data.
+    window(first : int, stop : int)
+        Return the channel restricted to a range of samples.
 
     See Also
     --------
@@ -153,42 +900,625 @@ class Channel(object):
 
     """
 
+    __slots__ = ('attributes', 'name', 'parent', 'unit', 'write_to_file',
+                 '_data', '_shared', '_loader', '_detached', '_chunks',
+                 '_buffers', '_preview',
+                 '_timeBase', '_timeTracks', '_statistics', '_steps',
+                 '_listeners', '_spilled', '_budget')
+
     def __init__(self, name, device='', meas_array=np.array([])):
         super(Channel, self).__init__()
 
-        self.attributes = {"Device": device,
-                           "TimeInterval": np.timedelta64(1, 'ms'),
-                           "Length": len(meas_array),
-                           "StartTime": np.datetime64(datetime.now())}
+        # The callables to call when the data or attributes are replaced
+        self._listeners = None
+        # The scratch file memory map of spilled data and the memory budget
+        # of the registry the channel is in
+        self._spilled = None
+        self._budget = None
+        self.attributes = ChannelAttributes(device, np.timedelta64(1, 'ms'),
+                                            len(meas_array),
+                                            np.datetime64(datetime.now()),
+                                            self)
 
         self.setName(name)
+        # Whether the data array was handed out, see spill
+        self._shared = False
+        self._loader = None
+        self._detached = False
+        self._chunks = None
+        self._buffers = {}
+        self._preview = None
+        # The time base of the current timing and time tracks that were set
+        # explicitly, each with the timing it belongs to
+        self._timeBase = None
+        self._timeTracks = {}
+        # The summary statistics of the data, once calculated
+        self._statistics = None
+        self._steps = None
         self.data = meas_array
-        self.time = np.array([])
-        self.elapsed_time = np.array([])
         self.parent = None
         self.unit = 'n.a.'
         self.write_to_file = True
 
-        self._recalculateTimeArray()
+    def _timing(self):
+        """Return what the time tracks are calculated from."""
+        return (self.attributes['StartTime'], self.attributes['TimeInterval'],
+                self.attributes['Length'])
+
+    def _cachedTimeTrack(self, name):
+        """Return the cached time track name or None if it is outdated."""
+        (timing, track) = self._timeTracks.get(name, (None, None))
+        if timing is None or timing != self._timing():
+            return None
+        return track
 
     def _recalculateTimeArray(self):
-        """Recalculate the time track based on start time and time step"""
+        """Forget the time tracks, they are recalculated on next access."""
+        self._timeTracks.clear()
 
-        dt = self.attributes['TimeInterval']
+    def getTimeBase(self):
+        """Return the time base of the channel.
 
-        length = self.attributes['Length']
+        Channels with the same start time, time interval and length share the
+        same TimeBase object.
+
+        Returns
+        -------
+        TimeBase
+
+        """
+        timing = self._timing()
+        if self._timeBase is None or self._timeBase[0] != timing:
+            self._timeBase = (timing, time_base(*timing))
+        return self._timeBase[1]
+
+    @property
+    def time(self):
+        """The absolute time array, calculated on first access."""
+        track = self._cachedTimeTrack('time')
+        if track is None:
+            track = self.getTimeBase().times()
+        return track
+
+    @time.setter
+    def time(self, newTime):
+        self._timeTracks['time'] = (self._timing(), newTime)
+
+    @property
+    def elapsed_time(self):
+        """The elapsed time array in minutes, calculated on first access."""
+        track = self._cachedTimeTrack('elapsed_time')
+        if track is None:
+            track = self.getTimeBase().minutes()
+        return track
+
+    @elapsed_time.setter
+    def elapsed_time(self, newElapsedTime):
+        self._timeTracks['elapsed_time'] = (self._timing(), newElapsedTime)
+
+    @property
+    def data(self):
+        """The measurement data array, read on first access if necessary."""
+        read = self._loader is not None or self._spilled is not None
+        if self._loader is not None:
+            self._data = self._loader()
+            self._loader = None
+            self._detached = False
+            self._chunks = None
+        elif self._spilled is not None:
+            self._data = np.concatenate(list(self._spilled.iterChunks()))
+            self._spilled = None
+        if self._budget is not None:
+            self._budget.accessed(self, read)
+        if isinstance(self._data, ChunkedArray):
+            return self._data.toArray()
+        self._shared = True
+        return self._data
+
+    @data.setter
+    def data(self, newData):
+        self._data = newData
+        # The channel takes the array over
+        self._shared = False
+        self._loader = None
+        self._detached = False
+        self._chunks = None
+        self._spilled = None
+        self._statistics = None
+        self._steps = None
+        if self._budget is not None:
+            self._budget.changed(self)
+        self._changed()
+
+    def addListener(self, listener):
+        """Call listener whenever the channel's data is replaced.
+
+        The listeners are called after the data is set, a loader is set or
+        an attribute other than the standard ones is set or removed. They
+        are not called when values are appended.
+
+        Parameters
+        ----------
+        listener : callable
+            A callable without arguments.
+
+        """
+        if self._listeners is None:
+            self._listeners = []
+        self._listeners.append(listener)
+
+    def removeListener(self, listener):
+        """Stop calling a listener added with addListener.
+
+        Parameters
+        ----------
+        listener : callable
+            The listener, nothing happens if it was not added.
+
+        """
+        if self._listeners is not None and listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def getListeners(self):
+        """Return the listeners of the channel.
+
+        Returns
+        -------
+        list
+            The callables added with addListener.
+
+        """
+        return list(self._listeners or ())
+
+    def _changed(self):
+        """Call the listeners of the channel."""
+        if self._listeners is not None:
+            for listener in self._listeners:
+                listener()
+
+    def setLoader(self, loader, length, chunks=None, detached=False):
+        """Defer reading the measurement data until it is first accessed.
+
+        Parameters
+        ----------
+        loader : callable
+            A callable without arguments returning the measurement array.
+        length : int
+            The number of data points the loader will return.
+        chunks : callable, optional
+            A callable taking a chunk length and returning an iterator over
+            consecutive parts of the measurement array. With it iterData can
+            stream the data without reading all of it at once.
+        detached : bool, optional
+            Whether the loader only reads the data from its source, without
+            touching any channel, so that it can run on another thread. See
+            isDetached.
+
+        """
+        self._data = None
+        self._loader = loader
+        self._detached = detached
+        self._chunks = chunks
+        self._spilled = None
+        self._statistics = None
+        self._steps = None
+        self.attributes['Length'] = length
+        self._recalculateTimeArray()
+        if self._budget is not None:
+            self._budget.changed(self)
+        self._changed()
+
+    def setLoadedData(self, data):
+        """Set the data the channel's loader would return, as if it was read.
+
+        Unlike replacing the data, the listeners are not called, e.g. when a
+        FusedCalculation hands over a result it calculated along with another
+        channel's.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The measurement data, of the length the loader was set with.
+
+        """
+        self._data = data
+        self._shared = False
+        self._loader = None
+        self._detached = False
+        self._chunks = None
+        if self._budget is not None:
+            self._budget.changed(self)
+
+    def getChunks(self):
+        """Return the callable that streams the channel's data.
+
+        Returns
+        -------
+        callable or None
+            None if the data is in memory or can not be streamed.
+
+        """
+        return self._chunks
+
+    def iterData(self, chunk_length=CHUNK_LENGTH):
+        """Iterate over the measurement data in chunks.
+
+        Data that has not been read yet is streamed from its source if
+        possible, without keeping more than one chunk in memory.
+
+        Parameters
+        ----------
+        chunk_length : int, optional
+            The number of values in each chunk.
+
+        Yields
+        ------
+        numpy.ndarray
+            Consecutive parts of the measurement data.
+
+        """
+        if self._loader is not None and self._chunks is not None:
+            for chunk in rechunk(self._chunks(chunk_length), chunk_length):
+                yield chunk
+            return
+
+        # Spilled data is streamed from its scratch files
+        for chunked in (self._spilled, self._data):
+            if isinstance(chunked, ChunkedArray):
+                for chunk in rechunk(chunked.iterChunks(), chunk_length):
+                    yield chunk
+                return
+
+        data = self.data
+        for start in range(0, len(data), chunk_length):
+            yield data[start:start + chunk_length]
+
+    def readData(self, start=0, stop=None):
+        """Return a range of the measurement data.
+
+        Unlike slicing data, the values appended to the channel are not
+        joined into one array first.
+
+        Parameters
+        ----------
+        start : int, optional
+            The index of the first value.
+        stop : int, optional
+            The index after the last value. Defaults to the channel's length.
+
+        Returns
+        -------
+        numpy.ndarray
+
+        """
+        if self._spilled is not None:
+            return np.array(self._spilled.read(start, stop))
+        if self._loader is None and isinstance(self._data, ChunkedArray):
+            return self._data.read(start, stop)
+        return self.data[start:stop]
+
+    def setSteps(self, steps):
+        """Keep the measurement data step encoded until it is accessed.
 
-        startTime = np.datetime64(self.attributes['StartTime'])
+        The data is only expanded into a full array when data is accessed,
+        iterData expands it chunk by chunk. The encoding is kept until the
+        data is replaced or appended to, so that it can still be exported.
 
-        stopTime = startTime + dt * length
+        Parameters
+        ----------
+        steps : StepArray
+            The step encoded measurement data.
+
+        """
+        self.setLoader(steps.toArray, len(steps), steps.iterChunks,
+                       detached=True)
+        self._steps = steps
+
+    def getSteps(self):
+        """Return the step encoded measurement data.
+
+        Returns
+        -------
+        StepArray or None
+            None if the data is not step encoded.
+
+        """
+        return self._steps
+
+    def getStatistics(self, chunk_length=CHUNK_LENGTH):
+        """Return the summary statistics of the measurement data.
+
+        The statistics are calculated in one pass over the data chunk by
+        chunk, so that data that has not been read or is memory mapped is
+        never held in memory as a whole. They are kept until the data is
+        replaced, appended values are added to them.
+
+        Parameters
+        ----------
+        chunk_length : int, optional
+            The number of values in each chunk.
+
+        Returns
+        -------
+        dict
+            'min', 'max', 'mean', 'std', 'count' and 'nan_count' of the data,
+            see ChannelStatistics.
+
+        """
+        if self._statistics is None:
+            statistics = ChannelStatistics()
+            for chunk in self.iterData(chunk_length):
+                statistics.add(chunk)
+            self._statistics = statistics
+        return self._statistics.asDict()
+
+    def getLoader(self):
+        """Return the callable that will produce the channel's data.
+
+        Returns
+        -------
+        callable or None
+            None if the data is already in memory.
+
+        """
+        return self._loader
+
+    def isDetached(self):
+        """Return whether the loader can run on another thread.
+
+        A detached loader only reads the data from its source, e.g. a TDMS
+        file, and touches no channel. Its result is handed to the channel
+        with setLoadedData, on the thread that owns the channel.
+
+        """
+        return self._loader is not None and self._detached
+
+    def isLoaded(self):
+        """Return whether the measurement data has been read.
+
+        Data that was read and then spilled to a scratch file counts as read,
+        accessing it reads it back from there.
 
-        absolute_time_track = np.arange(startTime, stopTime, dt)
+        """
+        return self._loader is None
+
+    def spill(self, scratch_dir=None):
+        """Move the measurement data to scratch files until it is accessed.
+
+        Only data held in memory is spilled, not data that was not read yet,
+        is memory mapped or a view of another channel's data. Data that was
+        handed out, by data, readData or window, is spilled as well, but its
+        memory is only freed once the arrays handed out are dropped, so it
+        is not counted as freed. See ChunkedArray.spill. The statistics, step
+        encoding and time tracks of the channel are kept. Accessing data
+        reads it back into memory, iterData and readData read from the
+        scratch files without doing so, and appended values are added in
+        memory without reading the spilled ones.
+
+        Parameters
+        ----------
+        scratch_dir : str, optional
+            The directory for the scratch file. Defaults to the system's
+            temporary directory.
+
+        Returns
+        -------
+        int
+            The number of bytes of memory freed.
+
+        """
+        data = self._data
+        if not self.getResidentBytes() or data.dtype.hasobject:
+            return 0
+        if not isinstance(data, ChunkedArray):
+            data = ChunkedArray(data, shared=self._shared)
+        self._shared = False
+
+        freed = data.spill(scratch_dir)
+        if data.getResidentBytes():
+            # Blocks after a view of another array stay in memory
+            self._data = data
+        else:
+            (self._data, self._spilled) = (None, data)
+        return freed
+
+    def isSpilled(self):
+        """Return whether the measurement data is in scratch files."""
+        return self._spilled is not None
+
+    def getSpilledBytes(self):
+        """Return the number of bytes of measurement data in scratch files."""
+        chunked = self._data if self._spilled is None else self._spilled
+        if self._loader is not None or not isinstance(chunked, ChunkedArray):
+            return 0
+        return chunked.spilled_nbytes
+
+    def isMemmapped(self):
+        """Return whether the measurement data is a memory map.
+
+        Unlike checking data itself, this does not read the data.
 
-        elapsed_time_track = ((absolute_time_track - startTime) /
-                              np.timedelta64(1, 'm'))
+        """
+        return (self._loader is None and self._spilled is None and
+                isinstance(self._data, np.memmap))
+
+    def getResidentBytes(self):
+        """Return the number of bytes of measurement data held in memory.
+
+        Data that was not read yet, is spilled or memory mapped, and views of
+        another channel's data take none. See ChunkedArray.owned_nbytes.
+
+        Returns
+        -------
+        int
+
+        """
+        if self._loader is not None or self._spilled is not None:
+            return 0
+        if isinstance(self._data, ChunkedArray):
+            return self._data.getResidentBytes()
+        if not isinstance(self._data, np.ndarray):
+            return 0
+        return owned_nbytes(self._data)
 
-        self.time = absolute_time_track
-        self.elapsed_time = elapsed_time_track
+    def setPreview(self, indices, values):
+        """Set a decimated subset of the data to show until it is read.
+
+        Parameters
+        ----------
+        indices : numpy.ndarray
+            The indices of the values in the measurement data.
+        values : numpy.ndarray
+            The values at these indices.
+
+        """
+        self._preview = (indices, values)
+
+    def getPreview(self):
+        """Return the decimated subset of the measurement data.
+
+        Returns
+        -------
+        tuple or None
+            The indices and values of the preview, or None if the channel has
+            no preview.
+
+        """
+        return self._preview
+
+    def window(self, first=0, stop=None):
+        """Return the channel restricted to a range of samples.
+
+        The data of the new channel is a view of this channel's data, nothing
+        is copied. If the data has not been read yet, the new channel reads
+        it through this channel when it is first accessed, and streams only
+        the chunks up to stop.
+
+        Parameters
+        ----------
+        first : int, optional
+            The index of the first sample of the window.
+        stop : int, optional
+            The index after the last sample of the window. Defaults to the
+            channel's length.
+
+        Returns
+        -------
+        Channel
+            A channel with the same attributes and a start time and length
+            matching the window.
+
+        """
+        (first, stop, _) = slice(first, stop).indices(
+            self.attributes['Length'])
+        stop = max(first, stop)
+
+        newChan = Channel(self.name, self.attributes['Device'])
+        for (attrName, attrValue) in self.attributes.items():
+            newChan.attributes[attrName] = attrValue
+        newChan.setStartTime(self.getTimeBase().timeAt(first))
+        newChan.parent = self.parent
+        newChan.unit = self.unit
+        newChan.write_to_file = self.write_to_file
+
+        if self.isLoaded():
+            newChan.data = self.data[first:stop]
+            newChan.attributes['Length'] = stop - first
+        else:
+            chunks = None
+            if self._chunks is not None:
+                chunks = partial(self._iterWindow, first, stop)
+            newChan.setLoader(lambda: self.data[first:stop], stop - first,
+                              chunks)
+
+        if self._preview is not None:
+            (indices, values) = self._preview
+            inside = (indices >= first) & (indices < stop)
+            newChan.setPreview(indices[inside] - first, values[inside])
+
+        return newChan
+
+    def _iterWindow(self, first, stop, chunk_length=CHUNK_LENGTH):
+        """Iterate over the chunks of the data from first to stop."""
+        position = 0
+        for chunk in self.iterData(chunk_length):
+            end = position + len(chunk)
+            if end > first:
+                yield chunk[max(first - position, 0):stop - position]
+            position = end
+            if position >= stop:
+                break
+
+    def _extend(self, name, array, values):
+        """Return array with values appended to it.
+
+        The result is a view of a buffer with room to spare, which the next
+        call for the same name fills instead of copying the whole array.
+
+        """
+        (buffer, view) = self._buffers.get(name, (None, None))
+        length = len(array)
+        end = length + len(values)
+
+        if (view is not array or len(buffer) < end or
+                np.result_type(buffer, values) != buffer.dtype):
+            buffer = np.empty(max(2 * end, 1), np.result_type(array, values))
+            buffer[:length] = array
+
+        buffer[length:end] = values
+        view = buffer[:end]
+        self._buffers[name] = (buffer, view)
+
+        return view
+
+    def appendData(self, newData):
+        """Append values to the measurement data and the time tracks.
+
+        The values are appended to the blocks of a ChunkedArray, and the
+        channel's time base grows with them. Time tracks that were set
+        explicitly are extended by the time stamps of the new values. Either
+        way appending costs time proportional to the number of new values,
+        not the channel's length.
+
+        Parameters
+        ----------
+        newData : numpy.ndarray
+            The values to append.
+
+        """
+        length = self.attributes['Length']
+        newBase = self.getTimeBase().resized(length + len(newData))
+
+        time = self._cachedTimeTrack('time')
+        elapsed_time = self._cachedTimeTrack('elapsed_time')
+
+        statistics = self._statistics
+        if self._spilled is not None:
+            # The spilled values stay in their scratch files
+            (self._data, self._spilled) = (self._spilled, None)
+        if self._loader is not None or not isinstance(self._data,
+                                                      ChunkedArray):
+            # Appending does not replace the data, so it is not a change
+            shared = self._loader is None and self._shared
+            chunked = ChunkedArray(self.data, shared=shared)
+            (self._data, self._shared, self._loader, self._chunks,
+             self._steps) = (chunked, False, None, None, None)
+        self._data.append(newData)
+        self.attributes['Length'] = length + len(newData)
+        if statistics is not None:
+            statistics.add(newData)
+            self._statistics = statistics
+
+        if time is not None:
+            self.time = self._extend('time', time,
+                                     newBase.times(length, len(newBase)))
+        if elapsed_time is not None:
+            self.elapsed_time = self._extend(
+                'elapsed_time', elapsed_time,
+                newBase.minutes(length, len(newBase)))
+
+        if self._budget is not None:
+            self._budget.changed(self)
 
     def setParent(self, newParent):
         """Set the parent group of the channel in the HDF5 file.
@@ -333,80 +1663,605 @@ class Channel(object):
         return self.attributes['Device']
 
 
-class ChannelRegistry(dict):
-    """Container for holding all of the channels
+class Derivation(object):
+    """How a derived channel is calculated from other channels.
+
+    Parameters
+    ----------
+    key : str
+        The key of the derived channel, e.g. 'proc/V'.
+    device : str
+        The device the derived channel belongs to.
+    alternatives : list
+        Lists of the keys of the input channels, in order of preference.
+    calculation : callable
+        Returns the derived data given the data arrays of the inputs and the
+        attributes as keyword arguments.
+    attributes : list, optional
+        The names of the attributes of the first input the calculation
+        needs, e.g. ['VAmp', 'LVSens'].
+    description : str, optional
+        The description added to the registry's mods.
+
+    """
+
+    __slots__ = ('key', 'device', 'alternatives', 'calculation', 'attributes',
+                 'description')
+
+    def __init__(self, key, device, alternatives, calculation, attributes=(),
+                 description=None):
+        super(Derivation, self).__init__()
+
+        self.key = key
+        self.device = device
+        self.alternatives = alternatives
+        self.calculation = calculation
+        self.attributes = tuple(attributes)
+        self.description = description
+
+
+# The calibration of the RuO thermometer read by the ADWin
+RUO_SLOPE = (6.66E3 - 1.25E3) / 20
+RUO_OFFSET = (6.66E3 + 1.25E3) / 2
+
+
+def ruo_resistance(vRuO):
+    """Return the RuO resistance of the voltage of the ADWin's RuO input.
+
+    The calibration subtracts values of a similar size from the resistance,
+    so it is calculated in double precision even if the voltage is stored in
+    single precision.
+
+    """
+    return vRuO.astype(np.float64) * RUO_SLOPE + RUO_OFFSET
+
+
+def ruo_temperature(vRuO):
+    """Return the temperature of the voltage of the ADWin's RuO input."""
+    return np.exp(8.584 + (-1.156 * np.log(ruo_resistance(vRuO) - 1259.9)))
+
+
+# The derived channels the registry knows how to add, by their key. The
+# channels read from a TDMS file are keyed with their device, e.g.
+# 'proc01/ADWin/VSample', the keys without it are those of channels added
+# without their device.
+DERIVATIONS = OrderedDict((derivation.key, derivation) for derivation in [
+    Derivation('proc/V', 'ADWin', [['proc01/ADWin/VSample'],
+                                   ['proc01/VSample']],
+               lambda vSample, VAmp: (vSample / VAmp) * 1E3, ['VAmp'],
+               'Adding amplifier-adjusted absolute sample voltage'),
+    Derivation('proc/dV', 'ADWin', [['proc01/ADWin/dVSample'],
+                                    ['proc01/dVSample']],
+               lambda dVSample, VAmp, LVSens:
+               ((dVSample / VAmp) / 10) * LVSens * 1E3, ['VAmp', 'LVSens'],
+               'Adding amplifier-adjusted differential sample voltage'),
+    Derivation('proc/I', 'ADWin', [['proc01/ADWin/ISample'],
+                                   ['proc01/ISample']],
+               lambda iSample, IAmp: (iSample / IAmp) * 1E6, ['IAmp'],
+               'Adding amplifier-adjusted absolute sample current'),
+    Derivation('proc/dI', 'ADWin', [['proc01/ADWin/dISample'],
+                                    ['proc01/dISample']],
+               lambda dISample, IAmp, LISens:
+               ((dISample / IAmp) / 10) * LISens * 1E6, ['IAmp', 'LISens'],
+               'Adding amplifier-adjusted differential sample current'),
+    Derivation('proc/R', 'ADWin', [['proc01/I', 'proc01/V'],
+                                   ['proc/I', 'proc/V']],
+               lambda i, v: v/i, (),
+               'Adding amplifier-adjusted absolute sample resistance'),
+    Derivation('proc01/ADWin/RSample', 'ADWin',
+               [['proc01/ADWin/ISample', 'proc01/ADWin/VSample'],
+                ['proc/ISample', 'proc/VSample']],
+               lambda iSample, vSample: vSample/iSample, (),
+               'Adding absolute sample resistance'),
+    Derivation('proc01/ADWin/dRSample', 'ADWin',
+               [['proc01/ADWin/dISample', 'proc01/ADWin/dVSample'],
+                ['proc/dISample', 'proc/dVSample']],
+               lambda dISample, dVSample: dVSample/dISample, (),
+               'Adding differential sample resistance'),
+    Derivation('proc01/all/dISample', 'all',
+               [['proc01/all/dISamplex', 'proc01/all/dISampley']],
+               lambda x, y: np.sqrt(x**2 + y**2), (),
+               'Adding differential sample current'),
+    Derivation('proc01/all/dVSample', 'all',
+               [['proc01/all/dVSamplex', 'proc01/all/dVSampley']],
+               lambda x, y: np.sqrt(x**2 + y**2), (),
+               'Adding differential sample voltage'),
+    Derivation('proc/dR', 'ADWin', [['proc01/dI', 'proc01/dV'],
+                                    ['proc/dI', 'proc/dV']],
+               lambda dI, dV: dV/dI, (),
+               'Adding amplifier-adjusted differential sample resistance'),
+    Derivation('proc01/ADWin/Res_RuO', 'ADWin',
+               [['proc01/ADWin/TRuO'], ['proc01/ADWin/VRuO']],
+               ruo_resistance),
+    Derivation('proc01/ADWin/TSample_AD', 'ADWin',
+               [['proc01/ADWin/TRuO'], ['proc01/ADWin/VRuO']],
+               ruo_temperature, (),
+               'Adding sample temperature based on TRuO or VRuO')])
+
+
+class ChannelRegistry(dict):
+    """Container for holding all of the channels
+
+    This is just a basic dictionary with a few added changes.
+    Channels are saved under the key <parent>/<channel name>.
+    The dictionary also provides a list of the parents present in the registry
+    as well as the names. It is also respondisble for importing the channels
+    from a file and finally exporting them to the HDF5 file.
+
+    Attributes
+    ----------
+    parents : list
+        A list of the parent groups of all of the channels
+    file_start_time : numpy.datetime64
+        The start time recorded in the TDMS file's properties
+    file_end_time :  numpy.datetime64
+        The end time recorded in the TDMS file's properties
+    devices : list
+        A list of strings, each string is the name of a measurement device from
+        which data in the channel registry was recorded.
+    scratch_dir : str
+        The directory for the scratch files of memory mapped channels. None
+        means the system's temporary directory.
+    raw_dtype : numpy.dtype
+        The dtype floating point channels read from a file are stored in.
+        None keeps the dtype of the file.
+    derived_dtype : numpy.dtype
+        The dtype floating point derived channels are stored in. None keeps
+        the dtype of the calculation.
+    missing_inputs : OrderedDict
+        The keys of the missing input channels, keyed by the derived channel
+        that could not be added because of them.
+    mods : list
+        A list of strings, each string describing a modification or processing
+        step carried out on data in the channel registry.
+    history : list
+        The ProcessingStep of each processing method called on the registry,
+        like add_RSample or removeMagetfieldZeros, that can be undone.
+    memory_budget : MemoryBudget
+        The limit on the channel data held in memory, kept when another file
+        is loaded. None does not limit it.
+
+    Methods
+    -------
+    addChannel(newChan : Channel)
+        Add a new, unique channel to the registry
+    getParents()
+        Return the parents of the channels.
+    getDevices(parent : str)
+        Return the devices with channels under a parent.
+    getChannels(parent : str, device : str)
+        Return the names of a device's channels.
+    getKey(parent : str, device : str, name : str)
+        Return the key of a channel.
+    getTimeTrack(parent : str, device : str)
+        Return the key of a device's time track.
+    setMemoryBudget(budget : MemoryBudget or int)
+        Limit the channel data held in memory.
+    getMemoryUsage()
+        Return the memory used by the channel data and the counters (dict).
+    loadFromFile(filename : str, lazy : bool, memmap : bool, scratch_dir : str,
+                 metadata_cache : MetadataCache, include : list,
+                 exclude : list, start_time : numpy.datetime64,
+                 end_time : numpy.datetime64, preview : int,
+                 preview_method : str, workers : int, processes : bool,
+                 raw_dtype : numpy.dtype, derived_dtype : numpy.dtype,
+                 step_encoding : bool)
+        Load data from a file with the absolute path filename
+    updateFromFile()
+        Append the data written to the loaded TDMS file since it was loaded.
+    addPreviews(points : int, method : str)
+        Read decimated previews of the channels that have not been read yet.
+    detachedLoaders(keys : list)
+        Return the detached loaders the data of channels is read with.
+    addDerived(key : str)
+        Add a derived channel described in DERIVATIONS.
+    addExpression(key : str, expression : str, variables : dict)
+        Add a channel calculated from an expression of other channels.
+    add_V():
+        Add the processed channel 'V' derived from 'VSample'
+    add_dV():
+        Add the processed channel 'dV' derived from 'dVSample'
+    add_I():
+        Add the processed channel 'I' derived from 'ISample'
+    add_dI():
+        Add the processed channel 'dI' derived from 'dISample'
+    add_R():
+        Add the processed channel 'R' derived from 'V' and 'I'
+    add_RSample():
+        Add the processed channel 'RSample' derived from 'VSample' and
+        'ISample'
+    add_dRSample():
+        Add the processed channel 'dRSample' derived from 'dVSample' and
+        'dISample'
+    add_dISample():
+        Add the processed channel 'dRSample' derived from 'dVSample' and
+        'dISample'
+    add_dVSample():
+        Add the processed channel 'dRSample' derived from 'dVSample' and
+        'dVSample'
+    add_dR():
+        Add the processed channel 'dR' derived from 'dV' and 'dI'
+    add_TSample_AD():
+        Convert Lakeshore output voltage to Temperature
+    addTransportChannels():
+        Add all of the transport channels
+    addTimeTracks():
+        Add the time tracks for each device.
+    addInterpolatedB():
+        Add the interpolated BField data to ADWin device.
+    removeMagetfieldZeros():
+        Remove the zero spikes in the magnetfield signal from the IPS
+    removeADWinTempOffset():
+        Remove the small offset in ADWin's recorded temperature.
+    undo()
+        Undo the last processing step.
+    redo()
+        Redo the last undone processing step.
+    replayHistory(steps : list)
+        Apply the processing steps of another registry to this one.
+    window(start_time, end_time, first : int, stop : int)
+        Return a registry of the channels restricted to a window.
+    """
+
+    def __init__(self):
+        super(ChannelRegistry, self).__init__()
+
+        self.parents = []
+        self.file_start_time = None
+        self.file_end_time = None
+        self.devices = []
+        self.scratch_dir = None
+        self.raw_dtype = None
+        self.derived_dtype = None
+        self.missing_inputs = OrderedDict()
+        self.mods = []
+        self.history = []
+        self.memory_budget = None
+
+        # The keys by parent, device and channel, and the time track
+        # channels by (parent, device), kept up to date with the keys
+        self._index = OrderedDict()
+        self._timeTrackIndex = {}
+
+        # The undone processing steps and the step being recorded
+        self._redo = []
+        self._step = None
+
+        # What updateFromFile needs to follow a TDMS file that is still
+        # being written
+        self._tdmsReader = None
+        self._tdmsChannels = OrderedDict()
+        self._derivedChannels = OrderedDict()
+        self._tempOffset = None
+
+    def __setitem__(self, key, channel):
+        oldChan = self.get(key)
+        if oldChan is None:
+            (parent, device, name) = split_key(key)
+            if not device:
+                # Keys like 'proc/R' are indexed under the channel's device
+                device = channel.getDevice()
+            self._index.setdefault(parent, OrderedDict())\
+                .setdefault(device, OrderedDict())[name] = key
+            if is_time_track(name):
+                self._timeTrackIndex.setdefault((parent, device),
+                                                OrderedDict())[name] = key
+        super(ChannelRegistry, self).__setitem__(key, channel)
+        if self.memory_budget is not None and oldChan is not channel:
+            if oldChan is not None:
+                self.memory_budget.remove(oldChan)
+            self.memory_budget.add(channel)
+        if oldChan is not None and oldChan is not channel:
+            self._replaceInput(oldChan, channel)
+
+    def __delitem__(self, key):
+        if self.memory_budget is not None:
+            self.memory_budget.remove(self[key])
+        super(ChannelRegistry, self).__delitem__(key)
+        (parent, device, name) = split_key(key)
+
+        devices = self._index[parent]
+        if not device:
+            device = next(d for (d, names) in devices.items()
+                          if names.get(name) == key)
+        del devices[device][name]
+        if not devices[device]:
+            del devices[device]
+        if not devices:
+            del self._index[parent]
+
+        timeTracks = self._timeTrackIndex.get((parent, device))
+        if timeTracks is not None and name in timeTracks:
+            del timeTracks[name]
+            if not timeTracks:
+                del self._timeTrackIndex[(parent, device)]
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super(ChannelRegistry, self).pop(key, *default)
+        channel = self[key]
+        del self[key]
+        return channel
+
+    def popitem(self):
+        if not self:
+            raise KeyError('popitem(): the channel registry is empty')
+        key = list(self)[-1]
+        return (key, self.pop(key))
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for (key, channel) in dict(*args, **kwargs).items():
+            self[key] = channel
+
+    def clear(self):
+        if self.memory_budget is not None:
+            for channel in self.values():
+                self.memory_budget.remove(channel)
+        super(ChannelRegistry, self).clear()
+        self._index = OrderedDict()
+        self._timeTrackIndex = {}
+
+    def getParents(self):
+        """Return the parents of the channels, e.g. ['proc01']."""
+        return list(self._index)
+
+    def getDevices(self, parent):
+        """Return the devices with channels under a parent.
+
+        Parameters
+        ----------
+        parent : str
+            The parent, e.g. 'proc01'.
+
+        Returns
+        -------
+        list
+            The device names in the order their first channel was added.
+
+        """
+        return list(self._index.get(parent, ()))
+
+    def getChannels(self, parent, device):
+        """Return the names of a device's channels.
+
+        Parameters
+        ----------
+        parent : str
+            The parent, e.g. 'proc01'.
+        device : str
+            The device, e.g. 'ADWin'.
+
+        Returns
+        -------
+        list
+            The channel names, e.g. ['ISample', 'Time_m'], in the order they
+            were added. See getKey for their keys.
+
+        """
+        return list(self._index.get(parent, {}).get(device, ()))
+
+    def getKey(self, parent, device, name):
+        """Return the key of a channel.
+
+        The key is 'parent/device/name', except for the channels added
+        without their device in the key, like 'proc/R'. These are listed
+        under the device given by their Device attribute.
+
+        Parameters
+        ----------
+        parent : str
+            The parent, e.g. 'proc01'.
+        device : str
+            The device, e.g. 'ADWin'.
+        name : str
+            The channel name, e.g. 'ISample'.
+
+        Returns
+        -------
+        str or None
+            The key, None if there is no such channel.
+
+        """
+        return self._index.get(parent, {}).get(device, {}).get(name)
+
+    def getTimeTrack(self, parent, device):
+        """Return the key of a device's time track.
+
+        Parameters
+        ----------
+        parent : str
+            The parent, e.g. 'proc01'.
+        device : str
+            The device, e.g. 'ADWin'.
+
+        Returns
+        -------
+        str or None
+            The key of the last added channel of the device whose name
+            starts with 'time' or 'Time', None if there is none.
+
+        """
+        timeTracks = self._timeTrackIndex.get((parent, device))
+        if not timeTracks:
+            return None
+        return next(reversed(timeTracks.values()))
+
+    def setMemoryBudget(self, budget):
+        """Limit the channel data held in memory.
+
+        The least recently accessed data beyond the budget is spilled to
+        scratch files and read back when it is accessed again, see
+        MemoryBudget.
+
+        Parameters
+        ----------
+        budget : MemoryBudget, int or None
+            The budget, which can be shared with other registries, or the
+            maximum number of bytes of a budget of this registry alone that
+            spills into scratch_dir. None removes the budget.
+
+        """
+        if self.memory_budget is not None:
+            for channel in self.values():
+                self.memory_budget.remove(channel)
+
+        if budget is not None and not isinstance(budget, MemoryBudget):
+            budget = MemoryBudget(budget, self.scratch_dir)
+        self.memory_budget = budget
+
+        if budget is not None:
+            for channel in self.values():
+                budget.add(channel)
+
+    def getMemoryUsage(self):
+        """Return the memory used by the channel data and the counters.
+
+        Returns
+        -------
+        dict
+            See MemoryBudget.getUsage, for a shared budget the usage of all
+            of its registries. Without a budget only the memory used by the
+            channels of the registry and no counters.
+
+        """
+        if self.memory_budget is not None:
+            return self.memory_budget.getUsage()
+
+        resident = [chan.getResidentBytes() for chan in self.values()]
+        return {'max_bytes': None, 'used_bytes': sum(resident),
+                'spilled_bytes': 0,
+                'channels': sum(1 for nbytes in resident if nbytes),
+                'spilled_channels': 0, 'hits': 0, 'misses': 0, 'spills': 0}
+
+    def undo(self):
+        """Undo the last processing step.
+
+        The channels the step added are removed, the channels it replaced
+        are restored and its changes to channels in place are reverted. Its
+        descriptions are removed from mods.
+
+        Returns
+        -------
+        ProcessingStep or None
+            The undone step, None if there is none.
+
+        """
+        if not self.history:
+            return None
+
+        step = self.history.pop()
+        step.undo(self)
+        self._redo.append(step)
+        return step
+
+    def redo(self):
+        """Redo the last undone processing step.
+
+        Returns
+        -------
+        ProcessingStep or None
+            The redone step, None if there is none. A new processing step
+            discards the undone steps.
+
+        """
+        if not self._redo:
+            return None
+
+        step = self._redo.pop()
+        step.redo(self)
+        self.history.append(step)
+        return step
+
+    def replayHistory(self, steps):
+        """Apply the processing steps of another registry to this one.
+
+        Steps that loading the file carried out already are skipped.
 
-    This is just a basic dictionary with a few added changes.
-    Channels are saved under the key <parent>/<channel name>.
-    The dictionary also provides a list of the parents present in the registry
-    as well as the names. It is also respondisble for importing the channels
-    from a file and finally exporting them to the HDF5 file.
+        Parameters
+        ----------
+        steps : list
+            The ProcessingStep objects to replay, e.g. the history of the
+            registry of another file of the same measurement.
 
-    Attributes
-    ----------
-    parents : list
-        A list of the parent groups of all of the channels
-    file_start_time : numpy.datetime64
-        The start time recorded in the TDMS file's properties
-    file_end_time :  numpy.datetime64
-        The end time recorded in the TDMS file's properties
-    devices : list
-        A list of strings, each string is the name of a measurement device from
-        which data in the channel registry was recorded.
-    mods : list
-        A list of strings, each string describing a modification or processing
-        step carried out on data in the channel registry.
+        """
+        for step in steps:
+            if not step.loading:
+                getattr(self, step.name)(*step.args, **step.kwargs)
+
+    def window(self, start_time=None, end_time=None, first=None,
+               stop=None):
+        """Return a registry of the channels restricted to a window.
+
+        The channels of the new registry are windows of this registry's
+        channels, see Channel.window, so their data shares memory with the
+        channels here. Derived channels whose data has not been calculated
+        yet are derived again from the windowed inputs, and the devices' time
+        tracks are recalculated from the windowed time bases. The window can
+        be plotted, extended with derived channels and exported like any
+        registry.
 
-    Methods
-    -------
-    addChannel(newChan : Channel)
-        Add a new, unique channel to the registry
-    loadFromFile(filename : str)
-        Load data from a file with the absolute path filename
-    add_V():
-        Add the processed channel 'V' derived from 'VSample'
-    add_dV():
-        Add the processed channel 'dV' derived from 'dVSample'
-    add_I():
-        Add the processed channel 'I' derived from 'ISample'
-    add_dI():
-        Add the processed channel 'dI' derived from 'dISample'
-    add_R():
-        Add the processed channel 'R' derived from 'V' and 'I'
-    add_RSample():
-        Add the processed channel 'RSample' derived from 'VSample' and
-        'ISample'
-    add_dRSample():
-        Add the processed channel 'dRSample' derived from 'dVSample' and
-        'dISample'
-    add_dISample():
-        Add the processed channel 'dRSample' derived from 'dVSample' and
-        'dISample'
-    add_dVSample():
-        Add the processed channel 'dRSample' derived from 'dVSample' and
-        'dVSample'
-    add_dR():
-        Add the processed channel 'dR' derived from 'dV' and 'dI'
-    add_TSample_AD():
-        Convert Lakeshore output voltage to Temperature
-    addTransportChannels():
-        Add all of the transport channels
-    addTimeTracks():
-        Add the time tracks for each device.
-    addInterpolatedB():
-        Add the interpolated BField data to ADWin device.
-    removeADWinTempOffset():
-        Remove the small offset in ADWin's recorded temperature.
-    """
+        Parameters
+        ----------
+        start_time, end_time : optional
+            Only keep the samples recorded in this time window, given as in
+            loadFromFile. The end is inclusive.
+        first : int, optional
+            The index of the first sample kept of every channel.
+        stop : int, optional
+            The index after the last sample kept of every channel.
 
-    def __init__(self):
-        super(ChannelRegistry, self).__init__()
+        Returns
+        -------
+        ChannelRegistry
+            The windowed channels. The registry can not follow the file.
 
-        self.parents = []
-        self.file_start_time = None
-        self.file_end_time = None
-        self.devices = []
-        self.mods = []
+        """
+        view = ChannelRegistry()
+        view.file_start_time = self.file_start_time
+        view.file_end_time = self.file_end_time
+        view.scratch_dir = self.scratch_dir
+        view.raw_dtype = self.raw_dtype
+        view.derived_dtype = self.derived_dtype
+        view.mods = list(self.mods)
+
+        windowStart = windowEnd = None
+        if start_time is not None:
+            windowStart = window_time(start_time, self.file_start_time)
+        if end_time is not None:
+            windowEnd = window_time(end_time, self.file_start_time)
+
+        keys = dict((id(chan), key) for (key, chan) in self.items())
+
+        for (key, chan) in self.items():
+            if key in view:
+                # A device time track added for a windowed channel
+                continue
+
+            derived = self._derivedChannels.get(key)
+            if (derived is not None and not chan.isLoaded() and
+                    all(keys.get(id(inp)) in view for inp in derived[1])):
+                (parent, name) = key.split('/', 1)
+                view._addDerivedChannel(name, chan.getDevice(), parent,
+                                        derived[0],
+                                        [view[keys[id(inp)]]
+                                         for inp in derived[1]])
+                continue
+
+            base = chan.getTimeBase()
+            (chanFirst, chanStop) = (first or 0, stop)
+            if windowStart is not None:
+                chanFirst = max(chanFirst, base.searchsorted(windowStart))
+            if windowEnd is not None:
+                end = base.searchsorted(windowEnd, 'right')
+                chanStop = end if chanStop is None else min(chanStop, end)
+            view.addChannel(chan.window(chanFirst, chanStop))
+
+        return view
 
     def addChannel(self, newChan):
         """Add a new, unique channel to the registry
@@ -430,51 +2285,125 @@ class ChannelRegistry(dict):
         if parent not in self.parents:
             self.parents.append(parent)
 
-        device = newChan.getName().split('/')[0]
+        (_, device, name) = split_key(channelKey)
+        if not device:
+            # Derived channels like 'proc/R' name their device explicitly
+            device = newChan.getDevice()
 
         if device not in self.devices:
             self.devices.append(device)
 
-        time_name = '{r}/{d}/{t}'.format(r=parent, d=device, t='Time_m')
-
-        for key in self.keys():
-            if '{r}/{d}/time'.format(r=parent, d=device) in key:
-                time_name = key
-            elif '{r}/{d}/Time'.format(r=parent, d=device) in key:
-                time_name = key
-
-        if time_name not in self.keys():
-            self.addTimeTracks(device, newChan.getElapsedTimeTrack())
+        # A time track is its own device's time track
+        if is_time_track(name):
+            return
 
-    def loadFromFile(self, filename):
+        # The time tracks are added under 'proc01', see addTimeTracks
+        if (self.getTimeTrack(parent, device) is None and
+                self.getTimeTrack('proc01', device) is None):
+            self.addTimeTracks(device, newChan.getTimeBase())
+
+    def loadFromFile(self, filename, lazy=False, memmap=False,
+                     scratch_dir=None, metadata_cache=None, include=None,
+                     exclude=None, start_time=None, end_time=None,
+                     preview=None, preview_method='stride', workers=None,
+                     processes=False, raw_dtype=None, derived_dtype=None,
+                     step_encoding=False):
         """Load the data from a file
 
         Parameters
         ----------
         filename : str
             The absolute path of the file to be loaded
+        lazy : bool, optional
+            For TDMS files only read the meta data up front. The data of each
+            channel is read from the file the first time it is accessed.
+        memmap : bool, optional
+            For TDMS files make each channel's data a read-only memory map
+            onto the TDMS file, or onto a scratch file if the channel's
+            values are not stored contiguously.
+        scratch_dir : str, optional
+            The directory for scratch files of memory mapped channels.
+        metadata_cache : MetadataCache, optional
+            A cache for the meta data of TDMS files, so that reopening an
+            unchanged file skips parsing its segments.
+        include : list, optional
+            Only load the channels matching one of these patterns, e.g.
+            ['ADWin/*', 'IPS/Magnetfield']. See channel_selected.
+        exclude : list, optional
+            Do not load the channels matching any of these patterns. The data
+            of channels that are not loaded is never read from the file.
+        start_time, end_time : optional
+            For TDMS files only load the waveform samples recorded in this
+            time window. Absolute times are given as datetimes or ISO 8601
+            strings, times relative to the file's start time as timedeltas or
+            seconds. See window_time. Samples outside the window are never
+            read from the file.
+        preview : int, optional
+            For TDMS files read only about this many values of each channel
+            as its preview, see Channel.getPreview. The full data is read
+            lazily when it is first accessed.
+        preview_method : {'stride', 'minmax'}, optional
+            How the preview is decimated, see TDMSReader.previewChannel.
+        workers : int, optional
+            For TDMS files read the channels and build their time tracks on a
+            pool of this many workers. The channels are added to the registry
+            in the same order as without workers.
+        processes : bool, optional
+            Use a pool of processes instead of threads. Lazily loaded and
+            memory mapped channels are always built on threads.
+        raw_dtype : numpy.dtype, optional
+            Store the floating point channels read from the file in this
+            dtype, e.g. numpy.float32 to halve their memory. Memory mapped
+            channels keep the dtype of the file.
+        derived_dtype : numpy.dtype, optional
+            Store the floating point channels derived from them in this
+            dtype. Calculations that need the precision, like the RuO
+            calibration, are still done in double precision.
+        step_encoding : bool, optional
+            Keep the TDMS channels that are read and change rarely, like the
+            magnet field during a hold, step encoded until their data is
+            accessed. See Channel.setSteps. Channels whose first values
+            change often are given up early, see step_encode.
 
         """
+        budget = self.memory_budget
         self.clear()
         self.__init__()
+        self.memory_budget = budget
+        self.scratch_dir = scratch_dir
+        self.raw_dtype = raw_dtype
+        self.derived_dtype = derived_dtype
 
         if os.path.exists(filename):
             extention = filename.split('.')[-1]
             if extention in ('tdms'):
-                self._loadFromTDMS(filename)
+                self._loadFromTDMS(filename, lazy or preview is not None,
+                                   memmap, metadata_cache, include, exclude,
+                                   start_time, end_time, workers, processes,
+                                   step_encoding)
+                if preview is not None:
+                    self.addPreviews(preview, preview_method)
             elif extention in ('csv', 'dat'):
-                self._loadFromCSV(filename)
+                self._loadFromCSV(filename, include, exclude)
         else:
             print('The file {fn} does not exist!'.format(fn=filename))
             return
 
-    def _loadFromCSV(self, filename):
+        # Loading another file repeats these steps, replaying them would not
+        for step in self.history:
+            step.loading = True
+
+    def _loadFromCSV(self, filename, include=None, exclude=None):
         """Load the data from a CSV file into the channel registry
 
         Parameters
         ----------
         filename : str
             The absolute path of the file to be loaded
+        include : list, optional
+            Only load the channels matching one of these patterns.
+        exclude : list, optional
+            Do not load the channels matching any of these patterns.
 
 
         """
@@ -494,10 +2423,14 @@ class ChannelRegistry(dict):
         device = 'all'
 
         for i, chan in enumerate(col_names):
+            if not channel_selected('/'.join([device, chan]), include,
+                                    exclude):
+                continue
+
             chan_df = pd.read_csv(filename, header=None, comment='#',
                                   names=[chan], usecols=[i], skiprows=sr)
 
-            data = chan_df[chan].values
+            data = storage_array(chan_df[chan].values, self.raw_dtype)
 
             chan_name = '/'.join([device, chan])
 
@@ -581,68 +2514,93 @@ class ChannelRegistry(dict):
 
         return (datetimestamp, headerline)
 
-    def _loadFromTDMS(self, filename):
+    def _loadFromTDMS(self, filename, lazy=False, memmap=False,
+                      metadata_cache=None, include=None, exclude=None,
+                      start_time=None, end_time=None, workers=None,
+                      processes=False, step_encoding=False):
         """Load the data from a TDMS file into the channel registry
 
         Parameters
         ----------
         filename : str
             The absolute path of the file to be loaded
+        lazy : bool, optional
+            Only read the file's meta data now and read each channel's data
+            the first time it is used.
+        memmap : bool, optional
+            Memory map each channel's data instead of reading it into memory.
+        metadata_cache : MetadataCache, optional
+            A cache for the parsed meta data of the file.
+        include : list, optional
+            Only load the channels matching one of these patterns.
+        exclude : list, optional
+            Do not load the channels matching any of these patterns.
+        start_time, end_time : optional
+            Only load the waveform samples recorded in this time window.
+        workers : int, optional
+            The number of workers reading the channels in parallel.
+        processes : bool, optional
+            Whether the workers are processes instead of threads.
+        step_encoding : bool, optional
+            Step encode the channels that change rarely.
 
         """
 
-        tdmsFileObject = TdmsFile(filename)
+        try:
+            tdmsReader = TDMSReader(filename, metadata_cache)
+        except UnsupportedTDMSError:
+            # npTDMS reads what the TDMSReader can not index, e.g. DAQmx data
+            tdmsReader = NpTDMSReader(filename)
+        self._tdmsReader = tdmsReader
+        fileProperties = tdmsReader.properties.get('/', {})
 
         try:
-            self.file_start_time = np.datetime64(tdmsFileObject.object()
-                                                 .properties['StartTime'])
-            self.file_end_time = np.datetime64(tdmsFileObject.object()
-                                               .properties['EndTime'])
+            self.file_start_time = np.datetime64(fileProperties['StartTime'])
+            self.file_end_time = np.datetime64(fileProperties['EndTime'])
 
         except KeyError:
             print('File {f} does not have StartTime or EndTime key.'
                   .format(f=filename))
 
-        # Generate channels one device at a time
-        for device in tdmsFileObject.groups():
+        windowStart = windowEnd = None
+        if start_time is not None:
+            windowStart = window_time(start_time, self.file_start_time)
+        if end_time is not None:
+            windowEnd = window_time(end_time, self.file_start_time)
+
+        specs = []
+
+        # Collect the channels one device at a time
+        for group in tdmsReader.groups():
 
             # The ADWin device properties will later need to be mapped to
             # specific channels
-            deviceProperties = tdmsFileObject.object(device).properties
+            deviceProperties = tdmsReader.properties.get(group, {})
 
             # Get a list of the device's channels
-            deviceChannels = tdmsFileObject.group_channels(device)
-            device = replace_name(device, DEVICE_NAMES)
+            deviceChannels = tdmsReader.groupChannels(group)
+            device = replace_name(group.replace("'", "").lstrip("/"),
+                                  DEVICE_NAMES)
 
             # Setup a channel object for each channel.
             # Sort the ADWin device properites to the proper channels if
             # necessary.
-            for chan in deviceChannels:
-                channelName = chan.path.replace("'", "").lstrip("/")
-                # Some channels are empty. This becomes apparent when trying
-                # load the properties.
-                # try:
+            for chanPath in deviceChannels:
+                channelName = chanPath.replace("'", "").lstrip("/")
+                channelProperties = tdmsReader.properties.get(chanPath, {})
                 channelName = replace_name(channelName, DEVICE_NAMES)
 
-                if 'wf_start_time' in chan.properties:
-                    newChannel = Channel(channelName, device=device,
-                                         meas_array=chan.data)
-                    newChannel.setParent('proc01')
+                if not channel_selected(channelName, include, exclude):
+                    continue
 
+                if 'wf_start_time' in channelProperties:
                     # startTime = np.datetime64(chan.property('wf_start_time')
                     #                           .astimezone(LOCAL_TZ))
 
-                    newChannel.setStartTime(self.file_start_time)
-
                     # Sometimes the wf_increment is saved in seconds. Convert
                     # to milliseconds for easier use with numpy timedeltas.
 
-                    timeStep = chan.property("wf_increment")
-                    # if channelName == 'IPS/Magnetfield':
-                    #     #print(timeStep)
-                    #     new_dt = ((self.file_end_time - self.file_start_time)
-                    #       / len(chan.data)) / np.timedelta64(1, 's')
-                    #     timeStep = new_dt
+                    timeStep = channelProperties["wf_increment"]
 
                     if timeStep < 1:
                         timeStep = timeStep * 1000
@@ -651,8 +2609,18 @@ class ChannelRegistry(dict):
                         # print('Old ADWin timeStep is {}'.format(timeStep))
                         timeStep = 100
 
-                    newChannel.setTimeStep(np.timedelta64(int(timeStep), 'ms'))
+                    timeStep = np.timedelta64(int(timeStep), 'ms')
+
+                    # Only the samples inside the time window are read
+                    (first, stop) = sample_window(self.file_start_time,
+                                                  timeStep, windowStart,
+                                                  windowEnd)
+
+                    startTime = self.file_start_time
+                    if first:
+                        startTime = startTime + first * timeStep
 
+                    attributes = {}
                     if device == "ADWin":
                         try:
                             for attributeName in ADWIN_DICT[channelName
@@ -661,19 +2629,43 @@ class ChannelRegistry(dict):
                                 # error is thrown here!  This is where to catch
                                 # the missing data and allow the user to enter
                                 # it.
-                                newChannel.attributes[attributeName] = \
+                                attributes[attributeName] = \
                                     deviceProperties[attributeName]
                         except KeyError:
                             # print('1\tKey Error: {0} on channel {1}'
                             #       .format(err, channelName))
                             pass
 
-                    self.addChannel(newChannel)
+                    specs.append({'name': channelName, 'device': device,
+                                  'path': chanPath, 'start_time': startTime,
+                                  'time_step': timeStep, 'first': first,
+                                  'stop': stop, 'attributes': attributes})
+
+        # Read the channels and build their time tracks on the workers, but
+        # add them in the order of the file
+        build = partial(build_tdms_channel, tdmsReader, lazy=lazy,
+                        memmap=memmap, scratch_dir=self.scratch_dir,
+                        dtype=self.raw_dtype, step_encoding=step_encoding)
+
+        if workers is not None and workers > 1 and len(specs) > 1:
+            # Lazy and memory mapped channels have to stay in this process
+            if processes and not (lazy or memmap):
+                executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers)
+            with executor:
+                channels = list(executor.map(
+                    build, specs,
+                    chunksize=max(1, len(specs) // (4 * workers))))
+        else:
+            channels = [build(spec) for spec in specs]
 
-                # except TypeError as err:
-                #     print('3\tType Error: {0} on channel {1}'
-                #          .format(err, channelName))
-                #    pass
+        for (spec, newChannel) in zip(specs, channels):
+            self.addChannel(newChannel)
+            # Keyed like addChannel, by the name after the renaming
+            self._tdmsChannels["{0}/{1}".format(
+                newChannel.getParent(), newChannel.getName())] = \
+                (spec['path'], spec['first'], spec['stop'])
 
         # self.addTransportChannels()
         self.add_RSample()
@@ -686,347 +2678,674 @@ class ChannelRegistry(dict):
             # print(err)
             pass
 
-    def add_V(self):
-        """Add the processed channel 'V' derived from 'VSample'.
+    def _addDerivedChannel(self, name, device, parent, calculation, inputs,
+                           attributes=()):
+        """Add a channel whose data is calculated from other channels.
+
+        The new channel takes its start time and time interval from the first
+        of its input channels. The calculation is deferred until the new
+        channel's data is accessed or streamed chunk by chunk, and the result
+        is kept until an input's data or attributes are replaced. If any of
+        the inputs is memory mapped, the result is calculated chunk by chunk
+        into a memory mapped scratch file. Floating point results are stored
+        in derived_dtype.
+
+        Parameters
+        ----------
+        name : str
+            The name of the new channel.
+        device : str
+            The name of the device the new channel belongs to.
+        parent : str
+            The parent group of the new channel.
+        calculation : callable
+            Returns the new channel's data given the data arrays of inputs
+            and the attributes as keyword arguments.
+        inputs : list
+            The Channel objects the new channel is derived from.
+        attributes : list, optional
+            The names of the attributes of the first input passed to the
+            calculation, or (input index, name) pairs for the attributes of
+            other inputs. They are read when the calculation is carried out.
 
+        Returns
+        -------
+        Channel
+            The channel that was added to the registry.
+
+        """
+        source = inputs[0]
+        # Replacing an input channel in the registry replaces it here
+        inputs = list(inputs)
+        dtype = self.derived_dtype
+        compute = calculation
+
+        attributes = [attribute if isinstance(attribute, tuple)
+                      else (0, attribute) for attribute in attributes]
+
+        def calculation(*arrays):
+            result = compute(*arrays, **dict(
+                (attributeName, inputs[index].attributes[attributeName])
+                for (index, attributeName) in attributes))
+            return result if dtype is None else storage_array(result, dtype)
+
+        def calculate():
+            arrays = [chan.data for chan in inputs]
+            if any(isinstance(array, np.memmap) for array in arrays):
+                return chunked_calculation(calculation, arrays,
+                                           self.scratch_dir)
+            return calculation(*arrays)
+
+        def iterCalculate(chunk_length):
+            for parts in zip(*[chan.iterData(chunk_length)
+                               for chan in inputs]):
+                yield calculation(*parts)
+
+        newChan = Channel(name, device=device)
+        newChan.setLoader(calculate, source.attributes['Length'],
+                          iterCalculate)
+
+        newChan.setParent(parent)
+        newChan.setStartTime(source.getStartTime())
+        newChan.setTimeStep(source.getTimeStep())
+        self.addChannel(newChan)
+
+        key = "{0}/{1}".format(parent, name)
+        self._derivedChannels[key] = (calculation, inputs, calculate,
+                                      iterCalculate)
+        for chan in set(inputs):
+            self._addListener(chan, partial(self._inputChanged, key, newChan))
+
+        return newChan
+
+    def _addListener(self, chan, listener):
+        """Add a listener to a channel, removed again if the step is undone.
         """
-        if 'proc01/VSample' in self.keys() and 'proc01/V' not in self.keys():
-            chanVSample = self['proc01/VSample']
+        chan.addListener(listener)
+        if self._step is not None:
+            self._step.record(ListenerDelta(chan, listener))
+
+    def _inputChanged(self, key, chan):
+        """Calculate the derived channel key again when it is next read."""
+        derived = self._derivedChannels.get(key)
+        if derived is None or self.get(key) is not chan:
+            # The channel was removed, e.g. by undoing the step adding it
+            return
+
+        (_, inputs, calculate, iterCalculate) = derived
+        length = min(inp.attributes['Length'] for inp in inputs)
+        if chan.isLoaded():
+            chan.setLoader(calculate, length, iterCalculate)
         else:
+            # Keep a loader that corrects the calculation, like the one of
+            # removeADWinTempOffset
+            chan.setLoader(chan.getLoader(), length, chan.getChunks(),
+                           chan.isDetached())
+
+    def _replaceInput(self, oldChan, newChan):
+        """Derive the channels derived from oldChan from newChan instead."""
+        for (key, (_, inputs, _, _)) in list(self._derivedChannels.items()):
+            if not any(inp is oldChan for inp in inputs):
+                continue
+            inputs[:] = [newChan if inp is oldChan else inp
+                         for inp in inputs]
+            # The replaced channel no longer recalculates the derived one
+            for listener in oldChan.getListeners():
+                if (isinstance(listener, partial) and
+                        listener.func == self._inputChanged and
+                        listener.args[0] == key):
+                    oldChan.removeListener(listener)
+            newChan.addListener(partial(self._inputChanged, key, self[key]))
+            self._inputChanged(key, self[key])
+
+    def addDerived(self, key):
+        """Add a derived channel described in DERIVATIONS.
+
+        The channel is only calculated when its data is first read.
+
+        Parameters
+        ----------
+        key : str
+            The key of the derived channel, e.g. 'proc/R'.
+
+        Returns
+        -------
+        list
+            The keys of the missing input channels and attributes, the
+            latter as '<key>:<attribute name>'.
+
+        """
+        derivation = DERIVATIONS[key]
+        inputs = self._derivedInputs(key, *derivation.alternatives)
+        if (inputs is None or
+                self._missingAttributes(key, "{0}/{1}".format(
+                    inputs[0].getParent(), inputs[0].getName()),
+                    derivation.attributes)):
+            return self.missing_inputs.get(key, [])
+
+        (parent, name) = key.split('/', 1)
+        self._addDerivedChannel(name, derivation.device, parent,
+                                derivation.calculation, inputs,
+                                derivation.attributes)
+        if derivation.description is not None:
+            self.mods.append(derivation.description)
+        return []
+
+    def updateFromFile(self):
+        """Append the data written to the loaded TDMS file since it was loaded.
+
+        Only the segments LabVIEW appended to the file since the last update
+        are read. Their values are appended to the channels read from the
+        file, to the channels derived from them and to the devices' time
+        tracks. Channels whose data has not been read yet only have their
+        length updated.
+
+        Returns
+        -------
+        list
+            The keys of the channels that have grown.
+
+        """
+        if self._tdmsReader is None:
+            return []
+
+        grown = self._tdmsReader.update()
+        updated = []
+
+        for (key, (chanPath, first, stop)) in self._tdmsChannels.items():
+            if chanPath not in grown:
+                continue
+            chan = self[key]
+            # Samples after the end of the loaded time window stay unread
+            newLength = grown[chanPath][1]
+            if stop is not None:
+                newLength = min(newLength, stop)
+            newLength = max(newLength - first, 0)
+            if newLength == chan.attributes['Length']:
+                continue
+
+            offset = 0
+            if self._tempOffset is not None and self._tempOffset[0] == key:
+                offset = self._tempOffset[1]
+
+            steps = chan.getSteps()
+            if steps is not None:
+                steps.append(storage_array(self._tdmsReader.readChannel(
+                    chanPath, first + chan.attributes['Length'],
+                    first + newLength) - offset, self.raw_dtype))
+                chan.setSteps(steps)
+            elif not chan.isLoaded():
+                chan.setLoader(chan.getLoader(), newLength, chan.getChunks(),
+                               chan.isDetached())
+            elif chan.isMemmapped():
+                # Map the grown channel again instead of reading it
+                data = self._tdmsReader.mapChannel(chanPath, self.scratch_dir,
+                                                   first, stop)
+                if offset:
+                    data = chunked_calculation(lambda d: d - offset, [data],
+                                               self.scratch_dir)
+                chan.data = data
+                chan.attributes['Length'] = newLength
+                chan._recalculateTimeArray()
+            else:
+                chan.appendData(storage_array(self._tdmsReader.readChannel(
+                    chanPath, first + chan.attributes['Length'],
+                    first + newLength) - offset, self.raw_dtype))
+            updated.append(key)
+
+        for (key, (calculation, inputs, calculate, iterCalculate)) in \
+                self._derivedChannels.items():
+            chan = self[key]
+            newLength = min(inp.attributes['Length'] for inp in inputs)
+            length = chan.attributes['Length']
+            if newLength == length:
+                continue
+
+            if not chan.isLoaded():
+                chan.setLoader(chan.getLoader(), newLength, chan.getChunks(),
+                               chan.isDetached())
+            elif (chan.isMemmapped() or
+                  not all(inp.isLoaded() for inp in inputs)):
+                # Leave it to the first access to calculate the whole channel
+                chan.setLoader(calculate, newLength, iterCalculate)
+            else:
+                chan.appendData(calculation(*[inp.readData(length, newLength)
+                                              for inp in inputs]))
+            updated.append(key)
+
+        for device in self.devices:
+            timeKey = 'proc01/{d}/Time_m'.format(d=device)
+            sources = [self[key] for key in updated
+                       if key.startswith('proc01/{d}/'.format(d=device))]
+            if timeKey not in self.keys() or not sources:
+                continue
+            timeChan = self[timeKey]
+            source = sources[0]
+            length = timeChan.attributes['Length']
+            newLength = source.attributes['Length']
+            base = source.getTimeBase()
+            if timeChan.isLoaded():
+                timeChan.appendData(base.minutes(length, newLength,
+                                                 self.file_start_time))
+            else:
+                timeChan.setLoader(
+                    partial(base.minutes, reference=self.file_start_time),
+                    newLength,
+                    partial(base.iterMinutes, reference=self.file_start_time))
+            updated.append(timeKey)
+
+        return updated
+
+    def addPreviews(self, points=PREVIEW_POINTS, method='stride'):
+        """Read decimated previews of the channels that have not been read.
+
+        The previews of the channels read from the TDMS file are read from
+        it. The previews of derived channels are calculated from the previews
+        of their inputs where these share the same indices, and those of the
+        devices' time tracks from the sample indices.
+
+        Parameters
+        ----------
+        points : int, optional
+            The approximate number of values in each preview.
+        method : {'stride', 'minmax'}, optional
+            How the data is decimated, see TDMSReader.previewChannel.
+
+        """
+        if self._tdmsReader is None:
             return
 
-        # Calculate the data
-        vMeasArray = (chanVSample.data / chanVSample.attributes['VAmp']) * 1E3
-        # Create the channel
-        chanV = Channel('V', device='ADWin', meas_array=vMeasArray)
-        # Set the parent
-        chanV.setParent('proc')
-        # Set the start time and time interval based on VSample's values
-        chanV.setStartTime(chanVSample.getStartTime())
-        chanV.setTimeStep(chanVSample.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chanV)
-        self.mods.append('Adding amplifier-adjusted absolute sample voltage')
+        for (key, (chanPath, first, stop)) in self._tdmsChannels.items():
+            chan = self[key]
+            if chan.isLoaded():
+                continue
+            # Only the loaded time window is previewed
+            (indices, values) = self._tdmsReader.previewChannel(
+                chanPath, points, method, first,
+                first + chan.attributes['Length'])
+            chan.setPreview(indices, values)
+
+            timeKey = 'proc01/{d}/Time_m'.format(d=chan.getDevice())
+            if timeKey in self.keys() and self[timeKey].getPreview() is None:
+                self[timeKey].setPreview(
+                    indices, chan.getTimeBase().minutesAt(
+                        indices, self.file_start_time))
+
+        for (key, (calculation, inputs, _, _)) in \
+                self._derivedChannels.items():
+            previews = [inp.getPreview() for inp in inputs]
+            if (self[key].isLoaded() or any(p is None for p in previews) or
+                    not all(np.array_equal(p[0], previews[0][0])
+                            for p in previews)):
+                continue
+            self[key].setPreview(previews[0][0],
+                                 calculation(*[p[1] for p in previews]))
+
+    def detachedLoaders(self, keys):
+        """Return the detached loaders the data of channels is read with.
+
+        These are the loaders of the channels themselves and, for derived
+        channels, those of the channels they are derived from, see
+        Channel.isDetached. The loaders can run on another thread, while the
+        channels are left alone. The derived channels are calculated from the
+        read data when they are next accessed.
+
+        Parameters
+        ----------
+        keys : list
+            The keys of the channels.
+
+        Returns
+        -------
+        list
+            The (Channel, loader) of each channel to read.
+
+        """
+        inputs = dict((id(self[key]), derived[1])
+                      for (key, derived) in self._derivedChannels.items()
+                      if key in self.keys())
+        loaders = []
+        pending = [self[key] for key in keys]
+        seen = set()
+        while pending:
+            chan = pending.pop(0)
+            if id(chan) in seen or chan.isLoaded():
+                continue
+            seen.add(id(chan))
+            if chan.isDetached():
+                loaders.append((chan, chan.getLoader()))
+            else:
+                pending.extend(inputs.get(id(chan), []))
+        return loaders
+
+    def _derivedInputs(self, name, *alternatives):
+        """Return the input channels of a derived channel.
+
+        Parameters
+        ----------
+        name : str
+            The key of the derived channel.
+        alternatives : list
+            Lists of the keys of the input channels, in order of preference.
+
+        Returns
+        -------
+        list or None
+            The input channels of the first alternative that is complete.
+            None if the derived channel exists already or no alternative is
+            complete. In the latter case the keys missing from the first
+            alternative are recorded in missing_inputs.
+
+        """
+        self.missing_inputs.pop(name, None)
+
+        if name in self.keys():
+            return None
+
+        for keys in alternatives:
+            if all(key in self.keys() for key in keys):
+                return [self[key] for key in keys]
+
+        self.missing_inputs[name] = [key for key in alternatives[0]
+                                     if key not in self.keys()]
+        return None
+
+    def _missingAttributes(self, name, key, attributeNames):
+        """Record the attributes a derived channel needs but key lacks.
+
+        Missing attributes are recorded in missing_inputs as
+        '<key>:<attribute name>'.
+
+        Returns
+        -------
+        bool
+            Whether any of the attributes are missing.
+
+        """
+        missing = ['{0}:{1}'.format(key, attributeName)
+                   for attributeName in attributeNames
+                   if attributeName not in self[key].attributes]
+        if missing:
+            self.missing_inputs[name] = missing
+        return bool(missing)
+
+    @processing_step
+    def addExpression(self, key, expression, variables=None):
+        """Add a channel calculated from an expression of other channels.
+
+        The expression is evaluated by numexpr, on multiple threads and
+        without the temporary arrays of the equivalent numpy expression. The
+        names in the expression are channels of the new channel's device,
+        e.g. dVSample for the key 'proc01/ADWin/R', or attributes of those
+        channels, e.g. LVSens. Like any derived channel it is calculated when
+        it is first read, chunk by chunk if it is streamed.
+
+        Parameters
+        ----------
+        key : str
+            The key of the new channel, e.g. 'proc01/ADWin/R'.
+        expression : str
+            The expression, e.g. 'dVSample / dISample * LVSens / 10'.
+        variables : dict, optional
+            The keys of channels of other devices, by the name they have in
+            the expression.
+
+        Returns
+        -------
+        list
+            The names in the expression that are neither a channel nor an
+            attribute of one of the channels.
+
+        Raises
+        ------
+        ValueError
+            If the expression is invalid, uses no channel at all or uses an
+            attribute that is not a number, e.g. Device.
+
+        """
+        variables = variables or {}
+        (parent, device, name) = split_key(key)
+        names = expression_names(expression)
+
+        channelNames = []
+        inputs = []
+        for variable in names:
+            inputKey = variables.get(variable, '/'.join(
+                part for part in (parent, device, variable) if part))
+            if inputKey in self:
+                channelNames.append(variable)
+                inputs.append(self[inputKey])
+        if not inputs:
+            raise ValueError('The expression {0!r} uses no channel'
+                             .format(expression))
+
+        attributes = []
+        missing = []
+        for variable in names:
+            if variable in channelNames:
+                continue
+            for (index, chan) in enumerate(inputs):
+                if variable in chan.attributes:
+                    value = chan.attributes[variable]
+                    if not np.issubdtype(np.asarray(value).dtype,
+                                         np.number):
+                        raise ValueError('The attribute {0!r} of {1!r} is not'
+                                         ' a number: {2!r}'.format(
+                                             variable, chan.getName(), value))
+                    attributes.append((index, variable))
+                    break
+            else:
+                missing.append(variable)
+
+        self.missing_inputs.pop(key, None)
+        if missing:
+            self.missing_inputs[key] = missing
+            return missing
+
+        expression = expression.strip()
+
+        def evaluate(*arrays, **attributeValues):
+            localDict = dict(zip(channelNames, arrays))
+            localDict.update(attributeValues)
+            return numexpr.evaluate(expression, local_dict=localDict)
+
+        self._addDerivedChannel(key.split('/', 1)[1],
+                                device or inputs[0].getDevice(), parent,
+                                evaluate, inputs, attributes)
+        self.mods.append('Adding {0} = {1}'.format(key, expression))
+        return []
+
+    @processing_step
+    def add_V(self):
+        """Add the processed channel 'V' derived from 'VSample'.
+
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
+        """
+        return self.addDerived('proc/V')
+
+    @processing_step
     def add_dV(self):
         """Add the processed channel 'dV' derived from 'dVSample'
 
-        """
-        # dV depends on dVSample and LVSens
-        if (('proc01/dVSample' in self.keys() and 'LVSens' in self['proc01/dVSample']
-             .attributes.keys()) and ('proc01/dV' not in self.keys())):
-            chandVSample = self['proc01/dVSample']
-        else:
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        dVMeasArray = ((chandVSample.data / chandVSample.attributes['VAmp']) /
-                       10) * chandVSample.attributes['LVSens'] * 1E3
-        # Create the channel
-        chandV = Channel('dV', device='ADWin', meas_array=dVMeasArray)
-        # Set the parent
-        chandV.setParent('proc')
-        # Set the start time and time interval based on dVSample's values
-        chandV.setStartTime(chandVSample.getStartTime())
-        chandV.setTimeStep(chandVSample.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chandV)
-        self.mods.append('Adding amplifier-adjusted differential'
-                         ' sample voltage')
+        """
+        return self.addDerived('proc/dV')
 
+    @processing_step
     def add_I(self):
         """Add the processed channel 'I' derived from 'ISample'
 
-        """
-        if 'proc01/ISample' in self.keys() and 'proc01/I' not in self.keys():
-            chanISample = self['proc01/ISample']
-        else:
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        iMeasArray = (chanISample.data / chanISample.attributes['IAmp']) * 1E6
-        # Create the channel
-        chanI = Channel('I', device='ADWin', meas_array=iMeasArray)
-        # Set the parent
-        chanI.setParent('proc')
-        # Set the start time and time interval based on ISample's values
-        chanI.setStartTime(chanISample.getStartTime())
-        chanI.setTimeStep(chanISample.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chanI)
-        self.mods.append('Adding amplifier-adjusted absolute'
-                         ' sample current')
+        """
+        return self.addDerived('proc/I')
 
+    @processing_step
     def add_dI(self):
         """Add the processed channel 'dI' derived from 'dISample'
 
-        """
-        # dI depends on dISample and LISens
-        if (('proc01/dISample' in self.keys() and 'LISens' in self['proc01/dISample']
-             .attributes.keys()) and ('proc01/dI' not in self.keys())):
-            chandISample = self['proc01/dISample']
-        else:
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        dIMeasArray = ((chandISample.data / chandISample.attributes['IAmp']) /
-                       10) * chandISample.attributes['LISens'] * 1E6
-        # Create the channel
-        chandI = Channel('dI', device='ADWin', meas_array=dIMeasArray)
-        # Set the parent
-        chandI.setParent('proc')
-        # Set the start time and time interval from dISample's values
-        chandI.setStartTime(chandISample.getStartTime())
-        chandI.setTimeStep(chandISample.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chandI)
-        self.mods.append('Adding amplifier-adjusted differential'
-                         ' sample current')
+        """
+        return self.addDerived('proc/dI')
 
+    @processing_step
     def add_R(self):
         """Add the processed channel 'R' derived from 'V' and 'I'
 
-        """
-        # R depends on V and I try and get the proc01 (calculated by ADWin)
-        # data and fall back on the processed data
-        if ('proc01/I' and 'proc01/V') in self.keys() and \
-           'proc01/R' not in self.keys():
-            chanI = self['proc01/I']
-            chanV = self['proc01/V']
-        elif ('proc/I' and 'proc/V') in self.keys():
-            chanI = self['proc/I']
-            chanV = self['proc/V']
-        else:
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        rMeasArray = chanV.data/chanI.data
-        # Create the channel
-        chanR = Channel('R', device='ADWin', meas_array=rMeasArray)
-        # Set the parent
-        chanR.setParent('proc')
-        # Set the start time and time interval based on I's values'
-        chanR.setStartTime(chanI.getStartTime())
-        chanR.setTimeStep(chanI.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chanR)
-        self.mods.append('Adding amplifier-adjusted absolute'
-                         ' sample resistance')
+        """
+        return self.addDerived('proc/R')
 
+    @processing_step
     def add_RSample(self):
         """Add the processed channel 'RSample' derived from 'VSample' and
         'ISample'
 
-        """
-        # RSample depends on ISample and VSample. Try to get the values from
-        # the proc01 data. Fall back to the processed data
-        if (('proc01/ADWin/ISample' and 'proc01/ADWin/VSample') in self.keys()
-            and
-           (('proc01/ADWin/RSample'and 'proc01/ADWin/R') not in self.keys())):
-            chanISample = self['proc01/ADWin/ISample']
-            chanVSample = self['proc01/ADWin/VSample']
-        elif ('proc/ISample' and 'proc/VSample') in self.keys():
-            chanISample = self['proc/ISample']
-            chanVSample = self['proc/VSample']
-        else:
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        rMeasArray = chanVSample.data/chanISample.data
-        # Create the channel
-        chanRSample = Channel('ADWin/RSample', device='ADWin',
-                              meas_array=rMeasArray)
-        # Set the parent
-        chanRSample.setParent('proc01')
-        # Set the start time and time interval based on ISample's values
-        chanRSample.setStartTime(chanISample.getStartTime())
-        chanRSample.setTimeStep(chanISample.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chanRSample)
-        self.mods.append('Adding absolute sample resistance')
+        """
+        return self.addDerived('proc01/ADWin/RSample')
 
+    @processing_step
     def add_dRSample(self):
         """Add the processed channel 'dRSample' derived from 'dVSample' and
         'dISample'
 
-        """
-        # dRSample depends on dISample and dVSample. Try to use the raw data.
-        # Fall back on the processed data.
-        if (('proc01/ADWin/dISample' in self.keys()) and
-            ('proc01/ADWin/dVSample' in self.keys()) and
-           ('proc01/ADWin/dRSample' not in self.keys())):
-            # print('Condition 01 met')
-            chandISample = self['proc01/ADWin/dISample']
-            chandVSample = self['proc01/ADWin/dVSample']
-        elif ('proc/dISample' and 'proc/dVSample') in self.keys():
-            chandISample = self['proc/dISample']
-            chandVSample = self['proc/dVSample']
-        else:
-            # print('No conditions met to create dRSample')
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        dRMeasArray = chandVSample.data/chandISample.data
-        # Create the channel
-        chandRSample = Channel('ADWin/dRSample', device='ADWin',
-                               meas_array=dRMeasArray)
-        # Set the parent
-        chandRSample.setParent('proc01')
-        # Set the start time and time interval based on dISample's values
-        chandRSample.setStartTime(chandISample.getStartTime())
-        chandRSample.setTimeStep(chandISample.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chandRSample)
-        self.mods.append('Adding differential sample resistance')
+        """
+        return self.addDerived('proc01/ADWin/dRSample')
 
+    @processing_step
     def add_dISample(self):
-        """Add the processed channel 'dRSample' derived from 'dVSample' and
-        'dISample'
+        """Add the processed channel 'dISample' derived from 'dISamplex' and
+        'dISampley'
 
-        """
-        # dRSample depends on dISample and dVSample. Try to use the raw data.
-        # Fall back on the processed data.
-        # print('Going to try to add dISample')
-
-        if (('proc01/all/dISamplex' and 'proc01/all/dISampley') in self.keys()
-            and
-           ('proc01/all/dISample' not in self.keys())):
-            chandISamplex = self['proc01/all/dISamplex']
-            chandISampley = self['proc01/all/dISampley']
-        else:
-            # print('Failed')
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        dIMeasArray = np.sqrt(chandISamplex.data**2 + chandISampley.data**2)
-        # Create the channel
-        chandISample = Channel('all/dISample', device='all',
-                               meas_array=dIMeasArray)
-
-        # Set the parent
-        chandISample.setParent('proc01')
-        # Set the start time and time interval based on dISample's values
-        chandISample.setStartTime(chandISamplex.getStartTime())
-        chandISample.setTimeStep(chandISamplex.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chandISample)
-        self.mods.append('Adding differential sample current')
+        """
+        return self.addDerived('proc01/all/dISample')
 
+    @processing_step
     def add_dVSample(self):
-        """Add the processed channel 'dRSample' derived from 'dVSample' and
-        'dVSample'
-
-        """
-        # dRSample depends on dISample and dVSample. Try to use the proc01
-        # data.
-        # Fall back on the processed data.
-        # print('Going to try to add dVSample')
+        """Add the processed channel 'dVSample' derived from 'dVSamplex' and
+        'dVSampley'
 
-        if (('proc01/all/dVSamplex' and 'proc01/all/dVSampley') in self.keys()
-            and
-           ('proc01/all/dVSample' not in self.keys())):
-            chandVSamplex = self['proc01/all/dVSamplex']
-            chandVSampley = self['proc01/all/dVSampley']
-        else:
-            # print('Failed')
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        dVMeasArray = np.sqrt(chandVSamplex.data**2 + chandVSampley.data**2)
-        # Create the channel
-        chandVSample = Channel('all/dVSample', device='all',
-                               meas_array=dVMeasArray)
-
-        # Set the parent
-        chandVSample.setParent('proc01')
-        # Set the start time and time interval based on dVSample's values
-        chandVSample.setStartTime(chandVSamplex.getStartTime())
-        chandVSample.setTimeStep(chandVSamplex.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chandVSample)
-        self.mods.append('Adding differential sample voltage')
+        """
+        return self.addDerived('proc01/all/dVSample')
 
+    @processing_step
     def add_dR(self):
         """Add the processed channel 'dR' derived from 'dV' and 'dI'
 
-        """
-        # dR depends on dI and dV. Try to get the proc01 data. Fall back on the
-        # processed data.
-        if (('proc01/dI' and 'proc01/dV') in self.keys() and
-           ('proc01/dR' not in self.keys())):
-            chandI = self['proc01/dI']
-            chandV = self['proc01/dV']
-        elif ('proc/dI' and 'proc/dV') in self.keys():
-            chandI = self['proc/dI']
-            chandV = self['proc/dV']
-        else:
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        # Calculate the data
-        dRMeasArray = chandV.data/chandI.data
-        # Create the channel
-        chandR = Channel('dR', device='ADWin', meas_array=dRMeasArray)
-        # Set the parent
-        chandR.setParent('proc')
-        # Set the start time and time interval based on dI's values
-        chandR.setStartTime(chandI.getStartTime())
-        chandR.setTimeStep(chandI.getTimeStep())
-        # Add the channel to the registry
-        self.addChannel(chandR)
-        self.mods.append('Adding amplifier-adjusted differential sample'
-                         ' resistance')
+        """
+        return self.addDerived('proc/dR')
 
+    @processing_step
     def add_TSample_AD(self):
         """Convert Lakeshore output voltage to Temperature
 
-        """
-
-        if 'proc01/ADWin/TRuO' in self.keys():
-            VRuO = self['proc01/ADWin/TRuO']
-        elif 'proc01/ADWin/VRuO' in self.keys():
-            VRuO = self['proc01/ADWin/VRuO']
-        else:
-            return
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
 
-        vrslope = (6.66E3 - 1.25E3) / 20
-        vroffset = (6.66E3 + 1.25E3) / 2
-
-        p0 = 8.584
-        p1 = -1.156
-        r0 = 1259.9
-
-        # Calculate the resistance
-        Res_RuO_data = VRuO.data * vrslope + vroffset
-        lnT = p0 + (p1 * np.log(Res_RuO_data - r0))
-        TSample_AD_data = np.exp(lnT)
-
-        Res_RuO = Channel('ADWin/Res_RuO', device='ADWin',
-                          meas_array=Res_RuO_data)
-        Res_RuO.setParent('proc01')
-        Res_RuO.setStartTime(VRuO.getStartTime())
-        Res_RuO.setTimeStep(VRuO.getTimeStep())
-        self.addChannel(Res_RuO)
-
-        TSample_AD = Channel('ADWin/TSample_AD', device='ADWin',
-                             meas_array=TSample_AD_data)
-        TSample_AD.setParent('proc01')
-        TSample_AD.setStartTime(VRuO.getStartTime())
-        TSample_AD.setTimeStep(VRuO.getTimeStep())
-        self.addChannel(TSample_AD)
-        self.mods.append('Adding sample temperature based on TRuO or VRuO')
+        """
+        self.addDerived('proc01/ADWin/Res_RuO')
+        return self.addDerived('proc01/ADWin/TSample_AD')
 
+    @processing_step
     def addTransportChannels(self):
         """Add all of the transport channels
 
+        Returns
+        -------
+        OrderedDict
+            The keys of the missing input channels, keyed by the channels
+            that could not be added.
+
         """
-        self.add_V()
-        self.add_dV()
-        self.add_I()
-        self.add_dI()
-        self.add_RSample()
-        self.add_dRSample()
-        self.add_R()
-        self.add_dR()
+        missing = OrderedDict()
+        keys = ('proc/V', 'proc/dV', 'proc/I', 'proc/dI',
+                'proc01/ADWin/RSample', 'proc01/ADWin/dRSample', 'proc/R',
+                'proc/dR')
+        added = []
+        for (add, name) in zip((self.add_V, self.add_dV, self.add_I,
+                                self.add_dI, self.add_RSample,
+                                self.add_dRSample, self.add_R, self.add_dR),
+                               keys):
+            if name not in self:
+                add()
+                if name in self:
+                    added.append(name)
+        for name in keys:
+            if name in self.missing_inputs:
+                missing[name] = self.missing_inputs[name]
+
+        # Read the inputs only once for all of the new channels
+        self._fuseDerived(added)
+        return missing
+
+    def _fuseDerived(self, keys):
+        """Calculate derived channels in one pass when one of them is read.
+
+        Parameters
+        ----------
+        keys : list
+            The keys of derived channels, every channel after the channels it
+            is derived from. Channels that were read already are left alone.
+
+        """
+        fused = FusedCalculation(self.scratch_dir)
+        for key in keys:
+            chan = self[key]
+            if chan.isLoaded():
+                continue
+            (calculation, inputs, _, iterCalculate) = \
+                self._derivedChannels[key]
+            calculate = fused.add(key, chan, calculation, inputs)
+            chan.setLoader(calculate, chan.attributes['Length'],
+                           iterCalculate)
+            self._derivedChannels[key] = (calculation, inputs, calculate,
+                                          iterCalculate)
 
     def addTimeTracks(self, device, time_track):
         """Add the time track for a device
@@ -1035,18 +3354,30 @@ class ChannelRegistry(dict):
         ----------
         device : str
             The name of the device for which the time track will be added.
-        time_track : numpy.ndarray
-            The time data
+        time_track : numpy.ndarray or TimeBase
+            The time data in minutes since the file's start, or the time base
+            of the device's channels to calculate it from when it is first
+            accessed.
 
         """
 
         if not isinstance(device, str):
             raise TypeError('The device parameter must be a string.')
 
-        if not isinstance(time_track, np.ndarray):
-            raise TypeError('The time_track parameter must be a numpy array')
+        if isinstance(time_track, TimeBase):
+            newChan = Channel('{}/Time_m'.format(device), device)
+            newChan.setLoader(
+                partial(time_track.minutes, reference=self.file_start_time),
+                len(time_track),
+                partial(time_track.iterMinutes,
+                        reference=self.file_start_time))
+            newChan.setTimeStep(time_track.step)
+        elif isinstance(time_track, np.ndarray):
+            newChan = Channel('{}/Time_m'.format(device), device, time_track)
+        else:
+            raise TypeError('The time_track parameter must be a numpy array '
+                            'or a TimeBase')
 
-        newChan = Channel('{}/Time_m'.format(device), device, time_track)
         newChan.setParent('proc01')
         newChan.setStartTime(self.file_start_time)
 
@@ -1055,17 +3386,25 @@ class ChannelRegistry(dict):
 
         self.addChannel(newChan)
 
+    @processing_step
     def addInterpolatedB(self):
         """Add the interpolated BField data to ADWin device.
 
         This assumes that the data from the IPS and ADWin devices are already
         loaded.
 
+        Returns
+        -------
+        list
+            The keys of the missing input channels.
+
         """
-        for key in ['proc01/IPS/Magnetfield', 'proc01/ADWin/Time_m']:
-            if key not in self.keys():
-                # print('{k} data is not present. Cannot add B.'.format(k=key))
-                return
+        inputs = self._derivedInputs('proc01/ADWin/B',
+                                     ['proc01/IPS/Magnetfield',
+                                      'proc01/ADWin/Time_m',
+                                      'proc01/IPS/Time_m'])
+        if inputs is None:
+            return self.missing_inputs.get('proc01/ADWin/B', [])
 
         magnetfield_array = self['proc01/IPS/Magnetfield'].data
         adwin_time = self['proc01/ADWin/Time_m'].data
@@ -1082,7 +3421,9 @@ class ChannelRegistry(dict):
         self.addChannel(newChan)
         self.mods.append('Adding magnetfield channel to ADWin interpolated'
                          ' IPS data')
+        return []
 
+    @processing_step
     def removeMagetfieldZeros(self):
         """Remove the zero spikes in the magnetfield signal from the IPS
 
@@ -1094,18 +3435,18 @@ class ChannelRegistry(dict):
         if magfield_key not in self.keys():
             return
 
-        # First deal with IPS/Time_m before writing over the Magnetfield data
-        self[magtime_key].data = self[magtime_key]\
-            .data[np.abs(self[magfield_key].data) > 0]
-        self[magtime_key].time = self[magtime_key]\
-            .time[np.abs(self[magfield_key].data) > 0]
+        keep = np.abs(self[magfield_key].data) > 0
+        if keep.all():
+            return
 
-        # First deal with Magnetfield time before writing over the data
-        self[magfield_key].time = self[magfield_key]\
-            .time[np.abs(self[magfield_key].data) > 0]
-        self[magfield_key].data = self[magfield_key]\
-            .data[np.abs(self[magfield_key].data) > 0]
+        # Only the removed values are kept to undo the step
+        for key in (magtime_key, magfield_key):
+            if key in self:
+                delta = MaskDelta(self[key], keep)
+                delta.apply()
+                self._step.record(delta)
 
+    @processing_step
     def removeADWinTempOffset(self):
         """Remove the small offset in ADWin's recorded temperature."""
         # print("Remove the offset on ADWin's temperature reading")
@@ -1124,16 +3465,82 @@ class ChannelRegistry(dict):
         else:
             TLKkey = None
 
-        ad_mean = self[TADkey].data.mean()
-        lk_mean = self[TLKkey].data.mean()
+        chanTAD = self[TADkey]
+        chanTLK = self[TLKkey]
+        offsets = []
+        step = self._step
+
+        def getOffset(adChunks):
+            # The offset is determined once, from the uncorrected data
+            if not offsets:
+                adStatistics = ChannelStatistics()
+                for chunk in adChunks:
+                    adStatistics.add(chunk)
+                lkStatistics = chanTLK.getStatistics()
+                # Like np.mean, a NaN in either channel makes the offset NaN
+                ad_mean = np.nan if adStatistics.nan_count else \
+                    adStatistics.mean
+                lk_mean = np.nan if lkStatistics['nan_count'] else \
+                    lkStatistics['mean']
+
+                offset = ad_mean - lk_mean
+                # print("The offset is: {0:.2f} - {1:.2f} = {2:.2f}"
+                #       .format(ad_mean*1000, lk_mean*1000, offset*1000))
+                offsets.append(offset)
+                self._tempOffset = (TADkey, offset)
+                # A lazily loaded channel is corrected after the step is over
+                step.describe(self, 'Removing offset discrepency of ADWin'
+                              ' compared to Lakeshore. Discrepency is'
+                              ' {:.2f} mK'.format(offset*1000))
+            return offsets[0]
+
+        def removeOffset(data):
+            offset = getOffset([data])
+            if isinstance(data, np.memmap):
+                return chunked_calculation(lambda d: d - offset, [data],
+                                           self.scratch_dir)
+            if not data.flags.writeable:
+                return data - offset
+            data -= offset
+            return data
+
+        # Only correct a channel that has not been read yet when it is read
+        if chanTAD.isLoaded() and chanTAD.data.flags.writeable and \
+                not isinstance(chanTAD.data, np.memmap):
+            chanTAD.data = removeOffset(chanTAD.data)
+            step.record(OffsetDelta(chanTAD, offsets[0]))
+            return
+
+        delta = StateDelta(chanTAD)
+        step.record(delta)
+        if chanTAD.isLoaded():
+            chanTAD.data = removeOffset(chanTAD.data)
+            delta.update()
+            return
+
+        steps = chanTAD.getSteps()
+        if steps is not None:
+            # Shift the steps, so that the values appended to them when the
+            # file grows are corrected the same way
+            offset = getOffset(steps.iterChunks(CHUNK_LENGTH))
+            values = steps.values.copy()
+            values -= offset
+            chanTAD.setSteps(StepArray(steps.indices, values, len(steps)))
+            delta.update()
+            return
+
+        loader = chanTAD.getLoader()
+        chunks = chanTAD.getChunks()
+
+        def iterRemoveOffset(chunk_length):
+            offset = getOffset(chunks(chunk_length))
+            for chunk in chunks(chunk_length):
+                yield chunk - offset
 
-        offset = ad_mean - lk_mean
-        # print("The offset is: {0:.2f} - {1:.2f} = {2:.2f}"
-        #       .format(ad_mean*1000, lk_mean*1000, offset*1000))
-        self[TADkey].data -= offset
-        self.mods.append('Removing offset discrepency of ADWin compared to'
-                         ' Lakeshore. Discrepency is {:.2f} mK'
-                         .format(offset*1000))
+        chanTAD.setLoader(lambda: removeOffset(loader()),
+                          chanTAD.attributes['Length'],
+                          iterRemoveOffset if chunks is not None else None)
+        delta.update()
 
 
 def main(argv=None):
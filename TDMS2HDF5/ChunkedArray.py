@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Appendable arrays stored as a list of blocks.
+
+A numpy array can not grow in place, appending to it means copying all of its
+values. A ChunkedArray keeps its values in blocks of a fixed size instead, so
+that appending only ever writes the new values. The blocks can be streamed
+one by one and are only joined into one contiguous array when it is asked
+for.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import mmap
+import tempfile
+
+import numpy as np
+
+# The default number of values in each block
+BLOCK_LENGTH = 1 << 16
+
+
+def owned_nbytes(array):
+    """Return the number of bytes of memory an array holds by itself.
+
+    Memory maps and views of other arrays hold none, their memory belongs to
+    a file or to the other array.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+
+    Returns
+    -------
+    int
+
+    """
+    if (isinstance(array, np.memmap) or
+            isinstance(array.base, (np.ndarray, mmap.mmap))):
+        return 0
+    return array.nbytes
+
+
+class ChunkedArray(object):
+    """A one dimensional array that grows by appending blocks.
+
+    Every block but the last is full. Values are appended to the room left in
+    the last block and then to new blocks of block_length values, so that
+    appending costs time proportional to the number of new values.
+
+    Parameters
+    ----------
+    values : numpy.ndarray, optional
+        The initial values. The array becomes the first block without being
+        copied, it is never written to.
+    dtype : numpy.dtype, optional
+        The dtype of an empty array. Defaults to the dtype of values.
+    block_length : int, optional
+        The number of values of each new block.
+    shared : bool, optional
+        Whether values was handed out before, so that the first block is
+        shared, see spill.
+
+    Attributes
+    ----------
+    dtype : numpy.dtype
+        The dtype of the values.
+    block_length : int
+        The number of values of each new block.
+    nbytes : int
+        The number of bytes of the blocks, including the room left in the
+        last one.
+    spilled_nbytes : int
+        The number of bytes of the values spilled to the scratch file.
+
+    Methods
+    -------
+    append(values : numpy.ndarray)
+        Append values to the end of the array.
+    iterChunks()
+        Iterate over the values block by block.
+    read(start : int, stop : int)
+        Return a range of the values.
+    toArray()
+        Return the values as one contiguous array.
+    getResidentBytes()
+        Return the number of bytes of the blocks held in memory.
+    spill(scratch_dir : str)
+        Move the blocks held in memory to a scratch file.
+
+    """
+
+    __slots__ = ('dtype', 'block_length', '_blocks', '_shared', '_length',
+                 '_room', '_scratch')
+
+    def __init__(self, values=None, dtype=None, block_length=BLOCK_LENGTH,
+                 shared=False):
+        super(ChunkedArray, self).__init__()
+
+        self.block_length = int(block_length)
+        self._blocks = []
+        # Whether each block was handed out, e.g. by toArray
+        self._shared = []
+        self._length = 0
+        # The number of values the last block has room for
+        self._room = 0
+        # The scratch file of the spilled values, mapped as the first block
+        self._scratch = None
+
+        if values is None:
+            self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+        else:
+            values = np.asarray(values)
+            self.dtype = values.dtype if dtype is None else np.dtype(dtype)
+            if len(values):
+                block = values.astype(self.dtype, copy=False)
+                self._blocks.append(block)
+                self._shared.append(shared and block is values)
+                self._length = len(values)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the blocks, including the room left."""
+        return sum(block.nbytes for block in self._blocks)
+
+    @property
+    def spilled_nbytes(self):
+        """The number of bytes of the values spilled to the scratch file."""
+        if self._scratch is None:
+            return 0
+        return self._blocks[0].nbytes
+
+    def getResidentBytes(self):
+        """Return the number of bytes of the blocks held in memory.
+
+        Blocks that are memory maps or views of other arrays hold none, see
+        owned_nbytes.
+
+        """
+        return sum(owned_nbytes(block) for block in self._blocks)
+
+    def spill(self, scratch_dir=None):
+        """Move the blocks held in memory to a scratch file.
+
+        The blocks after the ones spilled before are appended to the scratch
+        file, which is mapped read-only as the new first block, so that
+        spilling again after appending only writes the new values. Values
+        appended later go to new blocks in memory. Blocks that were handed
+        out, e.g. by toArray, are spilled as well, but their memory is only
+        freed once the arrays handed out are dropped. They are not counted
+        as freed.
+
+        Parameters
+        ----------
+        scratch_dir : str, optional
+            The directory for the scratch file. Defaults to the system's
+            temporary directory.
+
+        Returns
+        -------
+        int
+            The number of bytes of memory freed.
+
+        """
+        first = 0 if self._scratch is None else 1
+        stop = first
+        while (stop < len(self._blocks) and
+               owned_nbytes(self._blocks[stop])):
+            stop += 1
+        if stop == first:
+            return 0
+
+        if self._scratch is None:
+            self._scratch = tempfile.TemporaryFile(dir=scratch_dir)
+        self._scratch.seek(0, os.SEEK_END)
+        freed = 0
+        for i in range(first, stop):
+            block = self._blocks[i]
+            if not self._shared[i]:
+                freed += block.nbytes
+            if i == len(self._blocks) - 1:
+                block = block[:len(block) - self._room]
+                self._room = 0
+            block.tofile(self._scratch)
+        self._scratch.flush()
+
+        length = self._scratch.tell() // self.dtype.itemsize
+        self._blocks[:stop] = [np.memmap(self._scratch, dtype=self.dtype,
+                                         mode='r', shape=(length,))]
+        self._shared[:stop] = [False]
+        return freed
+
+    def append(self, values):
+        """Append values to the end of the array.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            The values to append. If their dtype is wider, e.g. floats
+            appended to integers, the whole array is converted to it.
+
+        """
+        values = np.asarray(values)
+        if not len(values):
+            return
+
+        dtype = np.result_type(self.dtype, values)
+        if dtype != self.dtype:
+            self._consolidate(dtype, self._length)
+
+        if self._room:
+            block = self._blocks[-1]
+            take = min(self._room, len(values))
+            used = len(block) - self._room
+            block[used:used + take] = values[:take]
+            self._room -= take
+            self._length += take
+            values = values[take:]
+
+        while len(values):
+            block = np.empty(max(self.block_length, 1), self.dtype)
+            take = min(len(block), len(values))
+            block[:take] = values[:take]
+            self._blocks.append(block)
+            self._shared.append(False)
+            self._room = len(block) - take
+            self._length += take
+            values = values[take:]
+
+    def iterChunks(self):
+        """Iterate over the values block by block.
+
+        Yields
+        ------
+        numpy.ndarray
+            Views of the filled part of each block. They are meant to be
+            streamed, unlike the arrays returned by toArray the blocks are
+            not marked as shared.
+
+        """
+        for (i, block) in enumerate(self._blocks):
+            if i == len(self._blocks) - 1 and self._room:
+                block = block[:len(block) - self._room]
+            yield block
+
+    def read(self, start=0, stop=None):
+        """Return a range of the values.
+
+        Only the blocks overlapping the range are read. A range inside one
+        block is copied as well, so that the block is not shared.
+
+        Parameters
+        ----------
+        start : int, optional
+            The index of the first value.
+        stop : int, optional
+            The index after the last value. Defaults to the length.
+
+        Returns
+        -------
+        numpy.ndarray
+
+        """
+        (start, stop, _) = slice(start, stop).indices(self._length)
+        parts = []
+        position = 0
+        for chunk in self.iterChunks():
+            end = position + len(chunk)
+            if end > start and position < stop:
+                parts.append(chunk[max(start - position, 0):stop - position])
+            position = end
+            if position >= stop:
+                break
+
+        if len(parts) == 1:
+            return parts[0].copy()
+        if not parts:
+            return np.empty(0, self.dtype)
+        return np.concatenate(parts)
+
+    def toArray(self):
+        """Return the values as one contiguous array.
+
+        The blocks are joined into one block with room for another
+        block_length values, so that appending a few values does not copy
+        the array again.
+
+        Returns
+        -------
+        numpy.ndarray
+            A view of the values, which appending does not change. The block
+            is marked as shared, see spill.
+
+        """
+        if len(self._blocks) > 1:
+            self._consolidate(self.dtype, self._length + self.block_length)
+        if not self._blocks:
+            return np.empty(0, self.dtype)
+        self._shared[0] = True
+        return self._blocks[0][:self._length]
+
+    def _consolidate(self, dtype, capacity):
+        """Join the blocks into one block of dtype and capacity values."""
+        block = np.empty(max(capacity, self._length), dtype)
+        position = 0
+        for chunk in self.iterChunks():
+            block[position:position + len(chunk)] = chunk
+            position += len(chunk)
+
+        self.dtype = np.dtype(dtype)
+        self._blocks = [block]
+        self._shared = [False]
+        self._room = len(block) - self._length
+        self._scratch = None
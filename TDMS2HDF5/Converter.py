@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Convert TDMS files to HDF5 without loading them into memory.
+
+The converter streams every channel chunk by chunk from the TDMS file into a
+resizable HDF5 dataset, so that the memory needed for a conversion does not
+depend on the size of the file.
+
+By default every channel is written as a plain array. With step encoding,
+channels that change rarely are written as ('Index', 'Value') records
+instead, see write_steps. Readers of such files have to expand these
+datasets, so the files are marked with the file attribute 'FormatVersion'
+set to STEPS_FORMAT_VERSION. Files without the attribute only hold plain
+arrays.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import sys
+import argparse
+from datetime import datetime
+
+import h5py
+import numpy as np
+
+from TDMS2HDF5.ChannelModel import ChannelRegistry, ChannelStatistics
+from TDMS2HDF5.StepArray import step_encode_stream
+
+# The default maximum size of the chunk held in memory for a channel
+CHUNK_MB = 16
+
+# The 'FormatVersion' of HDF5 files with step encoded datasets
+STEPS_FORMAT_VERSION = 2
+
+# The HDF5 attributes the summary statistics of a channel are written to
+STATISTICS_ATTRIBUTES = (('min', 'Minimum'), ('max', 'Maximum'),
+                         ('mean', 'Mean'), ('std', 'StdDev'),
+                         ('nan_count', 'NaNCount'))
+
+
+def hdf5_attribute(attr_value):
+    """Convert a channel attribute into a value h5py can store.
+
+    Parameters
+    ----------
+    attr_value : object
+        The value of the channel attribute.
+
+    Returns
+    -------
+    object
+        Datetimes as ISO strings, numpy datetimes and timedeltas as integers
+        in their unit and strings as byte strings.
+
+    """
+    # Convert the datetime format to a string
+    if type(attr_value) is datetime:
+        attr_value = attr_value.isoformat()
+
+    if isinstance(attr_value, (np.datetime64, np.timedelta64)):
+        attr_value = attr_value.astype('<i8')
+
+    # There's currently a wierd bug when dealing with python3 strings.
+    # This gets around that
+    if type(attr_value) is str:
+        attr_value = np.string_(attr_value)
+
+    return attr_value
+
+
+def write_channel(hdf5FileObject, key, channel, chunk_mb=CHUNK_MB,
+                  steps=False):
+    """Stream a channel into a resizable dataset of an HDF5 file.
+
+    Besides the channel's attributes, the summary statistics of its data are
+    written as the attributes in STATISTICS_ATTRIBUTES. They are accumulated
+    while the data is streamed.
+
+    A channel that changes rarely is written step encoded instead: the
+    dataset holds one ('Index', 'Value') record per step, the index of its
+    first value and its value, and its 'Encoding' attribute is 'steps'. The
+    full array is numpy.repeat(Value, numpy.diff(numpy.append(Index,
+    Length))). Step encoding is only used if steps is set, as readers of the
+    HDF5 file have to know about it.
+
+    Parameters
+    ----------
+    hdf5FileObject : h5py.File
+        The open HDF5 file.
+    key : str
+        The path of the dataset in the HDF5 file.
+    channel : Channel
+        The channel to write.
+    chunk_mb : float, optional
+        The maximum size in MB of the part of the channel held in memory.
+    steps : bool, optional
+        Write channels that change rarely step encoded. Channels that are
+        not step encoded already are read once, see step_encode_stream.
+
+    Returns
+    -------
+    h5py.Dataset
+        The dataset the channel was written to.
+
+    """
+    # Size the chunks for the widest values a channel can have
+    chunk_length = max(1, int(chunk_mb * 2**20) // 8)
+
+    chunks = channel.iterData(chunk_length)
+    if steps:
+        stepArray = channel.getSteps()
+        if stepArray is None:
+            # The parts read while trying are written without reading again
+            (stepArray, chunks) = step_encode_stream(
+                chunks, channel.attributes['Length'], chunk_length)
+        if stepArray is not None:
+            return write_steps(hdf5FileObject, key, channel, stepArray,
+                               chunk_length)
+
+    dset = None
+    length = 0
+    statistics = ChannelStatistics()
+
+    for chunk in chunks:
+        if dset is None:
+            dset = hdf5FileObject.create_dataset(
+                key, shape=(0,), maxshape=(None,), dtype=chunk.dtype,
+                chunks=(min(chunk_length, max(len(chunk), 1)),))
+        dset.resize((length + len(chunk),))
+        dset[length:length + len(chunk)] = chunk
+        length += len(chunk)
+        statistics.add(chunk)
+
+    if dset is None:
+        dset = hdf5FileObject.create_dataset(key, shape=(0,),
+                                             dtype=np.float64)
+
+    write_attributes(dset, channel, statistics)
+
+    return dset
+
+
+def write_steps(hdf5FileObject, key, channel, stepArray,
+                chunk_length=CHUNK_MB * 2**17):
+    """Write a step encoded channel into a dataset of an HDF5 file.
+
+    The file is marked with the 'FormatVersion' STEPS_FORMAT_VERSION.
+
+    Parameters
+    ----------
+    hdf5FileObject : h5py.File
+        The open HDF5 file.
+    key : str
+        The path of the dataset in the HDF5 file.
+    channel : Channel
+        The channel to write.
+    stepArray : StepArray
+        The channel's step encoded data.
+    chunk_length : int, optional
+        The number of values expanded at a time for the statistics.
+
+    Returns
+    -------
+    h5py.Dataset
+        The dataset the channel was written to.
+
+    """
+    records = np.rec.fromarrays([stepArray.indices, stepArray.values],
+                                names='Index,Value')
+    dset = hdf5FileObject.create_dataset(key, data=records)
+    dset.attrs.create('Encoding', np.string_('steps'))
+    hdf5FileObject.file.attrs.create('FormatVersion', STEPS_FORMAT_VERSION)
+
+    statistics = ChannelStatistics()
+    for chunk in stepArray.iterChunks(chunk_length):
+        statistics.add(chunk)
+    write_attributes(dset, channel, statistics)
+
+    return dset
+
+
+def write_attributes(dset, channel, statistics):
+    """Write a channel's attributes and statistics to its dataset.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        The dataset of the channel.
+    channel : Channel
+        The channel whose attributes are written.
+    statistics : ChannelStatistics
+        The statistics of the channel's data.
+
+    """
+    for attr_name, attr_value in channel.attributes.items():
+        dset.attrs.create(attr_name, hdf5_attribute(attr_value))
+
+    statistics = statistics.asDict()
+    for (name, attr_name) in STATISTICS_ATTRIBUTES:
+        dset.attrs.create(attr_name, statistics[name])
+
+
+def tdms_to_hdf5(tdms_filename, hdf5_filename, chunk_mb=CHUNK_MB,
+                 metadata_cache=None, include=None, exclude=None,
+                 dtype=None, steps=False):
+    """Convert a TDMS file into an HDF5 file chunk by chunk.
+
+    Only the meta data of the TDMS file is read up front. The channels,
+    including the ones derived at load time, are then streamed into the HDF5
+    file with at most chunk_mb MB of each channel in memory.
+
+    Parameters
+    ----------
+    tdms_filename : str
+        The absolute path of the TDMS file.
+    hdf5_filename : str
+        The absolute path of the HDF5 file to write.
+    chunk_mb : float, optional
+        The maximum size in MB of the part of a channel held in memory.
+    metadata_cache : MetadataCache, optional
+        A cache for the parsed meta data of the TDMS file.
+    include : list, optional
+        Only convert the channels matching one of these patterns.
+    exclude : list, optional
+        Do not convert the channels matching any of these patterns.
+    dtype : numpy.dtype, optional
+        Write the floating point channels in this dtype, e.g. numpy.float32
+        to halve the size of the HDF5 file.
+    steps : bool, optional
+        Write the channels that change rarely step encoded, see
+        write_channel.
+
+    Returns
+    -------
+    ChannelRegistry
+        The lazily loaded channel registry of the TDMS file.
+
+    """
+    channelRegistry = ChannelRegistry()
+    channelRegistry.loadFromFile(tdms_filename, lazy=True,
+                                 metadata_cache=metadata_cache,
+                                 include=include, exclude=exclude,
+                                 raw_dtype=dtype, derived_dtype=dtype)
+
+    with h5py.File(hdf5_filename, 'w') as hdf5FileObject:
+        for key in sorted(channelRegistry.keys()):
+            channel = channelRegistry[key]
+            if channel.write_to_file:
+                write_channel(hdf5FileObject, key, channel, chunk_mb, steps)
+
+        for attr_name, attr_value in (('StartTime',
+                                       channelRegistry.file_start_time),
+                                      ('EndTime',
+                                       channelRegistry.file_end_time)):
+            if attr_value is not None:
+                hdf5FileObject.attrs.create(attr_name,
+                                            hdf5_attribute(attr_value))
+
+    return channelRegistry
+
+
+def main(argv=None):
+    """Convert a TDMS file from the command line."""
+
+    prog_desc = "Stream a TDMS file into an HDF5 file"
+    parser = argparse.ArgumentParser(description=prog_desc)
+    parser.add_argument('tdms_file', help='The TDMS file to convert')
+    parser.add_argument('hdf5_file', help='The HDF5 file to write')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_MB,
+                        help='The maximum MB of a channel held in memory')
+    parser.add_argument('--include', action='append', metavar='PATTERN',
+                        help=("Only convert channels matching the pattern,"
+                              " e.g. 'ADWin/*'. Can be given several times"))
+    parser.add_argument('--exclude', action='append', metavar='PATTERN',
+                        help=("Do not convert channels matching the pattern."
+                              " Can be given several times"))
+    parser.add_argument('--float32', action='store_true',
+                        help='Write the channels in single precision')
+    parser.add_argument('--steps', action='store_true',
+                        help=('Write the channels that change rarely step'
+                              ' encoded, as (Index, Value) records'))
+
+    args = parser.parse_args(argv)
+
+    tdms_to_hdf5(args.tdms_file, args.hdf5_file, args.chunk_mb,
+                 include=args.include, exclude=args.exclude,
+                 dtype=np.float32 if args.float32 else None,
+                 steps=args.steps)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" The undoable history of the processing steps of a channel registry.
+
+Every processing step, e.g. adding derived channels or removing the zeros of
+the magnet field, is recorded as a ProcessingStep. A step keeps only what is
+needed to go back and forth between the channels before and after it: the
+channel objects it added, removed or replaced, which share their data with
+the other version, and deltas for the channels it changed in place, like an
+offset or the values a mask removed. The steps also remember how they were
+called, so that the history can be replayed on another file.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+from functools import wraps
+
+import numpy as np
+
+# The registry attributes a step can change besides its channels
+REGISTRY_STATE = ('parents', 'devices', 'missing_inputs', '_derivedChannels',
+                  '_tempOffset')
+
+
+def processing_step(method):
+    """Record the calls of a ChannelRegistry method in its history.
+
+    Calls of other processing steps made by the method become part of its
+    step, so that they are undone together.
+
+    """
+    @wraps(method)
+    def step(self, *args, **kwargs):
+        if self._step is not None:
+            return method(self, *args, **kwargs)
+
+        self._step = ProcessingStep(self, method.__name__, args, kwargs)
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            (record, self._step) = (self._step, None)
+
+        if record.finish(self):
+            self.history.append(record)
+            del self._redo[:]
+
+        return result
+
+    return step
+
+
+def _copy(value):
+    """Return a shallow copy of a registry attribute."""
+    return value.copy() if hasattr(value, 'copy') else value
+
+
+class ProcessingStep(object):
+    """One undoable step in the history of a channel registry.
+
+    Parameters
+    ----------
+    registry : ChannelRegistry
+        The registry the step is applied to.
+    name : str
+        The name of the registry method of the step.
+    args : tuple
+        The positional arguments of the method.
+    kwargs : dict
+        The keyword arguments of the method.
+
+    Attributes
+    ----------
+    name : str
+        The name of the registry method of the step.
+    args : tuple
+        The positional arguments of the method.
+    kwargs : dict
+        The keyword arguments of the method.
+    descriptions : list
+        The descriptions the step added to the registry's mods.
+    loading : bool
+        Whether the step was carried out while loading the file.
+
+    Methods
+    -------
+    record(delta)
+        Record a change of a channel the step made in place.
+    describe(registry : ChannelRegistry, description : str)
+        Add a description of the step to the registry's mods.
+    finish(registry : ChannelRegistry)
+        Record what the step changed, return whether it changed anything.
+    undo(registry : ChannelRegistry)
+        Restore the registry to before the step.
+    redo(registry : ChannelRegistry)
+        Restore the registry to after the step.
+
+    """
+
+    __slots__ = ('name', 'args', 'kwargs', 'descriptions', 'loading',
+                 '_deltas', '_channels', '_state', '_modCount')
+
+    def __init__(self, registry, name, args=(), kwargs=None):
+        super(ProcessingStep, self).__init__()
+
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.descriptions = []
+        self.loading = False
+        self._deltas = []
+        # The channels before the step and, once it is finished, the ones it
+        # changed: {key: (before, after)} with None for a missing channel
+        self._channels = dict(registry)
+        self._state = dict((name, _copy(getattr(registry, name)))
+                           for name in REGISTRY_STATE)
+        self._modCount = len(registry.mods)
+
+    def __repr__(self):
+        return 'ProcessingStep({0!r})'.format(self.name)
+
+    def record(self, delta):
+        """Record a change of a channel the step made in place.
+
+        Parameters
+        ----------
+        delta : OffsetDelta, MaskDelta, StateDelta or ListenerDelta
+            The change, recorded after it was made.
+
+        """
+        self._deltas.append(delta)
+
+    def describe(self, registry, description):
+        """Add a description of the step to the registry's mods.
+
+        Descriptions added after the step finished, e.g. by a calculation
+        that only runs once a lazily loaded channel is read, are undone with
+        the step as well.
+
+        """
+        registry.mods.append(description)
+        if self._modCount is None:
+            self.descriptions.append(description)
+
+    def finish(self, registry):
+        """Record what the step changed.
+
+        Returns
+        -------
+        bool
+            Whether the step changed anything.
+
+        """
+        before = self._channels
+        self._channels = {}
+        for key in set(before) | set(registry):
+            (old, new) = (before.get(key), registry.get(key))
+            if old is not new:
+                self._channels[key] = (old, new)
+
+        self.descriptions.extend(registry.mods[self._modCount:])
+        self._modCount = None
+
+        return bool(self._channels or self._deltas or self.descriptions)
+
+    def _swapState(self, registry):
+        """Exchange the registry attributes with the ones of the step."""
+        state = dict((name, _copy(getattr(registry, name)))
+                     for name in REGISTRY_STATE)
+        for (name, value) in self._state.items():
+            setattr(registry, name, value)
+        self._state = state
+
+    def undo(self, registry):
+        """Restore the registry to before the step."""
+        for delta in reversed(self._deltas):
+            delta.undo()
+
+        for (key, (old, new)) in self._channels.items():
+            if old is None:
+                del registry[key]
+            else:
+                registry[key] = old
+
+        self._swapState(registry)
+
+        for description in self.descriptions:
+            # Remove the last occurrence, later steps may repeat it
+            index = len(registry.mods) - 1 - \
+                registry.mods[::-1].index(description)
+            del registry.mods[index]
+
+    def redo(self, registry):
+        """Restore the registry to after the step."""
+        for (key, (old, new)) in self._channels.items():
+            if new is None:
+                del registry[key]
+            else:
+                registry[key] = new
+
+        for delta in self._deltas:
+            delta.redo()
+
+        self._swapState(registry)
+        registry.mods.extend(self.descriptions)
+
+
+class OffsetDelta(object):
+    """A constant that was subtracted from a channel's data in place.
+
+    Parameters
+    ----------
+    channel : Channel
+        The changed channel.
+    offset : float
+        The subtracted constant.
+
+    """
+
+    __slots__ = ('channel', 'offset')
+
+    def __init__(self, channel, offset):
+        self.channel = channel
+        self.offset = offset
+
+    def _add(self, value):
+        data = self.channel.data
+        if data.flags.writeable:
+            data += value
+            self.channel.data = data
+        else:
+            self.channel.data = data + value
+
+    def undo(self):
+        self._add(self.offset)
+
+    def redo(self):
+        self._add(-self.offset)
+
+
+class MaskDelta(object):
+    """Values a mask removed from a channel's data.
+
+    Only the removed values are kept, the values the mask kept are shared
+    with the channel.
+
+    Parameters
+    ----------
+    channel : Channel
+        The changed channel, before the mask is applied.
+    keep : numpy.ndarray
+        The boolean mask of the values to keep.
+
+    Methods
+    -------
+    apply()
+        Apply the mask to the channel.
+
+    """
+
+    __slots__ = ('channel', 'removed', 'values', 'timeTracks')
+
+    def __init__(self, channel, keep):
+        self.channel = channel
+        self.removed = np.flatnonzero(~keep)
+        self.values = channel.data[self.removed]
+        # Time tracks set explicitly, the others come from the time base
+        self.timeTracks = dict(channel._timeTracks)
+
+    def apply(self):
+        """Apply the mask to the channel."""
+        self.redo()
+
+    def undo(self):
+        # The positions of the removed values in the masked array
+        positions = self.removed - np.arange(len(self.removed))
+        data = np.insert(self.channel.data, positions, self.values)
+        self.channel.attributes['Length'] = len(data)
+        self.channel._timeTracks = dict(self.timeTracks)
+        self.channel.data = data
+
+    def redo(self):
+        channel = self.channel
+        tracks = [(name, np.delete(getattr(channel, name), self.removed))
+                  for name in ('time', 'elapsed_time')]
+        data = np.delete(channel.data, self.removed)
+        # The time tracks are set for the new length, so that they are kept
+        channel.attributes['Length'] = len(data)
+        for (name, track) in tracks:
+            setattr(channel, name, track)
+        channel.data = data
+
+
+class StateDelta(object):
+    """The data, loader and time tracks a channel had before a step.
+
+    The arrays and callables are shared, not copied, so that a channel whose
+    data or loader was replaced by a new one can be restored for free.
+
+    Parameters
+    ----------
+    channel : Channel
+        The channel, before it is changed.
+
+    Methods
+    -------
+    update()
+        Record the state after the change.
+
+    """
+
+    __slots__ = ('channel', 'before', 'after')
+
+    FIELDS = ('_data', '_shared', '_loader', '_detached', '_chunks',
+              '_spilled', '_steps', '_statistics', '_timeTracks')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.before = self._state()
+        self.after = None
+
+    def _state(self):
+        state = [getattr(self.channel, name) for name in self.FIELDS]
+        state[-1] = dict(state[-1])
+        return (state, self.channel.attributes['Length'])
+
+    def _restore(self, state):
+        (fields, length) = state
+        for (name, value) in zip(self.FIELDS, fields):
+            setattr(self.channel, name, value)
+        self.channel._timeTracks = dict(fields[-1])
+        self.channel.attributes['Length'] = length
+        # Like replacing the data, see Channel.data
+        if self.channel._budget is not None:
+            self.channel._budget.changed(self.channel)
+        self.channel._changed()
+
+    def update(self):
+        """Record the state after the change."""
+        self.after = self._state()
+
+    def undo(self):
+        self._restore(self.before)
+
+    def redo(self):
+        self._restore(self.after)
+
+
+class ListenerDelta(object):
+    """A listener a step added to a channel.
+
+    Parameters
+    ----------
+    channel : Channel
+        The channel listened to.
+    listener : callable
+        The added listener, see Channel.addListener.
+
+    """
+
+    __slots__ = ('channel', 'listener')
+
+    def __init__(self, channel, listener):
+        self.channel = channel
+        self.listener = listener
+
+    def undo(self):
+        self.channel.removeListener(self.listener)
+
+    def redo(self):
+        self.channel.addListener(self.listener)
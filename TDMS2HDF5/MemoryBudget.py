@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" A limit on the memory taken by the data of the channels.
+
+With several files open, or many derived channels, the channel data can grow
+until the process swaps. A MemoryBudget keeps track of how much data the
+channels of one or more registries hold in memory and in which order it was
+accessed. Once the data exceeds the budget, the least recently used channels
+are spilled to scratch files, see Channel.spill, and read back the next time
+their data is accessed.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import threading
+from collections import OrderedDict
+
+
+class MemoryBudget(object):
+    """A least recently used limit on the channel data held in memory.
+
+    The channels report every access of their data and every change of it to
+    the budget. The budget can be shared by the registries of several files.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        The channels' data in memory is kept below this many bytes. None
+        only keeps track of the data without spilling any.
+    scratch_dir : str, optional
+        The directory for the scratch files of spilled data. Defaults to the
+        system's temporary directory.
+
+    Attributes
+    ----------
+    max_bytes : int
+        The maximum number of bytes of channel data in memory.
+    scratch_dir : str
+        The directory for the scratch files of spilled data.
+    hits : int
+        The number of accesses of data that was in memory.
+    misses : int
+        The number of accesses that had to read the data first, from its
+        file, a scratch file or by calculating it.
+    spills : int
+        The number of times a channel's data was spilled.
+
+    Methods
+    -------
+    add(chan : Channel)
+        Keep track of the data of a channel.
+    remove(chan : Channel)
+        Stop keeping track of the data of a channel.
+    accessed(chan : Channel, read : bool)
+        Record an access of a channel's data.
+    changed(chan : Channel)
+        Record that a channel's data was replaced or has grown.
+    enforce(keep : Channel)
+        Spill the least recently used data until it fits the budget.
+    getUsage()
+        Return the memory used and the counters (dict).
+
+    """
+
+    def __init__(self, max_bytes=None, scratch_dir=None):
+        super(MemoryBudget, self).__init__()
+
+        self.max_bytes = max_bytes
+        self.scratch_dir = scratch_dir
+        self.hits = 0
+        self.misses = 0
+        self.spills = 0
+
+        # The bytes in memory of the channels holding any, least recently
+        # used first, and the bytes in scratch files of the spilled channels
+        self._resident = OrderedDict()
+        self._spilled = {}
+        self._used = 0
+        self._lock = threading.RLock()
+
+    def add(self, chan):
+        """Keep track of the data of a channel.
+
+        Parameters
+        ----------
+        chan : Channel
+            The channel, which reports to the budget from now on.
+
+        """
+        with self._lock:
+            chan._budget = self
+            self.changed(chan)
+
+    def remove(self, chan):
+        """Stop keeping track of the data of a channel."""
+        with self._lock:
+            if chan._budget is self:
+                chan._budget = None
+            self._used -= self._resident.pop(chan, 0)
+            self._spilled.pop(chan, None)
+
+    def _update(self, chan):
+        """Record the bytes of a channel, in memory as most recently used."""
+        nbytes = chan.getResidentBytes()
+        self._used += nbytes - self._resident.pop(chan, 0)
+        if nbytes:
+            self._resident[chan] = nbytes
+        spilled = chan.getSpilledBytes()
+        if spilled:
+            self._spilled[chan] = spilled
+        else:
+            self._spilled.pop(chan, None)
+
+    def accessed(self, chan, read):
+        """Record an access of a channel's data.
+
+        Parameters
+        ----------
+        chan : Channel
+            The accessed channel.
+        read : bool
+            Whether the data had to be read first.
+
+        """
+        with self._lock:
+            if read:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self._update(chan)
+            self.enforce(chan)
+
+    def changed(self, chan):
+        """Record that a channel's data was replaced or has grown."""
+        with self._lock:
+            self._update(chan)
+            self.enforce(chan)
+
+    def enforce(self, keep=None):
+        """Spill the least recently used data until it fits the budget.
+
+        Data that can not be spilled, see Channel.spill, is passed over.
+
+        Parameters
+        ----------
+        keep : Channel, optional
+            A channel whose data is not spilled, e.g. the one just accessed.
+            Its data stays in memory even if it exceeds the budget alone.
+
+        """
+        if self.max_bytes is None:
+            return
+
+        with self._lock:
+            for chan in list(self._resident):
+                if self._used <= self.max_bytes:
+                    break
+                if chan is keep:
+                    continue
+                # Data that was handed out is spilled without freeing memory
+                resident = chan.getResidentBytes()
+                chan.spill(self.scratch_dir)
+                if chan.getResidentBytes() < resident:
+                    self.spills += 1
+                # The data may have changed without the channel reporting it,
+                # e.g. when a processing step was undone
+                self._update(chan)
+                if chan in self._resident:
+                    self._resident.move_to_end(chan, last=False)
+
+    def getUsage(self):
+        """Return the memory used and the counters.
+
+        Returns
+        -------
+        dict
+            'max_bytes', the bytes of channel data in memory 'used_bytes' and
+            in scratch files 'spilled_bytes', the number of channels with
+            data in memory 'channels' and spilled 'spilled_channels', and
+            'hits', 'misses' and 'spills'.
+
+        """
+        with self._lock:
+            return {'max_bytes': self.max_bytes, 'used_bytes': self._used,
+                    'spilled_bytes': sum(self._spilled.values()),
+                    'channels': len(self._resident),
+                    'spilled_channels': len(self._spilled),
+                    'hits': self.hits, 'misses': self.misses,
+                    'spills': self.spills}
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" A persistent cache for the meta data of TDMS files.
+
+Parsing the segment headers of a large TDMS file can take a while. The
+MetadataCache keeps the parsed structure of recently opened files on disk so
+that opening the same, unchanged file again skips the parsing entirely.
+
+The entries are pickles, so the cache is only used if its directory belongs
+to the user and nobody else can write to it.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import stat
+import pickle
+import hashlib
+import tempfile
+
+# Entries written with a different version are ignored
+CACHE_VERSION = 4
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tdms2hdf5')
+
+# The default upper limit of the cache size on disk in bytes
+MAX_CACHE_BYTES = 256 * 2**20
+
+CACHE_EXTENSION = '.meta'
+
+
+class MetadataCache(object):
+    """A least recently used cache of TDMS meta data on disk.
+
+    Each entry is keyed by the absolute path of the TDMS file and remembers
+    the file's size and modification time. An entry is only used if neither
+    has changed since, i.e. it is invalidated as soon as the file grows or is
+    rewritten.
+
+    The cache directory is created readable and writable by the user only.
+    If it belongs to somebody else or others can write to it, nothing is
+    loaded from or stored in it.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        The directory where the entries are stored.
+    max_bytes : int, optional
+        The size of all entries together is kept below this limit by removing
+        the least recently used entries.
+
+    Attributes
+    ----------
+    cache_dir : str
+        The directory where the entries are stored.
+    max_bytes : int
+        The maximum size of all entries together in bytes.
+    hits : int
+        The number of successful look ups.
+    misses : int
+        The number of failed look ups.
+
+    Methods
+    -------
+    load(filename : str)
+        Return the cached meta data of a file or None.
+    store(filename : str, metadata : object)
+        Store the meta data of a file.
+    evict()
+        Remove the least recently used entries until the cache fits.
+    clear()
+        Remove all entries.
+
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        super(MetadataCache, self).__init__()
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _entryName(self, filename):
+        """Return the path of the cache entry of a TDMS file."""
+        key = hashlib.sha1(os.path.abspath(filename).encode('utf-8'))
+        return os.path.join(self.cache_dir, key.hexdigest() + CACHE_EXTENSION)
+
+    def _fileKey(self, filename):
+        """Return what identifies the current state of a TDMS file."""
+        status = os.stat(filename)
+        return (CACHE_VERSION, os.path.abspath(filename), status.st_size,
+                status.st_mtime)
+
+    def _isPrivate(self):
+        """Return whether only the user can write to the cache directory."""
+        try:
+            status = os.stat(self.cache_dir)
+        except OSError:
+            return False
+        if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+            return False
+        return (stat.S_ISDIR(status.st_mode) and
+                not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+    def _remove(self, path):
+        """Remove an entry, which another process may have removed already."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def load(self, filename):
+        """Return the cached meta data of a file.
+
+        Parameters
+        ----------
+        filename : str
+            The absolute path of the TDMS file.
+
+        Returns
+        -------
+        object or None
+            The stored meta data, or None if there is no valid entry.
+
+        """
+        entryName = self._entryName(filename)
+        if not self._isPrivate():
+            self.misses += 1
+            return None
+
+        # The key is a header of plain values, checked before the meta data
+        # is unpickled, so that entries of other versions are never loaded
+        try:
+            with open(entryName, 'rb') as entry:
+                key = pickle.load(entry)
+                if key == self._fileKey(filename):
+                    metadata = pickle.load(entry)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except Exception:
+            # A broken entry, or one pickled by other code
+            key = None
+
+        if key != self._fileKey(filename):
+            # The file has changed since the entry was written
+            self._remove(entryName)
+            self.misses += 1
+            return None
+
+        # Mark the entry as recently used, unless it was evicted meanwhile
+        try:
+            os.utime(entryName, None)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+
+        return metadata
+
+    def store(self, filename, metadata):
+        """Store the meta data of a file.
+
+        Parameters
+        ----------
+        filename : str
+            The absolute path of the TDMS file.
+        metadata : object
+            The picklable meta data.
+
+        """
+        if not os.path.exists(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir, mode=0o700)
+            except FileExistsError:
+                pass
+        if not self._isPrivate():
+            return
+
+        (handle, tmpName) = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(handle, 'wb') as entry:
+            pickle.dump(self._fileKey(filename), entry,
+                        pickle.HIGHEST_PROTOCOL)
+            pickle.dump(metadata, entry, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpName, self._entryName(filename))
+
+        self.evict()
+
+    def _entries(self):
+        """Return (last use, size, path) of all entries, oldest first."""
+        if not os.path.exists(self.cache_dir):
+            return []
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_EXTENSION):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by another process in the meantime
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits."""
+        entries = self._entries()
+        total = sum(size for (_, size, _) in entries)
+
+        for (_, size, path) in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove all entries."""
+        for (_, _, path) in self._entries():
+            self._remove(path)
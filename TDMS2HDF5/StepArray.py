@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Step encoded arrays for slowly changing channels.
+
+Channels like the magnet field during a hold or the set points of a
+temperature controller are recorded at the rate of the fast channels, so that
+most of their values repeat the one before. A StepArray only stores the index
+and value of every change and expands them into the full array on request.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import itertools
+
+import numpy as np
+
+# A channel is step encoded if it has at most this many steps per value
+STEP_RATIO = 0.01
+
+# Arrays whose first SAMPLE_LENGTH values already have more steps than that
+# are not step encoded
+SAMPLE_LENGTH = 1 << 16
+
+
+def _differs(values, previous):
+    """Return where values differ from previous, NaNs equal each other."""
+    differs = values != previous
+    if values.dtype.kind in 'fc':
+        differs &= ~(np.isnan(values) & np.isnan(previous))
+    return differs
+
+
+def _encode(chunks, length, ratio):
+    """Step encode consecutive parts until there are too many steps.
+
+    Returns the steps of the values encoded and None if all parts were
+    encoded, or the rest of the part at which the encoding gave up.
+
+    """
+    maxSteps = max(1, int(ratio * length))
+    steps = None
+
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        if steps is None:
+            steps = StepArray(dtype=chunk.dtype)
+            # Decide from a sample of the first values before encoding the
+            # rest of a part that may be the whole array
+            steps.append(chunk[:SAMPLE_LENGTH])
+            if (len(steps) == SAMPLE_LENGTH and
+                    len(steps.values) > ratio * SAMPLE_LENGTH):
+                return (steps, chunk[SAMPLE_LENGTH:])
+            chunk = chunk[SAMPLE_LENGTH:]
+        steps.append(chunk)
+        if len(steps.values) > maxSteps:
+            return (steps, chunk[:0])
+
+    return (steps, None)
+
+
+def step_encode(chunks, length, ratio=STEP_RATIO):
+    """Step encode an array given as consecutive parts, if it pays off.
+
+    The encoding stops as soon as there are too many steps, or once the first
+    SAMPLE_LENGTH values have more than ratio steps per value, so that an
+    array that does not qualify is only read up to that point.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Consecutive parts of the array, e.g. [array].
+    length : int
+        The length of the whole array.
+    ratio : float, optional
+        The maximum number of steps per value.
+
+    Returns
+    -------
+    StepArray or None
+        None if the array is empty or has too many steps.
+
+    """
+    (steps, rest) = _encode(chunks, length, ratio)
+    if rest is not None or steps is None or not len(steps):
+        return None
+    return steps
+
+
+def step_encode_stream(chunks, length, chunk_length, ratio=STEP_RATIO):
+    """Step encode an array given as consecutive parts, or pass them on.
+
+    Like step_encode, but for reading the parts only once: if the array does
+    not qualify, the parts read so far are expanded from their steps instead
+    of being read again.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Consecutive parts of the array.
+    length : int
+        The length of the whole array.
+    chunk_length : int
+        The number of values in each part expanded from the steps.
+    ratio : float, optional
+        The maximum number of steps per value.
+
+    Returns
+    -------
+    tuple
+        (StepArray, None) if the array is step encoded, otherwise (None,
+        iterator) with an iterator over all parts of the array.
+
+    """
+    chunks = iter(chunks)
+    (steps, rest) = _encode(chunks, length, ratio)
+    if rest is None:
+        if steps is None or not len(steps):
+            return (None, iter(()))
+        return (steps, None)
+
+    return (None, itertools.chain(steps.iterChunks(chunk_length),
+                                  [rest] if len(rest) else [], chunks))
+
+
+class StepArray(object):
+    """A one dimensional array stored as the values where it changes.
+
+    Parameters
+    ----------
+    indices : numpy.ndarray, optional
+        The index of the first value of each step, starting with 0.
+    values : numpy.ndarray, optional
+        The value of each step.
+    length : int, optional
+        The length of the array.
+    dtype : numpy.dtype, optional
+        The dtype of an empty array.
+
+    Attributes
+    ----------
+    indices : numpy.ndarray
+        The index of the first value of each step.
+    values : numpy.ndarray
+        The value of each step.
+    dtype : numpy.dtype
+        The dtype of the values.
+
+    Methods
+    -------
+    append(values : numpy.ndarray)
+        Append values to the end of the array.
+    read(start : int, stop : int)
+        Return a range of the expanded array.
+    iterChunks(chunk_length : int)
+        Iterate over the expanded array in chunks.
+    toArray()
+        Return the expanded array.
+
+    """
+
+    __slots__ = ('indices', 'values', 'dtype', '_length')
+
+    def __init__(self, indices=None, values=None, length=0, dtype=None):
+        super(StepArray, self).__init__()
+
+        if values is None:
+            values = np.empty(0, np.float64 if dtype is None else dtype)
+        self.values = np.asarray(values)
+        self.dtype = self.values.dtype
+        self.indices = np.asarray([] if indices is None else indices,
+                                  dtype=np.int64)
+        self._length = int(length)
+
+    def __len__(self):
+        return self._length
+
+    def append(self, values):
+        """Append values to the end of the array.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            The values to append.
+
+        """
+        values = np.asarray(values)
+        if not len(values):
+            return
+
+        starts = np.flatnonzero(_differs(values[1:], values[:-1])) + 1
+        if not self._length or _differs(values[:1], self.values[-1:])[0]:
+            starts = np.concatenate(([0], starts))
+
+        self.indices = np.concatenate((self.indices, starts + self._length))
+        self.values = np.concatenate((self.values, values[starts]))
+        self.dtype = self.values.dtype
+        self._length += len(values)
+
+    def read(self, start=0, stop=None):
+        """Return a range of the expanded array.
+
+        Parameters
+        ----------
+        start : int, optional
+            The index of the first value.
+        stop : int, optional
+            The index after the last value. Defaults to the length.
+
+        Returns
+        -------
+        numpy.ndarray
+
+        """
+        (start, stop, _) = slice(start, stop).indices(self._length)
+        if stop <= start:
+            return np.empty(0, self.dtype)
+
+        first = np.searchsorted(self.indices, start, 'right') - 1
+        last = np.searchsorted(self.indices, stop, 'left')
+        bounds = np.maximum(self.indices[first:last], start)
+        counts = np.diff(np.append(bounds, stop))
+
+        return np.repeat(self.values[first:last], counts)
+
+    def iterChunks(self, chunk_length):
+        """Iterate over the expanded array in chunks.
+
+        Parameters
+        ----------
+        chunk_length : int
+            The number of values in each chunk.
+
+        Yields
+        ------
+        numpy.ndarray
+            Consecutive parts of the expanded array.
+
+        """
+        for start in range(0, self._length, chunk_length):
+            yield self.read(start, start + chunk_length)
+
+    def toArray(self):
+        """Return the expanded array."""
+        return self.read()
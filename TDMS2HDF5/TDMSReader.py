@@ -0,0 +1,1022 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" A segment-level reader for TDMS files.
+
+The TDMSReader only parses the lead-in and meta data of each segment when it is
+created. From that it builds a table of where each channel's raw data lives in
+the file, so that the data of a single channel (or a part of it) can be read
+later without touching the data of any other channel.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from nptdms import TdmsFile
+
+# Bits of the table of contents mask in the lead-in of each segment
+TOC_META_DATA = 1 << 1
+TOC_NEW_OBJ_LIST = 1 << 2
+TOC_RAW_DATA = 1 << 3
+TOC_INTERLEAVED_DATA = 1 << 5
+TOC_BIG_ENDIAN = 1 << 6
+TOC_DAQMX_RAW_DATA = 1 << 7
+
+LEAD_IN_LENGTH = 28
+
+SEGMENT_TAG = b'TDSm'
+INDEX_TAG = b'TDSh'
+INDEX_EXTENSION = '_index'
+
+NO_RAW_DATA = 0xFFFFFFFF
+SAME_RAW_DATA_INDEX = 0x00000000
+DAQMX_RAW_DATA_INDICES = (0x69120000, 0x69130000)
+INCOMPLETE_SEGMENT = 0xFFFFFFFFFFFFFFFF
+
+TDS_STRING = 0x20
+TDS_BOOLEAN = 0x21
+TDS_TIMESTAMP = 0x44
+
+# The TDMS data type codes and the corresponding numpy type strings (without
+# the byte order character)
+TDS_TYPES = {0x01: 'i1', 0x02: 'i2', 0x03: 'i4', 0x04: 'i8',
+             0x05: 'u1', 0x06: 'u2', 0x07: 'u4', 0x08: 'u8',
+             0x09: 'f4', 0x0A: 'f8', 0x19: 'f4', 0x1A: 'f8',
+             0x08000C: 'c8', 0x10000D: 'c16', TDS_BOOLEAN: 'u1'}
+
+TDMS_EPOCH = np.datetime64('1904-01-01T00:00:00', 'us')
+
+# The default number of values read at a time when streaming channel data
+CHUNK_LENGTH = 1 << 20
+
+# The default number of values in the preview of a channel
+PREVIEW_POINTS = 10000
+
+
+class UnsupportedTDMSError(ValueError):
+    """Raised for the parts of a TDMS file the TDMSReader can not index.
+
+    E.g. DAQmx raw data or extended precision values. Such files are read
+    with npTDMS instead, see NpTDMSReader.
+
+    """
+
+
+def tds_dtype(type_code, endianness='<'):
+    """Return the numpy dtype of a TDMS data type code.
+
+    Parameters
+    ----------
+    type_code : int
+        The TDMS data type code.
+    endianness : str
+        '<' for little-endian and '>' for big-endian data.
+
+    Returns
+    -------
+    numpy.dtype
+        The dtype of one value of the data type.
+
+    """
+    if type_code == TDS_TIMESTAMP:
+        return np.dtype([('fraction', endianness + 'u8'),
+                         ('seconds', endianness + 'i8')])
+    try:
+        return np.dtype(endianness + TDS_TYPES[type_code])
+    except KeyError:
+        raise UnsupportedTDMSError('Unsupported TDMS data type {0:#x}'
+                                   .format(type_code))
+
+
+def timestamp_to_datetime64(seconds, fraction):
+    """Convert a TDMS timestamp into a numpy.datetime64.
+
+    TDMS timestamps are the seconds since 1904-01-01 00:00 UTC plus a
+    fraction of a second in units of 2^-64 s.
+
+    """
+    fraction = np.right_shift(np.asarray(fraction, dtype='u8'),
+                              np.uint64(44)).astype('i8')
+    micro_seconds = (np.asarray(seconds, dtype='i8') * 1000000 +
+                     fraction * 1000000 // (1 << 20))
+    return TDMS_EPOCH + micro_seconds.astype('timedelta64[us]')
+
+
+def scratch_memmap(dtype, length, scratch_dir=None):
+    """Return a writable memory map backed by an anonymous scratch file.
+
+    The scratch file is deleted by the operating system as soon as the map is
+    no longer used.
+
+    Parameters
+    ----------
+    dtype : numpy.dtype
+        The data type of the values.
+    length : int
+        The number of values.
+    scratch_dir : str, optional
+        The directory for the scratch file. Defaults to the system's temporary
+        directory.
+
+    """
+    return np.memmap(tempfile.TemporaryFile(dir=scratch_dir), dtype=dtype,
+                     mode='w+', shape=(length,))
+
+
+class _SegmentObject(object):
+    """The raw data index of one object in one segment."""
+
+    def __init__(self, path, type_code=None, number_values=0, data_size=0):
+        self.path = path
+        self.type_code = type_code
+        self.number_values = number_values
+        self.data_size = data_size
+
+    def copy(self):
+        return _SegmentObject(self.path, self.type_code, self.number_values,
+                              self.data_size)
+
+
+class ChannelIndex(object):
+    """Where the raw data of one channel is located in the TDMS file.
+
+    The data of a channel is spread over a number of blocks. Each block is a
+    run of values starting at a byte offset in the file. Within a block the
+    values are either contiguous or, for interleaved segments, separated by a
+    fixed byte stride.
+
+    Attributes
+    ----------
+    path : str
+        The TDMS path of the channel, e.g. "/'ADWin'/'ISample'"
+    dtype : numpy.dtype
+        The data type of the channel's values in the file. For strings the
+        type of the offsets that precede them.
+    strings : bool
+        Whether the channel's values are strings. Each of their blocks is
+        the raw data of one segment, the end offsets of the strings followed
+        by the strings.
+    offsets : list
+        The byte offset of each block in the data file.
+    counts : list
+        The number of values in each block.
+    strides : list
+        The number of bytes between two values of each block.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.dtype = None
+        self.strings = False
+        self.offsets = []
+        self.counts = []
+        self.strides = []
+        self.length = 0
+
+    def addBlock(self, offset, count, stride):
+        """Append a block of values to the channel."""
+        if count == 0:
+            return
+        # Merge with the previous block if the new values follow directly
+        if (self.counts and stride == self.dtype.itemsize and
+                self.strides[-1] == stride and
+                self.offsets[-1] + self.counts[-1] * stride == offset):
+            self.counts[-1] += count
+        else:
+            self.offsets.append(offset)
+            self.counts.append(count)
+            self.strides.append(stride)
+        self.length += count
+
+    def truncate(self, length):
+        """Drop the values after the first length values of the channel."""
+        while self.counts and self.length - self.counts[-1] >= length:
+            self.length -= self.counts.pop()
+            self.offsets.pop()
+            self.strides.pop()
+        if self.length > length:
+            self.counts[-1] -= self.length - length
+            self.length = length
+
+    def isContiguous(self):
+        """Return whether all of the values lie in one contiguous block."""
+        return (len(self.counts) <= 1 and
+                all(s == self.dtype.itemsize for s in self.strides))
+
+
+class TDMSReader(object):
+    """Read the structure of a TDMS file and the data of single channels.
+
+    Only the lead-in and meta data of the segments are parsed when the reader
+    is created, from the .tdms_index file if there is one. Channel data is
+    read on request with readChannel.
+
+    Parameters
+    ----------
+    filename : str
+        The absolute path of the TDMS file.
+    cache : MetadataCache, optional
+        A cache of previously parsed meta data. If it holds a valid entry for
+        the file, the file's segments are not parsed again.
+
+    Attributes
+    ----------
+    filename : str
+        The absolute path of the TDMS file.
+    properties : OrderedDict
+        The properties of every object in the file, keyed by the object path.
+        The root object's path is '/'.
+    channels : OrderedDict
+        A ChannelIndex for every channel with raw data, keyed by the channel
+        path.
+
+    Methods
+    -------
+    groups()
+        Return the paths of the groups in the file.
+    groupChannels(group : str)
+        Return the paths of the channels of a group.
+    channelLength(path : str)
+        Return the number of values of a channel.
+    readChannel(path : str, start : int, stop : int)
+        Read the values of a channel.
+    iterChannel(path : str, start : int, stop : int, chunk_length : int)
+        Read the values of a channel chunk by chunk.
+    mapChannel(path : str, scratch_dir : str, start : int, stop : int)
+        Return a read-only memory map of a channel's values.
+    previewChannel(path : str, points : int, method : str, start : int,
+                   stop : int)
+        Read a decimated subset of a channel's values.
+    update()
+        Index the segments appended to the file since it was last read.
+
+    """
+
+    def __init__(self, filename, cache=None):
+        super(TDMSReader, self).__init__()
+
+        self.filename = filename
+        self.properties = OrderedDict()
+        self.channels = OrderedDict()
+
+        self._objects = []
+        self._lastIndex = {}
+        # The position in the data file up to which the segments were read
+        self._dataPosition = 0
+        # The state before the last segment, if that was still being written
+        self._resume = None
+
+        cached = cache.load(filename) if cache is not None else None
+
+        if cached is not None:
+            # Take over the parsed structure of the cached reader
+            self.__dict__.update(cached.__dict__)
+            self.filename = filename
+        else:
+            self._readMetadata()
+            if cache is not None:
+                cache.store(filename, self)
+
+    def _readMetadata(self):
+        """Walk through all segments of the file and index the raw data.
+
+        If LabVIEW wrote a .tdms_index file next to the TDMS file, the
+        segment meta data is read from the compact index file instead of
+        seeking through the data file. Segments appended to the data file
+        after the index file was written are read from the data file.
+
+        """
+        file_size = os.path.getsize(self.filename)
+        index_name = self.filename + INDEX_EXTENSION
+        data_position = 0
+
+        if os.path.exists(index_name):
+            with open(index_name, 'rb') as index_file:
+                if index_file.read(4) == INDEX_TAG:
+                    index_size = os.path.getsize(index_name)
+                    position = 0
+                    while (position + LEAD_IN_LENGTH <= index_size and
+                           data_position + LEAD_IN_LENGTH <= file_size):
+                        index_file.seek(position)
+                        (position, data_position) = self._readSegment(
+                            index_file, position, data_position, file_size,
+                            INDEX_TAG)
+
+        self._readDataFile(data_position, file_size)
+
+    def _readDataFile(self, data_position, file_size):
+        """Read the segments of the data file from data_position on."""
+
+        with open(self.filename, 'rb') as tdms_file:
+            while data_position + LEAD_IN_LENGTH <= file_size:
+                tdms_file.seek(data_position)
+                (data_position, _) = self._readSegment(
+                    tdms_file, data_position, data_position, file_size)
+
+        self._dataPosition = data_position
+
+    def update(self):
+        """Index the segments appended to the file since it was last read.
+
+        A segment LabVIEW was still writing when the file was last read is
+        read again from its start, all other segments are left alone.
+
+        Returns
+        -------
+        OrderedDict
+            The previous and the new number of values, keyed by the path of
+            every channel that has grown.
+
+        """
+        previous = OrderedDict((path, channel.length)
+                               for (path, channel) in self.channels.items())
+        data_position = self._dataPosition
+
+        if self._resume is not None:
+            (data_position, self._objects, self._lastIndex,
+             lengths) = self._resume
+            for path in list(self.channels.keys()):
+                if path in lengths:
+                    self.channels[path].truncate(lengths[path])
+                else:
+                    del self.channels[path]
+            self._resume = None
+
+        self._readDataFile(data_position, os.path.getsize(self.filename))
+
+        grown = OrderedDict()
+        for (path, channel) in self.channels.items():
+            if channel.length != previous.get(path, 0):
+                grown[path] = (previous.get(path, 0), channel.length)
+        return grown
+
+    def _readSegment(self, segment_file, position, data_position, file_size,
+                     tag=SEGMENT_TAG):
+        """Read the lead-in and meta data of a segment.
+
+        Parameters
+        ----------
+        segment_file : file
+            The data or index file, positioned at the segment's lead-in.
+        position : int
+            The position of the lead-in in segment_file.
+        data_position : int
+            The position of the segment in the data file.
+        file_size : int
+            The size of the data file.
+        tag : bytes
+            The tag the lead-in has to start with.
+
+        Returns
+        -------
+        tuple
+            The positions of the next segment in segment_file and in the data
+            file.
+
+        """
+        lead_in = segment_file.read(LEAD_IN_LENGTH)
+        if lead_in[:4] != tag:
+            raise ValueError('Segment at byte {0} of {1} is not a TDMS '
+                             'segment'.format(position, segment_file.name))
+
+        toc = struct.unpack('<i', lead_in[4:8])[0]
+        endianness = '>' if toc & TOC_BIG_ENDIAN else '<'
+        (next_offset, raw_data_offset) = struct.unpack(endianness + 'QQ',
+                                                       lead_in[12:28])
+
+        raw_data_position = data_position + LEAD_IN_LENGTH + raw_data_offset
+
+        if next_offset == INCOMPLETE_SEGMENT:
+            next_data_position = file_size
+        else:
+            next_data_position = data_position + LEAD_IN_LENGTH + next_offset
+
+        if (next_offset == INCOMPLETE_SEGMENT or
+                next_data_position > file_size):
+            # LabVIEW may still be writing this segment, remember the state
+            # before it so that update can read it again once it is complete
+            self._resume = (data_position, list(self._objects),
+                            dict(self._lastIndex),
+                            dict((path, channel.length) for (path, channel)
+                                 in self.channels.items()))
+            next_data_position = file_size
+            if raw_data_position > file_size:
+                # Not even the meta data has been written yet
+                return (next_data_position, next_data_position)
+
+        if toc & TOC_META_DATA:
+            metadata = segment_file.read(raw_data_offset)
+            self._readObjects(metadata, endianness, toc & TOC_NEW_OBJ_LIST)
+
+        if toc & TOC_RAW_DATA:
+            if toc & TOC_DAQMX_RAW_DATA:
+                raise UnsupportedTDMSError('DAQmx raw data is not supported')
+            self._indexRawData(raw_data_position, next_data_position,
+                               endianness, toc & TOC_INTERLEAVED_DATA)
+
+        if tag == INDEX_TAG:
+            next_position = position + LEAD_IN_LENGTH + raw_data_offset
+        else:
+            next_position = next_data_position
+
+        return (next_position, next_data_position)
+
+    def _readObjects(self, metadata, endianness, new_object_list):
+        """Parse the object list of a segment's meta data."""
+
+        if new_object_list:
+            objects = []
+        else:
+            objects = [o.copy() for o in self._objects]
+        object_positions = dict((o.path, i) for i, o in enumerate(objects))
+
+        unpack_from = struct.unpack_from
+
+        number_objects = unpack_from(endianness + 'I', metadata, 0)[0]
+        offset = 4
+
+        for _ in range(number_objects):
+            (path, offset) = self._readString(metadata, offset, endianness)
+            index_length = unpack_from(endianness + 'I', metadata, offset)[0]
+            offset += 4
+
+            if index_length == NO_RAW_DATA:
+                segment_object = _SegmentObject(path)
+            elif index_length == SAME_RAW_DATA_INDEX:
+                segment_object = self._lastIndex[path].copy()
+            elif index_length in DAQMX_RAW_DATA_INDICES:
+                raise UnsupportedTDMSError('DAQmx raw data is not supported')
+            else:
+                (type_code, _, number_values) = unpack_from(
+                    endianness + 'IIQ', metadata, offset)
+                # The index length is not always right for strings, e.g. in
+                # files written by npTDMS, so the index is read by its type
+                if type_code == TDS_STRING:
+                    data_size = unpack_from(endianness + 'Q', metadata,
+                                            offset + 16)[0]
+                    offset += 24
+                else:
+                    data_size = (number_values *
+                                 tds_dtype(type_code).itemsize)
+                    offset += 16
+                segment_object = _SegmentObject(path, type_code,
+                                                number_values, data_size)
+
+            if index_length != NO_RAW_DATA:
+                self._lastIndex[path] = segment_object
+
+            if path in object_positions:
+                objects[object_positions[path]] = segment_object
+            elif index_length != NO_RAW_DATA:
+                object_positions[path] = len(objects)
+                objects.append(segment_object)
+
+            (properties, offset) = self._readProperties(metadata, offset,
+                                                        endianness)
+            self.properties.setdefault(path, OrderedDict()).update(properties)
+
+        self._objects = objects
+
+    def _indexRawData(self, start, end, endianness, interleaved):
+        """Add the raw data blocks of a segment to the channel indices."""
+
+        objects = [o for o in self._objects if o.number_values > 0]
+        chunk_size = sum(o.data_size for o in objects)
+
+        if chunk_size == 0 or end <= start:
+            return
+
+        for segment_object in objects:
+            if segment_object.path not in self.channels:
+                self.channels[segment_object.path] = \
+                    ChannelIndex(segment_object.path)
+            channel = self.channels[segment_object.path]
+            if channel.dtype is None:
+                channel.strings = segment_object.type_code == TDS_STRING
+                channel.dtype = tds_dtype(
+                    0x07 if channel.strings else segment_object.type_code,
+                    endianness)
+
+        number_chunks = (end - start) // chunk_size
+        remainder = (end - start) % chunk_size
+
+        if interleaved:
+            if any(o.type_code == TDS_STRING for o in objects):
+                raise UnsupportedTDMSError('Interleaved strings are not '
+                                           'supported')
+            row_width = sum(self.channels[o.path].dtype.itemsize
+                            for o in objects)
+            rows = (end - start) // row_width
+            column = 0
+            for segment_object in objects:
+                channel = self.channels[segment_object.path]
+                channel.addBlock(start + column, rows, row_width)
+                column += channel.dtype.itemsize
+            return
+
+        for chunk in range(number_chunks + (1 if remainder else 0)):
+            position = start + chunk * chunk_size
+            available = chunk_size if chunk < number_chunks else remainder
+            for segment_object in objects:
+                channel = self.channels[segment_object.path]
+                size = min(segment_object.data_size, available)
+                if channel.strings:
+                    # Only complete strings, they are not read in parts
+                    if size == segment_object.data_size:
+                        channel.addBlock(position,
+                                         segment_object.number_values, 0)
+                else:
+                    channel.addBlock(position,
+                                     size // channel.dtype.itemsize,
+                                     channel.dtype.itemsize)
+                position += segment_object.data_size
+                available -= size
+
+    def _readString(self, buf, offset, endianness):
+        """Read a length prefixed string from buf."""
+        length = struct.unpack_from(endianness + 'I', buf, offset)[0]
+        offset += 4
+        value = bytes(buf[offset:offset + length]).decode('utf-8')
+        return (value, offset + length)
+
+    def _readProperties(self, buf, offset, endianness):
+        """Read the properties of an object from the meta data."""
+
+        properties = OrderedDict()
+        number_properties = struct.unpack_from(endianness + 'I', buf,
+                                               offset)[0]
+        offset += 4
+
+        for _ in range(number_properties):
+            (name, offset) = self._readString(buf, offset, endianness)
+            type_code = struct.unpack_from(endianness + 'I', buf, offset)[0]
+            offset += 4
+
+            if type_code == TDS_STRING:
+                (value, offset) = self._readString(buf, offset, endianness)
+            elif type_code == TDS_TIMESTAMP:
+                (fraction, seconds) = struct.unpack_from(endianness + 'Qq',
+                                                         buf, offset)
+                value = timestamp_to_datetime64(seconds, fraction)
+                offset += 16
+            else:
+                dtype = tds_dtype(type_code, endianness)
+                value = np.frombuffer(buf, dtype, 1, offset)[0].item()
+                if type_code == TDS_BOOLEAN:
+                    value = bool(value)
+                offset += dtype.itemsize
+
+            properties[name] = value
+
+        return (properties, offset)
+
+    def groups(self):
+        """Return the paths of the groups in the file.
+
+        Returns
+        -------
+        list
+            The group paths, e.g. "/'ADWin'", in the order they appear in the
+            file.
+
+        """
+        groups = []
+        for path in list(self.properties.keys()) + list(self.channels.keys()):
+            components = path.split('/')
+            if len(components) > 1 and components[1]:
+                group = '/' + components[1]
+                if group not in groups:
+                    groups.append(group)
+        return groups
+
+    def groupChannels(self, group):
+        """Return the paths of the channels in a group.
+
+        Parameters
+        ----------
+        group : str
+            The path of the group, e.g. "/'ADWin'"
+
+        Returns
+        -------
+        list
+            The paths of the group's channels.
+
+        """
+        prefix = group + '/'
+        channels = [p for p in self.properties.keys() if p.startswith(prefix)]
+        channels += [p for p in self.channels.keys()
+                     if p.startswith(prefix) and p not in channels]
+        return channels
+
+    def channelLength(self, path):
+        """Return the number of values stored for a channel."""
+        try:
+            return self.channels[path].length
+        except KeyError:
+            return 0
+
+    def _blockRanges(self, channel, start, stop):
+        """Yield the (offset, count, stride) of the values in [start, stop)."""
+
+        block_start = 0
+        for (offset, count, stride) in zip(channel.offsets, channel.counts,
+                                           channel.strides):
+            block_stop = block_start + count
+            if block_stop > start and block_start < stop:
+                first = max(start, block_start) - block_start
+                last = min(stop, block_stop) - block_start
+                yield (offset + first * stride, last - first, stride)
+            block_start = block_stop
+            if block_start >= stop:
+                break
+
+    def readChannel(self, path, start=0, stop=None):
+        """Read the values of a channel into memory.
+
+        Parameters
+        ----------
+        path : str
+            The TDMS path of the channel.
+        start : int, optional
+            The index of the first value to read.
+        stop : int, optional
+            The index after the last value to read. Defaults to the length of
+            the channel.
+
+        Returns
+        -------
+        numpy.ndarray
+            The channel's data in native byte order.
+
+        """
+        try:
+            channel = self.channels[path]
+        except KeyError:
+            return np.array([])
+
+        if stop is None or stop > channel.length:
+            stop = channel.length
+
+        if channel.strings:
+            return self._readStrings(channel, start, stop)
+
+        dtype = channel.dtype.newbyteorder('=')
+        data = np.empty(max(stop - start, 0), dtype=dtype)
+
+        with open(self.filename, 'rb') as tdms_file:
+            filled = 0
+            for (offset, count, stride) in self._blockRanges(channel, start,
+                                                             stop):
+                values = self._readBlock(tdms_file, channel.dtype, offset,
+                                         count, stride)
+                data[filled:filled + count] = values
+                filled += count
+
+        if dtype.names is not None:
+            return timestamp_to_datetime64(data['seconds'], data['fraction'])
+
+        return data
+
+    def iterChannel(self, path, start=0, stop=None, chunk_length=CHUNK_LENGTH):
+        """Read the values of a channel chunk by chunk.
+
+        Parameters
+        ----------
+        path : str
+            The TDMS path of the channel.
+        start : int, optional
+            The index of the first value to read.
+        stop : int, optional
+            The index after the last value to read.
+        chunk_length : int, optional
+            The maximum number of values in each chunk.
+
+        Yields
+        ------
+        numpy.ndarray
+            Consecutive parts of the channel's data.
+
+        """
+        try:
+            channel = self.channels[path]
+        except KeyError:
+            return
+
+        if stop is None or stop > channel.length:
+            stop = channel.length
+
+        if channel.strings:
+            for first in range(start, stop, chunk_length):
+                yield self._readStrings(channel, first,
+                                        min(first + chunk_length, stop))
+            return
+
+        with open(self.filename, 'rb') as tdms_file:
+            for (offset, count, stride) in self._blockRanges(channel, start,
+                                                             stop):
+                for first in range(0, count, chunk_length):
+                    values = self._readBlock(tdms_file, channel.dtype,
+                                             offset + first * stride,
+                                             min(chunk_length, count - first),
+                                             stride)
+                    if channel.dtype.names is not None:
+                        values = timestamp_to_datetime64(values['seconds'],
+                                                         values['fraction'])
+                    yield values
+
+    def mapChannel(self, path, scratch_dir=None, start=0, stop=None):
+        """Return a read-only memory map of a channel's values.
+
+        If the requested values are stored contiguously in the TDMS file, the
+        map is a view onto the TDMS file itself. Otherwise, e.g. for
+        interleaved or fragmented channels, the values are copied chunk by
+        chunk into an anonymous scratch file which is mapped instead.
+
+        Parameters
+        ----------
+        path : str
+            The TDMS path of the channel.
+        scratch_dir : str, optional
+            The directory for scratch files. Defaults to the system's
+            temporary directory.
+        start : int, optional
+            The index of the first value to map.
+        stop : int, optional
+            The index after the last value to map. Defaults to the length of
+            the channel.
+
+        Returns
+        -------
+        numpy.memmap
+            The channel's data.
+
+        """
+        try:
+            channel = self.channels[path]
+        except KeyError:
+            return np.array([])
+
+        if stop is None or stop > channel.length:
+            stop = channel.length
+
+        if (stop <= start or channel.strings or
+                channel.dtype.names is not None):
+            return self.readChannel(path, start, stop)
+
+        blocks = list(self._blockRanges(channel, start, stop))
+
+        if len(blocks) == 1 and blocks[0][2] == channel.dtype.itemsize:
+            return np.memmap(self.filename, dtype=channel.dtype, mode='r',
+                             offset=blocks[0][0], shape=(stop - start,))
+
+        data = scratch_memmap(channel.dtype.newbyteorder('='), stop - start,
+                              scratch_dir)
+        filled = 0
+        for values in self.iterChannel(path, start, stop):
+            data[filled:filled + len(values)] = values
+            filled += len(values)
+        data.flush()
+        data.flags.writeable = False
+
+        return data
+
+    def previewChannel(self, path, points=PREVIEW_POINTS, method='stride',
+                       start=0, stop=None):
+        """Read a decimated subset of a channel's values.
+
+        Parameters
+        ----------
+        path : str
+            The TDMS path of the channel.
+        points : int, optional
+            The approximate number of values to read.
+        method : {'stride', 'minmax'}, optional
+            'stride' reads every n-th value and only touches the file where
+            these values are stored. 'minmax' keeps the smallest and largest
+            value of each of points / 2 consecutive runs of values, so that
+            spikes are not lost, but has to stream through the whole channel.
+        start : int, optional
+            The index of the first value of the previewed range.
+        stop : int, optional
+            The index after the last value of the previewed range. Defaults
+            to the length of the channel.
+
+        Returns
+        -------
+        tuple
+            The indices of the values relative to start and the values.
+
+        """
+        (start, stop, _) = slice(start, stop).indices(
+            self.channelLength(path))
+        length = max(stop - start, 0)
+
+        if length <= points:
+            return (np.arange(length), self.readChannel(path, start, stop))
+
+        # Strings have no minimum or maximum, they are always strided
+        if method == 'minmax' and not self._isStrings(path):
+            return self._readMinMax(path, -(-length // max(1, points // 2)),
+                                    start, stop)
+        elif method in ('stride', 'minmax'):
+            step = -(-length // points)
+            return (np.arange(0, length, step),
+                    self._readStrided(path, step, start, stop))
+
+        raise ValueError('Unknown preview method {0}'.format(method))
+
+    def _isStrings(self, path):
+        """Return whether the values of a channel are strings."""
+        return self.channels[path].strings
+
+    def _readStrided(self, path, step, start, stop):
+        """Read every step-th value of a channel from start to stop."""
+
+        channel = self.channels[path]
+        if channel.strings:
+            return self._readStrings(channel, start, stop)[::step]
+
+        itemsize = channel.dtype.itemsize
+        parts = []
+
+        with open(self.filename, 'rb') as tdms_file:
+            block_start = 0
+            for (offset, count, stride) in self._blockRanges(channel, start,
+                                                             stop):
+                # The index of the first value to read in this block
+                first = -block_start % step
+                for index in range(first, count, step):
+                    tdms_file.seek(offset + index * stride)
+                    parts.append(tdms_file.read(itemsize))
+                block_start += count
+
+        data = np.frombuffer(b''.join(parts), dtype=channel.dtype)
+
+        if channel.dtype.names is not None:
+            return timestamp_to_datetime64(data['seconds'], data['fraction'])
+
+        return data.astype(channel.dtype.newbyteorder('='))
+
+    def _readMinMax(self, path, bucket, start, stop):
+        """Read the minimum and maximum of each run of bucket values."""
+
+        indices = []
+        values = []
+        carry = np.array([])
+        position = 0
+
+        def add(data):
+            rows = data.reshape((-1, len(data) if len(data) < bucket
+                                 else bucket))
+            row_length = rows.shape[1]
+            low = rows.argmin(axis=1)
+            high = rows.argmax(axis=1)
+            # Keep the minimum and the maximum of each run in their order
+            pairs = np.sort(np.column_stack((low, high)), axis=1)
+            pairs += (np.arange(len(rows)) * row_length)[:, np.newaxis]
+            indices.append(position + pairs.ravel())
+            values.append(data[pairs.ravel()])
+
+        chunk_length = bucket * max(1, CHUNK_LENGTH // bucket)
+        for chunk in self.iterChannel(path, start, stop,
+                                      chunk_length=chunk_length):
+            if len(carry):
+                chunk = np.concatenate((carry, chunk))
+            full = len(chunk) - len(chunk) % bucket
+            if full:
+                add(chunk[:full])
+            carry = chunk[full:]
+            position += full
+
+        if len(carry):
+            add(carry)
+
+        return (np.concatenate(indices), np.concatenate(values))
+
+    def _readStrings(self, channel, start, stop):
+        """Read the strings of a string channel from start to stop."""
+
+        values = []
+        with open(self.filename, 'rb') as tdms_file:
+            block_start = 0
+            for (offset, count) in zip(channel.offsets, channel.counts):
+                block_stop = block_start + count
+                if block_stop > start and block_start < stop:
+                    tdms_file.seek(offset)
+                    ends = np.fromfile(tdms_file, channel.dtype, count)
+                    raw = tdms_file.read(int(ends[-1]))
+                    starts = np.append(0, ends[:-1])
+                    first = max(start, block_start) - block_start
+                    last = min(stop, block_stop) - block_start
+                    values.extend(raw[begin:end].decode('utf-8')
+                                  for (begin, end) in zip(starts[first:last],
+                                                          ends[first:last]))
+                block_start = block_stop
+                if block_start >= stop:
+                    break
+
+        return np.array(values, dtype=object)
+
+    def _readBlock(self, tdms_file, dtype, offset, count, stride):
+        """Read count values beginning at offset separated by stride bytes."""
+
+        tdms_file.seek(offset)
+        if stride == dtype.itemsize:
+            return np.fromfile(tdms_file, dtype=dtype, count=count)
+
+        raw = np.fromfile(tdms_file, dtype=np.uint8,
+                          count=(count - 1) * stride + dtype.itemsize)
+        return np.ndarray((count,), dtype=dtype, buffer=raw,
+                          strides=(stride,))
+
+
+class NpTDMSReader(TDMSReader):
+    """Read a TDMS file with npTDMS.
+
+    The fallback for the files the TDMSReader can not index, e.g. files with
+    DAQmx raw data. npTDMS reads the whole file when the reader is created,
+    so the channels' data is held in memory and the file is not followed.
+
+    Parameters
+    ----------
+    filename : str
+        The absolute path of the TDMS file.
+
+    Attributes
+    ----------
+    filename : str
+        The absolute path of the TDMS file.
+    properties : OrderedDict
+        The properties of every object in the file, keyed by the object path.
+        The root object's path is '/'.
+    channels : OrderedDict
+        The data of every channel with raw data, keyed by the channel path.
+
+    """
+
+    def __init__(self, filename):
+        # The TDMSReader's indexing is skipped entirely
+        self.filename = filename
+        self.properties = OrderedDict()
+        self.channels = OrderedDict()
+
+        tdms_file = TdmsFile(filename)
+        self.properties['/'] = OrderedDict(tdms_file.properties)
+        for group in tdms_file.groups():
+            self.properties[group.path] = OrderedDict(group.properties)
+            for channel in group.channels():
+                self.properties[channel.path] = OrderedDict(
+                    channel.properties)
+                if len(channel):
+                    self.channels[channel.path] = np.asarray(channel.data)
+
+    def update(self):
+        """Return no grown channels, the file is read only once."""
+        return OrderedDict()
+
+    def channelLength(self, path):
+        """Return the number of values stored for a channel."""
+        try:
+            return len(self.channels[path])
+        except KeyError:
+            return 0
+
+    def readChannel(self, path, start=0, stop=None):
+        """Return a copy of a channel's values, see TDMSReader.readChannel."""
+        try:
+            return self.channels[path][start:stop].copy()
+        except KeyError:
+            return np.array([])
+
+    def iterChannel(self, path, start=0, stop=None, chunk_length=CHUNK_LENGTH):
+        """Yield a channel's values in chunks, see TDMSReader.iterChannel."""
+        (start, stop, _) = slice(start, stop).indices(self.channelLength(path))
+        for first in range(start, stop, chunk_length):
+            yield self.readChannel(path, first,
+                                   min(first + chunk_length, stop))
+
+    def mapChannel(self, path, scratch_dir=None, start=0, stop=None):
+        """Return a channel's values, they are already in memory."""
+        return self.readChannel(path, start, stop)
+
+    def _isStrings(self, path):
+        """Return whether the values of a channel are strings."""
+        return self.channels[path].dtype.kind in 'OSU'
+
+    def _readStrided(self, path, step, start, stop):
+        """Return every step-th value of a channel from start to stop."""
+        return self.channels[path][start:stop:step].copy()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Evenly sampled time axes described by their start, step and length.
+
+The samples of a waveform channel are taken at start + i * step. Instead of
+storing one time stamp per sample, a TimeBase stores only these three numbers
+and calculates time stamps, elapsed minutes and sample indices on request.
+Channels recorded with the same timing share one interned TimeBase, so that
+the full time arrays, if they are needed at all, exist once per device.
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+from weakref import WeakValueDictionary
+
+import numpy as np
+
+# The time bases in use, keyed by their (start, step, length)
+_TIME_BASES = WeakValueDictionary()
+
+MINUTE = np.timedelta64(1, 'm')
+
+
+def time_base(start, step, length):
+    """Return the shared TimeBase of the given timing.
+
+    Parameters
+    ----------
+    start : numpy.datetime64
+        The time of the first sample.
+    step : numpy.timedelta64
+        The time between two samples.
+    length : int
+        The number of samples.
+
+    Returns
+    -------
+    TimeBase
+        The same object for every call with equal timing, as long as it is in
+        use.
+
+    """
+    key = (np.datetime64(start, 'us'), np.timedelta64(step, 'us'),
+           int(length))
+
+    base = _TIME_BASES.get(key)
+    if base is None:
+        base = TimeBase(*key)
+        _TIME_BASES[key] = base
+
+    return base
+
+
+class TimeBase(object):
+    """The time axis of an evenly sampled waveform.
+
+    Use time_base to get the shared instance for a timing instead of creating
+    new ones. A TimeBase never changes, e.g. appending samples to a channel
+    gives it a new TimeBase.
+
+    Parameters
+    ----------
+    start : numpy.datetime64
+        The time of the first sample.
+    step : numpy.timedelta64
+        The time between two samples.
+    length : int
+        The number of samples.
+
+    Attributes
+    ----------
+    start : numpy.datetime64
+        The time of the first sample.
+    step : numpy.timedelta64
+        The time between two samples.
+    length : int
+        The number of samples.
+
+    Methods
+    -------
+    timeAt(index : int or numpy.ndarray)
+        Return the time of samples.
+    minutesAt(index : int or numpy.ndarray, reference : numpy.datetime64)
+        Return the minutes from reference to samples.
+    times(start : int, stop : int)
+        Return the times of a range of samples.
+    minutes(start : int, stop : int, reference : numpy.datetime64)
+        Return the minutes from reference to a range of samples.
+    iterMinutes(chunk_length : int, reference : numpy.datetime64)
+        Iterate over the minutes of all samples in chunks.
+    searchsorted(time : numpy.datetime64, side : str)
+        Return the sample indices where times would be inserted.
+    resized(length : int)
+        Return the time base with the same timing but another length.
+
+    """
+
+    def __init__(self, start, step, length):
+        super(TimeBase, self).__init__()
+
+        self.start = np.datetime64(start)
+        self.step = np.timedelta64(step)
+        self.length = int(length)
+
+        # The full arrays, calculated when they are first asked for
+        self._times = None
+        self._minutes = {}
+
+    def __len__(self):
+        return self.length
+
+    def __eq__(self, other):
+        return (isinstance(other, TimeBase) and
+                (self.start, self.step, self.length) ==
+                (other.start, other.step, other.length))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.start, self.step, self.length))
+
+    def __repr__(self):
+        return 'TimeBase({0!r}, {1!r}, {2})'.format(self.start, self.step,
+                                                    self.length)
+
+    def __getitem__(self, index):
+        """Return the time of a sample, or the time base of a slice."""
+
+        if isinstance(index, slice):
+            (first, stop, stride) = index.indices(self.length)
+            length = max(0, -(-(stop - first) // stride))
+            return time_base(self.timeAt(first), self.step * stride, length)
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('Sample {0} is outside of the time base'
+                             .format(index))
+        return self.timeAt(index)
+
+    def timeAt(self, index):
+        """Return the time of samples.
+
+        Parameters
+        ----------
+        index : int or numpy.ndarray
+            The indices of the samples.
+
+        Returns
+        -------
+        numpy.datetime64 or numpy.ndarray
+
+        """
+        return self.start + self.step * index
+
+    def minutesAt(self, index, reference=None):
+        """Return the minutes from reference to samples.
+
+        Parameters
+        ----------
+        index : int or numpy.ndarray
+            The indices of the samples.
+        reference : numpy.datetime64, optional
+            The time the minutes are counted from. Defaults to start.
+
+        Returns
+        -------
+        float or numpy.ndarray
+
+        """
+        minutes = (self.step * index) / MINUTE
+        if reference is not None:
+            offset = self.start - np.datetime64(reference)
+            minutes = minutes + offset / MINUTE
+        return minutes
+
+    def times(self, start=0, stop=None):
+        """Return the times of a range of samples.
+
+        The array of all times is kept read-only once calculated.
+
+        Parameters
+        ----------
+        start : int, optional
+            The index of the first sample.
+        stop : int, optional
+            The index after the last sample. Defaults to length.
+
+        Returns
+        -------
+        numpy.ndarray
+            The numpy.datetime64 times of the samples.
+
+        """
+        if stop is None or stop > self.length:
+            stop = self.length
+
+        if start == 0 and stop == self.length:
+            if self._times is None:
+                self._times = self.timeAt(np.arange(self.length))
+                # The array is shared by all users of the time base
+                self._times.flags.writeable = False
+            return self._times
+
+        return self.timeAt(np.arange(start, stop))
+
+    def minutes(self, start=0, stop=None, reference=None):
+        """Return the minutes from reference to a range of samples.
+
+        The array of all minutes is kept read-only once calculated.
+
+        Parameters
+        ----------
+        start : int, optional
+            The index of the first sample.
+        stop : int, optional
+            The index after the last sample. Defaults to length.
+        reference : numpy.datetime64, optional
+            The time the minutes are counted from. Defaults to start.
+
+        Returns
+        -------
+        numpy.ndarray
+
+        """
+        if stop is None or stop > self.length:
+            stop = self.length
+
+        if start == 0 and stop == self.length:
+            key = None if reference is None else np.datetime64(reference)
+            if key not in self._minutes:
+                minutes = self.minutesAt(np.arange(self.length), reference)
+                minutes.flags.writeable = False
+                self._minutes[key] = minutes
+            return self._minutes[key]
+
+        return self.minutesAt(np.arange(start, stop), reference)
+
+    def iterMinutes(self, chunk_length, reference=None):
+        """Iterate over the minutes of all samples in chunks.
+
+        Parameters
+        ----------
+        chunk_length : int
+            The number of values in each chunk.
+        reference : numpy.datetime64, optional
+            The time the minutes are counted from. Defaults to start.
+
+        Yields
+        ------
+        numpy.ndarray
+            Consecutive parts of the minutes.
+
+        """
+        for first in range(0, self.length, chunk_length):
+            yield self.minutes(first, first + chunk_length, reference)
+
+    def searchsorted(self, time, side='left'):
+        """Return the sample indices where times would be inserted.
+
+        Like numpy.searchsorted on the array of all times, but calculated
+        without it.
+
+        Parameters
+        ----------
+        time : numpy.datetime64 or numpy.ndarray
+            The times to look up.
+        side : {'left', 'right'}, optional
+            Return the first ('left') or last ('right') suitable index if a
+            time equals the time of a sample.
+
+        Returns
+        -------
+        int or numpy.ndarray
+
+        """
+        position = (np.asarray(time, dtype='M8[us]') - self.start) / self.step
+
+        if side == 'left':
+            index = np.ceil(position)
+        elif side == 'right':
+            index = np.floor(position) + 1
+        else:
+            raise ValueError('side must be left or right')
+
+        index = np.clip(index, 0, self.length).astype(np.int64)
+        return index if index.ndim else int(index)
+
+    def resized(self, length):
+        """Return the time base with the same timing but another length."""
+        return time_base(self.start, self.step, length)
@@ -17,7 +17,7 @@ __status__ = "Development"
 import os
 import sys
 import argparse
-from datetime import datetime
+from functools import partial
 
 # Import thrid-party modules
 import h5py
@@ -26,15 +26,25 @@ import pandas as pd
 import seaborn as sns
 
 # PyQt4
-from PyQt4.QtGui import (QApplication, QFileDialog, QKeySequence, QMessageBox)
+from PyQt4.QtCore import QThread, QTimer
+from PyQt4.QtGui import (QApplication, QFileDialog, QInputDialog,
+                         QKeySequence, QMessageBox)
 
 # Import our own modules
 from TDMS2HDF5.view import (MyMainWindow, AXESLABELS)
 from TDMS2HDF5.ChannelModel import (ChannelRegistry)
+from TDMS2HDF5.Converter import write_channel
+from TDMS2HDF5.MetadataCache import MetadataCache, CACHE_DIR
 from TDMS2HDF5.view_model import (TreeNode, TreeModel, MyListModel)
 
 BASEDIR = '/home/chris/Documents/PhD/root/raw-data/'
 
+# Longer channels are thinned out before plotting
+MAX_PLOT_POINTS = 1000000
+
+# How often a followed file is checked for new data in milliseconds
+FOLLOW_INTERVAL_MS = 2000
+
 MEAS_TYPES = {'BSweep': 'bsweep_files.csv',
               'BRamp': 'bramp_files.csv',
               'Cooldown': 'tsweep_files.csv',
@@ -51,6 +61,48 @@ MEAS_TYPES = {'BSweep': 'bsweep_files.csv',
               'BzSweep': 'bsweep_files.csv'}
 
 
+class ChannelReader(QThread):
+    """Reads the full data of channels on a worker thread.
+
+    The GUI keeps showing the previews of the channels while their data is
+    read, finished is emitted once all of it is read. Only the detached
+    loaders of the channels run on the thread, see
+    ChannelRegistry.detachedLoaders, the channels themselves are not touched.
+    The data is handed to them on the GUI thread once finished is emitted.
+
+    Parameters
+    ----------
+    loaders : list
+        The (Channel, loader) of each channel to read.
+    parent : PyQt4.QtCore.QObject, optional
+        The owner of the thread.
+
+    Attributes
+    ----------
+    loaders : list
+        The (Channel, loader) of each channel to read.
+    results : list
+        The data returned by each loader, once finished.
+    error : Exception
+        The error raised by a loader, None if all of them succeeded.
+
+    """
+
+    def __init__(self, loaders, parent=None):
+        super(ChannelReader, self).__init__(parent)
+
+        self.loaders = loaders
+        self.results = []
+        self.error = None
+
+    def run(self):
+        try:
+            self.results = [loader() for (_, loader) in self.loaders]
+        except Exception as err:
+            # Reported on the GUI thread, see Presenter.fullDataRead
+            self.error = err
+
+
 class Main(MyMainWindow):
     """ The main window of the program.
 
@@ -70,6 +122,39 @@ class Presenter(object):
         The location where the raw data are stored.
     fileName : str
         The name of the current file being viewed.
+    lazyLoad : bool
+        Only read the channel data from TDMS files when it is first needed.
+    memmapLoad : bool
+        Memory map the channel data of TDMS files instead of reading it.
+    metadataCache : MetadataCache
+        The cache for the meta data of reopened TDMS files. None, the
+        default, does not cache it.
+    previewPoints : int
+        If set, TDMS files are opened with a decimated preview of about this
+        many values per channel. The full data of the plotted channels is
+        read on a ChannelReader thread and replaces the preview once read.
+    loadWorkers : int
+        The number of threads reading the channels of TDMS files in parallel.
+    includeChannels : list
+        Only load the channels matching one of these patterns, e.g. 'ADWin/*'.
+        None loads all channels.
+    excludeChannels : list
+        Do not load the channels matching any of these patterns.
+    storageDtype : numpy.dtype
+        If set, floating point channels are stored in this dtype, e.g.
+        numpy.float32, instead of double precision.
+    stepEncoding : bool
+        Keep the channels that change rarely step encoded and export them
+        step encoded to HDF5, see Converter.write_channel.
+    followTimer : PyQt4.QtCore.QTimer
+        Triggers reading the data appended to the file while following it.
+    follow : bool
+        Whether the file is followed. The follow timer is paused while a
+        ChannelReader is running.
+    runningReaders : int
+        The number of ChannelReader threads that are running.
+    plotLine : matplotlib.lines.Line2D
+        The currently plotted line.
     view : MyMainWindow
         The view of the program.
     yModel : PyQt type model
@@ -90,6 +175,8 @@ class Presenter(object):
         The file menu of the main window.
     fileMenuActions : tuple
         The actions added to the file menu.
+    editMenu : PyQt.QtGui.QMenu
+        The menu to undo and redo processing steps.
 
     Methods
     -------
@@ -112,8 +199,20 @@ class Presenter(object):
         Redraw the plot with the newly selected channel's data
     newXSelection(xSelection : str)
         Redraw the plot with the newly selected channel's data
+    plotArrays()
+        Return the x and y arrays to plot and whether they are previews.
     plotSelection()
         Plot the selected data
+    refreshPlot()
+        Update the plotted line with the selected channels' current data.
+    readFullData()
+        Read the full data of the plotted channels on a worker thread.
+    fullDataRead(reader : ChannelReader, xKey : str, yKey : str)
+        Replace the plotted previews with the full data that was read.
+    toggleFollow(follow : bool)
+        Start or stop following the file while it is being written.
+    followFile()
+        Read the data appended to the file and refresh the plot.
     generateAxisLabel(chan_name : str)
         Return the axes label for the channel.
     toggleWriteToFile()
@@ -132,6 +231,8 @@ class Presenter(object):
         Export the channels to a HDF5 file using h5py.
     addFileToGoodList()
         Add the file name to a list of usable measurement files
+    reportMissingInputs(missing : dict)
+        Tell the user which channels could not be added and why.
     addB()
         Add BField Data to ADWin.
     addTm()
@@ -140,6 +241,12 @@ class Presenter(object):
         Add resistance and supporting channels to ADWin.
     addTSample_AD()
         Add TSample_AD and supporting channels to ADWin.
+    addExpression()
+        Add a channel calculated from an expression of other channels.
+    undo()
+        Undo the last processing step.
+    redo()
+        Redo the last undone processing step.
 
     """
 
@@ -148,6 +255,19 @@ class Presenter(object):
 
         self.baseDir = BASEDIR
         self.fileName = None
+        self.lazyLoad = False
+        self.memmapLoad = False
+        self.metadataCache = None
+        self.previewPoints = None
+        self.loadWorkers = None
+        self.includeChannels = None
+        self.excludeChannels = None
+        self.storageDtype = None
+        self.stepEncoding = False
+        self.followTimer = None
+        self.follow = False
+        self.runningReaders = 0
+        self.plotLine = None
 
         self.view = None
         self.yModel = None
@@ -161,6 +281,7 @@ class Presenter(object):
 
         self.fileMenu = None
         self.fileMenuActions = None
+        self.editMenu = None
 
     def setView(self, view):
         """Set the view to which the information is pushed.
@@ -249,19 +370,50 @@ class Presenter(object):
                                                       self.addTSample_AD,
                                                       "Ctrl+T",
                                                       tip="Add TSample_AD")
+        channelAddExpression = self.view.createAction("Add E&xpression "
+                                                      "Channel",
+                                                      self.addExpression,
+                                                      "Ctrl+Shift+X",
+                                                      tip="Add a channel "
+                                                          "calculated from "
+                                                          "other channels")
+        editUndoAction = self.view.createAction("&Undo", self.undo,
+                                                "Ctrl+Alt+Z",
+                                                tip="Undo the last processing"
+                                                    " step")
+        editRedoAction = self.view.createAction("&Redo", self.redo,
+                                                "Ctrl+Y",
+                                                tip="Redo the last undone"
+                                                    " processing step")
+        fileFollowAction = self.view.createAction("&Follow File",
+                                                  self.toggleFollow,
+                                                  "Ctrl+F",
+                                                  tip=("Show new data while"
+                                                       " the file is being"
+                                                       " written"),
+                                                  checkable=True,
+                                                  signal="toggled(bool)")
 
         # Add the 'File' menu to the menu bar
         self.fileMenu = self.view.menuBar().addMenu("&File")
-        self.fileMenuActions = (fileOpenAction, fileExportAction,
-                                fileQuitAction)
+        self.fileMenuActions = (fileOpenAction, fileFollowAction,
+                                fileExportAction, fileQuitAction)
         self.view.addActions(self.fileMenu, self.fileMenuActions)
 
+        # Add the 'Edit' menu, Ctrl+Z is taken by removing the zeros
+        self.editMenu = self.view.menuBar().addMenu("&Edit")
+        self.view.addActions(self.editMenu, (editUndoAction, editRedoAction))
+
         # Add the 'Channels'
         self.channelAddMenu = self.view.menuBar().addMenu("&Add Channel")
         self.view.addActions(self.channelAddMenu, (channelRemBZeros,
                                                    channelAddBAction,
                                                    channelAddResistanceAction,
-                                                   channelAddTSample_AD,))
+                                                   channelAddTSample_AD,
+                                                   channelAddExpression))
+
+        self.followTimer = QTimer(self.view)
+        self.followTimer.timeout.connect(self.followFile)
 
         # Connections
         self.view.ySelectorView.clicked.connect(self.newYSelection)
@@ -283,7 +435,13 @@ class Presenter(object):
                                             self.baseDir, formats)
 
         if fname:
-            self.channelRegistry.loadFromFile(fname)
+            self.channelRegistry.loadFromFile(
+                fname, lazy=self.lazyLoad, memmap=self.memmapLoad,
+                metadata_cache=self.metadataCache,
+                include=self.includeChannels, exclude=self.excludeChannels,
+                preview=self.previewPoints, workers=self.loadWorkers,
+                raw_dtype=self.storageDtype, derived_dtype=self.storageDtype,
+                step_encoding=self.stepEncoding)
 
             self.baseDir = os.path.dirname(fname)
 
@@ -303,7 +461,13 @@ class Presenter(object):
 
         """
         if fname:
-            self.channelRegistry.loadFromFile(fname)
+            self.channelRegistry.loadFromFile(
+                fname, lazy=self.lazyLoad, memmap=self.memmapLoad,
+                metadata_cache=self.metadataCache,
+                include=self.includeChannels, exclude=self.excludeChannels,
+                preview=self.previewPoints, workers=self.loadWorkers,
+                raw_dtype=self.storageDtype, derived_dtype=self.storageDtype,
+                step_encoding=self.stepEncoding)
 
             self.baseDir = os.path.dirname(fname)
 
@@ -325,23 +489,19 @@ class Presenter(object):
         # Setup the root node of the tree
         rootNode0 = TreeNode("")
 
-        procDeviceNodes = {}
-
-        for chanTDMSPath in sorted(self.channelRegistry.keys()):
-
-            (root, device, chan) = chanTDMSPath.split('/')
+        registry = self.channelRegistry
 
-            if root not in procDeviceNodes:
+        for root in sorted(registry.getParents()):
 
-                procDeviceNodes[root] = {'node': TreeNode(root, rootNode0)}
+            rootNode = TreeNode(root, rootNode0)
 
-            if device not in procDeviceNodes[root]:
+            # Only parent/device/channel keys fit into the tree
+            for device in sorted(d for d in registry.getDevices(root) if d):
 
-                procDeviceNodes[root][device] = \
-                  {'node': TreeNode(device, procDeviceNodes[root]['node'])}
+                deviceNode = TreeNode(device, rootNode)
 
-            procDeviceNodes[root][device][chan] = \
-              TreeNode(chan, procDeviceNodes[root][device]['node'])
+                for chan in sorted(registry.getChannels(root, device)):
+                    TreeNode(chan, deviceNode)
 
         self.setYModel(TreeModel(rootNode0))
         self.setXModel(None)
@@ -365,14 +525,16 @@ class Presenter(object):
 
         """
         self.ySelected_old = self.ySelected
-        if not ySelection.data() in ['proc01'] + self.channelRegistry.devices:
+        if not ySelection.data() in (self.channelRegistry.getParents() +
+                                     self.channelRegistry.devices):
             parentName = ySelection.parent().data()
             grandParentName = ySelection.parent().parent().data()
             channelName = ySelection.data()
             if grandParentName == '01':
                 grandParentName = 'proc/' + grandParentName
-            self.ySelected = "{0}/{1}/{2}".format(grandParentName, parentName,
-                                                  channelName)
+            # Derived channels like 'proc/R' have no device in their key
+            self.ySelected = self.channelRegistry.getKey(
+                grandParentName, parentName, channelName)
             self.ySelected_root = "{0}/{1}".format(grandParentName, parentName)
             # print('The Y-Channel {0} was selected.'.format(self.ySelected))
 
@@ -380,8 +542,8 @@ class Presenter(object):
             channelObj = self.channelRegistry[self.ySelected]
             self.view.saveChannelCheckBox.setChecked(channelObj.write_to_file)
 
-        newXList = [k.split('/')[-1] for k in self.channelRegistry.keys()
-                    if self.ySelected_root in k]
+        (parent, device) = self.ySelected_root.rsplit('/', 1)
+        newXList = self.channelRegistry.getChannels(parent, device)
 
         self.setXModel(MyListModel(sorted(newXList)))
 
@@ -393,12 +555,49 @@ class Presenter(object):
 
         """
         self.xSelected_old = self.xSelected
-        self.xSelected = "{0}/{1}".format(self.ySelected_root,
-                                          xSelection.data())
+        (parent, device) = self.ySelected_root.rsplit('/', 1)
+        self.xSelected = self.channelRegistry.getKey(parent, device,
+                                                     xSelection.data())
         # print('The X-Channel {0} was selected.'.format(self.xSelected))
 
         self.plotSelection()
 
+    def plotArrays(self, preview=True):
+        """Return the x and y arrays to plot and whether they are previews.
+
+        Long (e.g. memory mapped) channels are thinned out, the plot can not
+        show more points than MAX_PLOT_POINTS anyway.
+
+        Parameters
+        ----------
+        preview : bool, optional
+            Use the decimated previews of channels that have not been read
+            yet, if both selected channels have previews at the same indices.
+
+        Returns
+        -------
+        tuple
+            The x array, the y array and whether they are previews.
+
+        """
+        xChan = self.channelRegistry[self.xSelected]
+        yChan = self.channelRegistry[self.ySelected]
+        xPreview = xChan.getPreview()
+        yPreview = yChan.getPreview()
+
+        if (preview and not yChan.isLoaded() and xPreview is not None and
+                yPreview is not None and
+                np.array_equal(xPreview[0], yPreview[0])):
+            return (xPreview[1], yPreview[1], True)
+
+        yArray = yChan.data
+        xArray = xChan.data
+
+        length = min(len(xArray), len(yArray))
+        step = max(1, length // MAX_PLOT_POINTS)
+
+        return (xArray[:length:step], yArray[:length:step], False)
+
     def plotSelection(self):
         """Plot the data channels indicated by xSelected and ySelected.
 
@@ -407,16 +606,13 @@ class Presenter(object):
 
             # Clear the plot
             self.view.axes.cla()
+            self.plotLine = None
 
             # Turn on the grid
             self.view.axes.grid(True)
 
             # Generate the data arrays
-            yArray = self.channelRegistry[self.ySelected].data
-            # print('y array is:', yArray)
-
-            xArray = self.channelRegistry[self.xSelected].data
-            # print('x array is:', xArray)
+            (xArray, yArray, isPreview) = self.plotArrays()
 
             # Set the labels
             xLabel = self.generateAxisLabel(self.xSelected)
@@ -427,8 +623,9 @@ class Presenter(object):
 
             # Do the plotting
             try:
-                self.view.axes.plot(xArray, yArray, label=self.ySelected,
-                                    color=sns.xkcd_rgb['pale red'])
+                (self.plotLine,) = self.view.axes.plot(
+                    xArray, yArray, label=self.ySelected,
+                    color=sns.xkcd_rgb['pale red'])
                 self.view.axes.get_yaxis().get_major_formatter()\
                     .set_useOffset(False)
             except ValueError as err:
@@ -442,6 +639,105 @@ class Presenter(object):
             # Draw everything
             self.view.canvas.draw()
 
+            if isPreview and self.plotLine is not None:
+                self.readFullData()
+
+    def refreshPlot(self):
+        """Update the plotted line with the selected channels' current data.
+
+        Unlike plotSelection the axes, labels and legend are kept, only the
+        line's data and the axes limits change.
+
+        """
+        if self.plotLine is None:
+            self.plotSelection()
+            return
+
+        (xArray, yArray, _) = self.plotArrays(preview=False)
+
+        self.plotLine.set_data(xArray, yArray)
+        self.view.axes.relim()
+        self.view.axes.autoscale_view()
+        self.view.canvas.draw_idle()
+
+    def readFullData(self):
+        """Read the full data of the plotted channels on a worker thread.
+
+        The GUI stays responsive and shows the previews until the data is
+        read, see fullDataRead. Following the file is paused meanwhile, so
+        that the channels' sources do not change while they are read.
+
+        """
+        loaders = self.channelRegistry.detachedLoaders([self.xSelected,
+                                                        self.ySelected])
+        if not loaders:
+            self.refreshPlot()
+            return
+
+        self.runningReaders += 1
+        self.followTimer.stop()
+
+        reader = ChannelReader(loaders, self.view)
+        reader.finished.connect(partial(self.fullDataRead, reader,
+                                        self.xSelected, self.ySelected))
+        reader.finished.connect(reader.deleteLater)
+        reader.start()
+
+    def fullDataRead(self, reader, xKey, yKey):
+        """Hand the data that was read to its channels and plot it.
+
+        Parameters
+        ----------
+        reader : ChannelReader
+            The finished reader.
+        xKey, yKey : str
+            The channels that were read. The plot is not refreshed if another
+            selection has been plotted since.
+
+        """
+        self.runningReaders -= 1
+        if self.follow and not self.runningReaders:
+            self.followTimer.start(FOLLOW_INTERVAL_MS)
+
+        if reader.error is not None:
+            dialog = QMessageBox()
+            dialog.setText("The data of {0} and {1} could not be read:\n{2}"
+                           .format(xKey, yKey, reader.error))
+            dialog.exec_()
+            return
+
+        for ((chan, loader), data) in zip(reader.loaders, reader.results):
+            # Unless the channel was read or replaced in the meantime
+            if chan.getLoader() is loader:
+                chan.setLoadedData(data)
+
+        if (xKey, yKey) == (self.xSelected, self.ySelected):
+            self.refreshPlot()
+
+    def toggleFollow(self, follow):
+        """Start or stop following the file while it is being written.
+
+        Parameters
+        ----------
+        follow : bool
+            Whether to periodically read the data appended to the file.
+
+        """
+        self.follow = follow
+        # A running ChannelReader starts the timer once it is finished
+        if follow and not self.runningReaders:
+            self.followTimer.start(FOLLOW_INTERVAL_MS)
+        else:
+            self.followTimer.stop()
+
+    def followFile(self):
+        """Read the data appended to the file and refresh the plot."""
+
+        updated = self.channelRegistry.updateFromFile()
+
+        if self.xSelected in updated or self.ySelected in updated:
+            self.refreshPlot()
+
     def generateAxisLabel(self, chan_name):
         """Return the axes label for the channel.
 
@@ -553,23 +849,36 @@ class Presenter(object):
 
         self.addFileToGoodList(fname, meas_type)
 
-    def exprtToPandasHDF5(self, fname):
+    def exprtToPandasHDF5(self, fname, channelRegistry=None):
         """Export the channels to HDF5 type file using pandas.
 
         The channels to be exported are grouped by device and merged into a
         pandas time series data frame where the index is one of the channels'
         time series data.
 
+        Parameters
+        ----------
+        fname : str
+            The name of the file to write.
+        channelRegistry : ChannelRegistry, optional
+            The channels to export, e.g. a window of the loaded channels
+            returned by ChannelRegistry.window. Defaults to the loaded
+            channels.
+
         """
+        if channelRegistry is None:
+            channelRegistry = self.channelRegistry
+
         # Process 5.1 Create HDF5 file object
         hdfStore = pd.HDFStore(fname, 'w')
 
         df_register = {}
+        statistics = {}
 
         # Process 5.2 Create channels at their locations
-        for chan in sorted(self.channelRegistry.keys()):
+        for chan in sorted(channelRegistry.keys()):
 
-            chan_obj = self.channelRegistry[chan]
+            chan_obj = channelRegistry[chan]
             # chan_device = chan_obj.attributes['Device']
 
             # Remove whitespace and minus signs from the channel name
@@ -590,11 +899,14 @@ class Presenter(object):
                 #       .format(chan_name, device_df_key))
 
                 df_register[device_df_key][chan_name] = chan_obj.data
+                statistics.setdefault(device_df_key, {})[chan_name] = \
+                    chan_obj.getStatistics()
 
         for k, v in df_register.items():
-            # print(k, self.channelRegistry.mods)
+            # print(k, channelRegistry.mods)
             hdfStore.put(k, v, format='table')
-            hdfStore.get_storer(k).attrs.mods = self.channelRegistry.mods
+            hdfStore.get_storer(k).attrs.mods = channelRegistry.mods
+            hdfStore.get_storer(k).attrs.statistics = statistics.get(k, {})
             mods = hdfStore.get_storer(k).attrs.mods
             # for mod in mods:
             #     print('\t', mod)
@@ -607,8 +919,8 @@ class Presenter(object):
         f = h5py.File(fname, 'a')
 
         try:
-            start_time = self.channelRegistry.file_start_time.astype('<i8')
-            end_time = self.channelRegistry.file_end_time.astype('<i8')
+            start_time = channelRegistry.file_start_time.astype('<i8')
+            end_time = channelRegistry.file_end_time.astype('<i8')
 
             f.attrs.create('StartTime', start_time)
             f.attrs.create('EndTime', end_time)
@@ -625,46 +937,36 @@ class Presenter(object):
         """
         pass
 
-    def exprtToHDF5(self, fname):
+    def exprtToHDF5(self, fname, channelRegistry=None):
         """Export the channels to a HDF5 file using h5py.
 
+        Parameters
+        ----------
+        fname : str
+            The name of the file to write.
+        channelRegistry : ChannelRegistry, optional
+            The channels to export, e.g. a window of the loaded channels
+            returned by ChannelRegistry.window. Defaults to the loaded
+            channels.
+
         """
+        if channelRegistry is None:
+            channelRegistry = self.channelRegistry
 
         # Process 5.1 Create HDF5 file object
         hdf5FileObject = h5py.File(fname, 'w')
 
         # Process 5.2 Create channels at their locations
-        for chan in sorted(self.channelRegistry.keys()):
+        for chan in sorted(channelRegistry.keys()):
 
-            chan_obj = self.channelRegistry[chan]
+            chan_obj = channelRegistry[chan]
 
-            # Process 5.2.1 Write channel data
-            if self.channelRegistry[chan].write_to_file:
-
-                dset = hdf5FileObject.require_dataset(chan,
-                                                      shape=(chan_obj.data
-                                                             .shape),
-                                                      dtype=(chan_obj.data
-                                                             .dtype),
-                                                      data=chan_obj.data)
-
-                # Process 5.2.2 Write channel attributes
-                for attr_name in self.channelRegistry[chan].attributes:
-                    attr_value = (self.channelRegistry[chan]
-                                  .attributes[attr_name])
-
-                    # Convert the datetime format to a string
-                    if type(attr_value) is datetime:
-                        attr_value = attr_value.isoformat()
-
-                    # There's currently a wierd bug when dealing with python3
-                    # strings.
-                    # This gets around that
-                    if type(attr_value) is str:
-                        attr_value = np.string_(attr_value)
-                    # print(attr_name, attr_value.astype('float64') / 1e3,
-                    #       type(attr_value))
-                    dset.attrs.create(attr_name, attr_value)
+            # Process 5.2.1 Write channel data and attributes. The data is
+            # streamed in chunks, so that memory mapped or not yet loaded
+            # channels never have to be held in memory as a whole.
+            if chan_obj.write_to_file:
+                write_channel(hdf5FileObject, chan, chan_obj,
+                              steps=self.stepEncoding)
 
         # Process 5.3 Write data to file
         hdf5FileObject.flush()
@@ -712,10 +1014,31 @@ class Presenter(object):
 
             new_df.to_csv(full_path)
 
+    def reportMissingInputs(self, missing):
+        """Tell the user which channels could not be added and why.
+
+        Parameters
+        ----------
+        missing : dict
+            The keys of the missing input channels, keyed by the channels
+            that could not be added.
+
+        """
+        lines = ['{0} needs {1}'.format(name, ', '.join(keys))
+                 for (name, keys) in missing.items() if keys]
+        if not lines:
+            return
+
+        dialog = QMessageBox()
+        dialog.setText("Some channels could not be added, their inputs are "
+                       "missing:\n{0}".format('\n'.join(lines)))
+        dialog.exec_()
+
     def addB(self):
         """Add BField Data to ADWin."""
 
-        self.channelRegistry.addInterpolatedB()
+        missing = self.channelRegistry.addInterpolatedB()
+        self.reportMissingInputs({'proc01/ADWin/B': missing})
 
         self.populateSelectors()
 
@@ -736,17 +1059,58 @@ class Presenter(object):
     def addRes(self):
         """Add resistance and supporting channels to ADWin."""
 
-        self.channelRegistry.addTransportChannels()
+        self.reportMissingInputs(self.channelRegistry
+                                 .addTransportChannels())
 
         self.populateSelectors()
 
     def addTSample_AD(self):
         """Add TSample_AD and supporting channels to ADWin."""
 
-        self.channelRegistry.add_TSample_AD()
+        missing = self.channelRegistry.add_TSample_AD()
+        self.reportMissingInputs({'proc01/ADWin/TSample_AD': missing})
+
+        self.populateSelectors()
+
+    def addExpression(self):
+        """Add a channel calculated from an expression of other channels."""
+
+        (key, ok) = QInputDialog.getText(self.view, "Add Expression Channel",
+                                         "Key of the new channel, e.g. "
+                                         "proc01/ADWin/Rdiff:")
+        if not ok or not key:
+            return
+        (expression, ok) = QInputDialog.getText(
+            self.view, "Add Expression Channel",
+            "Expression of the channels and attributes of the device, e.g. "
+            "dVSample / dISample * LVSens / 10:")
+        if not ok or not expression:
+            return
+
+        try:
+            missing = self.channelRegistry.addExpression(str(key),
+                                                         str(expression))
+        except ValueError as err:
+            dialog = QMessageBox()
+            dialog.setText(str(err))
+            dialog.exec_()
+            return
+        self.reportMissingInputs({str(key): missing})
 
         self.populateSelectors()
 
+    def undo(self):
+        """Undo the last processing step."""
+
+        if self.channelRegistry.undo() is not None:
+            self.populateSelectors()
+
+    def redo(self):
+        """Redo the last undone processing step."""
+
+        if self.channelRegistry.redo() is not None:
+            self.populateSelectors()
+
 
 def main(argv=None):
     """The main function."""
@@ -754,6 +1118,30 @@ def main(argv=None):
     prog_desc = "TDMS File Viewer"
     parser = argparse.ArgumentParser(description=prog_desc)
     parser.add_argument('--file', '-f', help='The file to open')
+    parser.add_argument('--lazy', action='store_true',
+                        help='Only read channel data when it is needed')
+    parser.add_argument('--memmap', action='store_true',
+                        help='Memory map channel data instead of reading it')
+    parser.add_argument('--workers', type=int,
+                        help='Read the channels on this many threads')
+    parser.add_argument('--preview', type=int, metavar='POINTS',
+                        help=('Show a preview of about POINTS values per'
+                              ' channel before reading the full data'))
+    parser.add_argument('--include', action='append', metavar='PATTERN',
+                        help=("Only load channels matching the pattern, e.g."
+                              " 'ADWin/*'. Can be given several times"))
+    parser.add_argument('--exclude', action='append', metavar='PATTERN',
+                        help=("Do not load channels matching the pattern."
+                              " Can be given several times"))
+    parser.add_argument('--float32', action='store_true',
+                        help='Store the channels in single precision')
+    parser.add_argument('--steps', action='store_true',
+                        help=('Keep and export the channels that change'
+                              ' rarely step encoded'))
+    parser.add_argument('--metadata-cache', nargs='?', const=CACHE_DIR,
+                        metavar='DIR',
+                        help=('Cache the meta data of opened TDMS files in'
+                              ' DIR, by default {0}'.format(CACHE_DIR)))
 
     args = parser.parse_args()
 
@@ -762,6 +1150,17 @@ def main(argv=None):
     app.setApplicationName("TDMS-2-HDF5 Converter")
 
     presenter = Presenter()
+    presenter.lazyLoad = args.lazy
+    presenter.memmapLoad = args.memmap
+    presenter.previewPoints = args.preview
+    presenter.loadWorkers = args.workers
+    presenter.includeChannels = args.include
+    presenter.excludeChannels = args.exclude
+    if args.float32:
+        presenter.storageDtype = np.float32
+    presenter.stepEncoding = args.steps
+    if args.metadata_cache is not None:
+        presenter.metadataCache = MetadataCache(args.metadata_cache)
 
     presenter.setView(Main())
     presenter.setChanReg(ChannelRegistry())
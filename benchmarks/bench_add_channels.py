@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Benchmark how loading a TDMS file scales with its number of channels.
+
+Every channel added to a registry looks up the time track of its device, the
+time per channel should stay the same as the number of channels grows.
+
+Usage: python benchmarks/bench_add_channels.py [channels]
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests'))
+
+from TDMS2HDF5.ChannelModel import Channel, ChannelRegistry
+
+from tdms_factory import write_measurement
+
+CHANNELS = 2000
+CHANNELS_PER_DEVICE = 20
+LENGTH = 100
+
+
+def best_time(function, repeat=3):
+    """Return the best time of calling function in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def write_file(filename, count):
+    """Write a file with count channels spread over devices."""
+    channels = {}
+    for c in range(count):
+        device = channels.setdefault(
+            'Device{0}'.format(c // CHANNELS_PER_DEVICE), {})
+        device['Chan{0}'.format(c)] = np.random.random(LENGTH)
+    return write_measurement(filename, channels)
+
+
+def add_channels(count):
+    """Add count channels to a new registry."""
+    registry = ChannelRegistry()
+    for c in range(count):
+        chan = Channel('Device{0}/Chan{1}'.format(c // CHANNELS_PER_DEVICE, c),
+                       'Device{0}'.format(c // CHANNELS_PER_DEVICE),
+                       np.empty(LENGTH))
+        chan.setParent('proc01')
+        registry.addChannel(chan)
+
+
+def main(argv=None):
+    """Time loading files and adding channels for growing channel counts."""
+
+    if argv is None:
+        argv = sys.argv
+
+    maximum = int(argv[1]) if len(argv) > 1 else CHANNELS
+    counts = [maximum // 8, maximum // 4, maximum // 2, maximum]
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print('channels  load [s]  per channel [us]  '
+              'addChannel [s]  per channel [us]')
+        for count in counts:
+            filename = write_file(
+                os.path.join(tmp_dir, 'bench{0}.tdms'.format(count)), count)
+            load = best_time(lambda: ChannelRegistry().loadFromFile(
+                filename, lazy=True))
+            add = best_time(lambda: add_channels(count))
+            print('{0:8d}  {1:8.3f}  {2:16.1f}  {3:14.3f}  {4:16.1f}'.format(
+                count, load, load / count * 1E6, add, add / count * 1E6))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Benchmark the memory each channel object costs, without its data.
+
+Usage: python benchmarks/bench_channel_memory.py [channels]
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from TDMS2HDF5.ChannelModel import Channel
+
+CHANNELS = 100000
+START_TIME = np.datetime64('2014-09-23T09:05:59', 'us')
+
+
+def make_channel(index, amplifier):
+    """Return a lazy channel like the ones loaded from a TDMS file."""
+    chan = Channel('ADWin/ISample{0}'.format(index), device='ADWin')
+    chan.setLoader(np.empty, 0)
+    chan.setParent('proc01')
+    chan.setStartTime(START_TIME)
+    chan.setTimeStep(np.timedelta64(100, 'ms'))
+    if amplifier:
+        chan.attributes['IAmp'] = 1E6
+        chan.attributes['LISens'] = 0.1
+    return chan
+
+
+def bytes_per_channel(count, amplifier):
+    """Return the memory allocated per channel while creating count."""
+    tracemalloc.start()
+    channels = [make_channel(i, amplifier) for i in range(count)]
+    (current, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del channels
+    return current / count
+
+
+def main(argv=None):
+    """Create many channels and report their memory."""
+
+    if argv is None:
+        argv = sys.argv
+
+    count = int(argv[1]) if len(argv) > 1 else CHANNELS
+
+    print('{0} channels'.format(count))
+    print('standard attributes:  {0:.0f} bytes per channel'.format(
+        bytes_per_channel(count, False)))
+    print('amplifier attributes: {0:.0f} bytes per channel'.format(
+        bytes_per_channel(count, True)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Benchmark opening a heavily segmented TDMS file with and without its
+.tdms_index file.
+
+Usage: python benchmarks/bench_index_file.py [segments]
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests'))
+
+from TDMS2HDF5.TDMSReader import TDMSReader, INDEX_EXTENSION
+
+from tdms_factory import write_measurement
+
+CHANNELS = 8
+VALUES_PER_SEGMENT = 1000
+
+
+def time_open(filename, repeat=3):
+    """Return the best time of opening filename in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        TDMSReader(filename)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    """Write a segmented file and time opening it."""
+
+    if argv is None:
+        argv = sys.argv
+
+    segments = int(argv[1]) if len(argv) > 1 else 20000
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        length = segments * VALUES_PER_SEGMENT
+        channels = {'ADWin': dict(('Chan{0}'.format(i), np.zeros(length))
+                                  for i in range(CHANNELS))}
+        filename = write_measurement(os.path.join(tmp_dir, 'bench.tdms'),
+                                     channels, segments=segments,
+                                     index_file=True)
+
+        with_index = time_open(filename)
+        os.rename(filename + INDEX_EXTENSION, filename + '.bak')
+        without_index = time_open(filename)
+
+        print('{0} segments, {1:.0f} MB'.format(
+            segments, os.path.getsize(filename) / 2**20))
+        print('open with .tdms_index:    {0:.3f} s'.format(with_index))
+        print('open without .tdms_index: {0:.3f} s'.format(without_index))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Benchmark loading a TDMS file with many devices serially and on pools of
+threads and processes.
+
+Usage: python benchmarks/bench_parallel_load.py [workers]
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests'))
+
+from TDMS2HDF5.ChannelModel import ChannelRegistry
+
+from tdms_factory import write_measurement
+
+DEVICES = 8
+CHANNELS = 4
+LENGTH = 2000000
+
+
+def time_load(filename, repeat=3, **kwargs):
+    """Return the best time of loading filename in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ChannelRegistry().loadFromFile(filename, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    """Write a file with many devices and time loading it."""
+
+    if argv is None:
+        argv = sys.argv
+
+    workers = int(argv[1]) if len(argv) > 1 else os.cpu_count()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        channels = dict(('Device{0}'.format(d),
+                         dict(('Chan{0}'.format(c), np.random.random(LENGTH))
+                              for c in range(CHANNELS)))
+                        for d in range(DEVICES))
+        filename = write_measurement(os.path.join(tmp_dir, 'bench.tdms'),
+                                     channels, segments=20)
+
+        print('{0} channels, {1:.0f} MB, {2} workers'.format(
+            DEVICES * CHANNELS, os.path.getsize(filename) / 2**20, workers))
+        print('serial:    {0:.3f} s'.format(time_load(filename)))
+        print('threads:   {0:.3f} s'.format(time_load(filename,
+                                                      workers=workers)))
+        print('processes: {0:.3f} s'.format(time_load(filename,
+                                                      workers=workers,
+                                                      processes=True)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Benchmark calculating the transport channels one by one and in one pass.
+
+The eight transport channels are calculated from four inputs that were not
+read yet. One by one, the inputs are read as a whole and kept in memory.
+addTransportChannels calculates the channels in one pass that streams the
+inputs chunk by chunk.
+
+Usage: python benchmarks/bench_transport.py [samples]
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import os
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from TDMS2HDF5.ChannelModel import Channel, ChannelRegistry
+
+SAMPLES = 10000000
+KEYS = ('proc/V', 'proc/dV', 'proc/I', 'proc/dI', 'proc01/ADWin/RSample',
+        'proc01/ADWin/dRSample', 'proc/R', 'proc/dR')
+INPUTS = {'VSample': {'VAmp': 100.0}, 'ISample': {'IAmp': 1E6},
+          'dVSample': {'VAmp': 100.0, 'LVSens': 0.5},
+          'dISample': {'IAmp': 1E6, 'LISens': 0.1}}
+
+
+def make_registry(samples):
+    """Return a registry with the inputs of the transport channels.
+
+    The inputs are not read yet, like the channels of a lazily loaded file.
+    Reading them copies the data, like reading it from the file.
+
+    """
+    registry = ChannelRegistry()
+    for (name, attributes) in INPUTS.items():
+        data = np.random.random(samples) + 1
+        chan = Channel('ADWin/' + name, device='ADWin')
+        chan.setLoader(data.copy, samples, partial(iter_copies, data))
+        chan.setParent('proc01')
+        for (attributeName, value) in attributes.items():
+            chan.attributes[attributeName] = value
+        registry.addChannel(chan)
+    return registry
+
+
+def iter_copies(data, chunk_length):
+    """Yield copies of consecutive parts of data."""
+    for start in range(0, len(data), chunk_length):
+        yield data[start:start + chunk_length].copy()
+
+
+def one_by_one(registry):
+    """Add the transport channels one by one and read them."""
+    for add in (registry.add_V, registry.add_dV, registry.add_I,
+                registry.add_dI, registry.add_RSample, registry.add_dRSample,
+                registry.add_R, registry.add_dR):
+        add()
+    return [registry[key].data for key in KEYS]
+
+
+def fused(registry):
+    """Add the transport channels at once and read them."""
+    registry.addTransportChannels()
+    return [registry[key].data for key in KEYS]
+
+
+def measure(function, samples):
+    """Return the time and the peak memory beyond the results.
+
+    The memory is traced in a second run, tracing slows down the many small
+    allocations of the fused pass.
+
+    """
+    registry = make_registry(samples)
+    start = time.perf_counter()
+    results = function(registry)
+    seconds = time.perf_counter() - start
+    del results, registry
+
+    registry = make_registry(samples)
+    tracemalloc.start()
+    results = function(registry)
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (seconds, (peak - sum(r.nbytes for r in results)) / 2**20)
+
+
+def main(argv=None):
+    """Compare the two ways of calculating the transport channels."""
+
+    if argv is None:
+        argv = sys.argv
+
+    samples = int(argv[1]) if len(argv) > 1 else SAMPLES
+
+    print('{0} samples, {1:.0f} MB of results'.format(
+        samples, len(KEYS) * samples * 8 / 2**20))
+    for (name, function) in (('one by one', one_by_one), ('fused', fused)):
+        (seconds, temporaries) = measure(function, samples)
+        print('{0:10s}  {1:6.3f} s  {2:7.1f} MB besides the results'.format(
+            name, seconds, temporaries))
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,7 @@ setup(
     author='Christopher Espy',
     tests_require=['pytest'],
     install_requires=['numpy>=1.9.0',
-                      'npTDMS>=0.6.2',
+                      'npTDMS>=0.23',
                       'matplotlib>=1.4.0',
                       'six>=1.5.2',
                       'nose>=1.3.4',
@@ -62,6 +62,9 @@ setup(
     entry_points={
         'gui_scripts': [
             'tdms2hdf5 = TDMS2HDF5.tdms2hdf5:main'
+            ],
+        'console_scripts': [
+            'tdms2hdf5-convert = TDMS2HDF5.Converter:main'
             ]
         },
     author_email='github@konchris.de',
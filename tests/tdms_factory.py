@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Write small synthetic TDMS files for the tests
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+START_TIME = np.datetime64('2014-09-23T09:05:59', 'us')
+
+TYPE_CODES = {np.dtype('int8'): 0x01, np.dtype('int16'): 0x02,
+              np.dtype('int32'): 0x03, np.dtype('int64'): 0x04,
+              np.dtype('uint8'): 0x05, np.dtype('uint16'): 0x06,
+              np.dtype('uint32'): 0x07, np.dtype('uint64'): 0x08,
+              np.dtype('float32'): 0x09, np.dtype('float64'): 0x0A}
+
+
+def _string(value):
+    encoded = value.encode('utf-8')
+    return struct.pack('<I', len(encoded)) + encoded
+
+
+def _property(name, value):
+    if isinstance(value, str):
+        return _string(name) + struct.pack('<I', 0x20) + _string(value)
+    elif isinstance(value, bool):
+        return _string(name) + struct.pack('<I?', 0x21, value)
+    elif isinstance(value, np.datetime64):
+        micro_seconds = int((value - np.datetime64('1904-01-01T00:00:00',
+                                                   'us')) /
+                            np.timedelta64(1, 'us'))
+        seconds, rest = divmod(micro_seconds, 1000000)
+        fraction = (rest << 64) // 1000000
+        return _string(name) + struct.pack('<IQq', 0x44, fraction, seconds)
+    elif isinstance(value, int):
+        return _string(name) + struct.pack('<Ii', 0x03, value)
+    return _string(name) + struct.pack('<Id', 0x0A, value)
+
+
+def build_segment(objects, new_object_list=True, interleaved=False,
+                  meta_data=True):
+    """Return the bytes of one TDMS segment.
+
+    Parameters
+    ----------
+    objects : list
+        (path, properties, data) tuples. data is a numpy array or None for
+        objects without raw data.
+
+    """
+    toc = 0
+    metadata = b''
+    raw_arrays = []
+
+    if meta_data:
+        toc |= 1 << 1
+        metadata = struct.pack('<I', len(objects))
+        for (path, properties, data) in objects:
+            metadata += _string(path)
+            if data is None:
+                metadata += struct.pack('<I', 0xFFFFFFFF)
+            else:
+                data = np.asarray(data)
+                metadata += struct.pack('<IIIQ', 20, TYPE_CODES[data.dtype],
+                                        1, len(data))
+                raw_arrays.append(data)
+            metadata += struct.pack('<I', len(properties))
+            for (name, value) in properties.items():
+                metadata += _property(name, value)
+    else:
+        raw_arrays = [np.asarray(data) for (_, _, data) in objects
+                      if data is not None]
+
+    if new_object_list:
+        toc |= 1 << 2
+
+    raw = b''
+    if raw_arrays:
+        toc |= 1 << 3
+        if interleaved:
+            toc |= 1 << 5
+            rows = np.rec.fromarrays(raw_arrays)
+            raw = rows.tobytes()
+        else:
+            raw = b''.join(a.tobytes() for a in raw_arrays)
+
+    lead_in = b'TDSm' + struct.pack('<iiQQ', toc, 4713,
+                                    len(metadata) + len(raw), len(metadata))
+    return (lead_in + metadata + raw, lead_in + metadata)
+
+
+def measurement_objects(channels, start_time=START_TIME, increment=0.1,
+                        group_properties=None):
+    """Return the object list of a typical measurement file.
+
+    Parameters
+    ----------
+    channels : dict
+        {device: {channel: data}} of the waveform channels to write.
+
+    """
+    group_properties = group_properties or {}
+    end_time = start_time + np.timedelta64(1, 'h')
+    objects = [('/', OrderedDict([('StartTime', start_time),
+                                  ('EndTime', end_time)]), None)]
+
+    for (device, device_channels) in channels.items():
+        objects.append(("/'{0}'".format(device),
+                        group_properties.get(device, {}), None))
+        for (name, data) in device_channels.items():
+            properties = OrderedDict([('wf_start_time', start_time),
+                                      ('wf_increment', increment)])
+            objects.append(("/'{0}'/'{1}'".format(device, name), properties,
+                            np.asarray(data)))
+    return objects
+
+
+def write_measurement(filename, channels, segments=1, start_time=START_TIME,
+                      increment=0.1, group_properties=None, interleaved=False,
+                      index_file=False):
+    """Write a measurement TDMS file with the data split into segments.
+
+    The first segment contains the full meta data, the following segments
+    only the raw data indices of the channels.
+
+    """
+    objects = measurement_objects(channels, start_time, increment,
+                                  group_properties)
+    data_objects = [o for o in objects if o[2] is not None]
+    length = len(data_objects[0][2]) if data_objects else 0
+    bounds = np.linspace(0, length, segments + 1).astype(int)
+
+    with open(filename, 'wb') as tdms_file:
+        index = []
+        for i in range(segments):
+            part = [(p, props, None if d is None else d[bounds[i]:
+                                                       bounds[i + 1]])
+                    for (p, props, d) in objects]
+            if i == 0:
+                (segment, meta) = build_segment(part,
+                                                interleaved=interleaved)
+            else:
+                (segment, meta) = build_segment(
+                    [(p, {}, d) for (p, _, d) in part if d is not None],
+                    new_object_list=False, interleaved=interleaved)
+            tdms_file.write(segment)
+            index.append(b'TDSh' + meta[4:])
+
+    if index_file:
+        with open(filename + '_index', 'wb') as tdms_index:
+            tdms_index.write(b''.join(index))
+
+    return filename
@@ -15,11 +15,19 @@ __status__ = "Development"
 
 import unittest
 import os
+import shutil
+import tempfile
 from datetime import datetime
+from unittest import mock
 
 import numpy as np
 
-from TDMS2HDF5.ChannelModel import Channel, ChannelRegistry
+from TDMS2HDF5.ChannelModel import (Channel, ChannelRegistry,
+                                    chunked_calculation, rechunk,
+                                    channel_selected)
+from TDMS2HDF5.TDMSReader import UnsupportedTDMSError
+
+from tdms_factory import write_measurement, build_segment
 
 DATADIR = '/home/chris/Documents/PhD/root/raw-data/'
 DATADIR = os.path.join('Z:', 'root', 'raw-data')
@@ -62,6 +70,98 @@ class TestChannel(unittest.TestCase):
         self.assertFalse(np.array_equal(self.channel.getTimeTrack(),
                                         current_time_track))
 
+    def test_iter_data_in_chunks(self):
+        chunks = list(self.channel.iterData(30))
+        self.assertEqual([len(c) for c in chunks], [30, 30, 30, 10])
+        self.assertTrue(np.array_equal(np.concatenate(chunks),
+                                       self.channel.data))
+
+    def test_rechunk(self):
+        parts = [np.arange(7), np.arange(7, 8), np.arange(8, 25)]
+        chunks = list(rechunk(parts, 10))
+        self.assertEqual([len(c) for c in chunks], [10, 10, 5])
+        self.assertTrue(np.array_equal(np.concatenate(chunks),
+                                       np.arange(25)))
+
+    def test_time_track_calculated_on_access(self):
+        self.assertEqual(self.channel._timeTracks, {})
+        time_track = self.channel.getTimeTrack()
+        self.assertIs(self.channel.getTimeTrack(), time_track)
+        self.assertEqual(time_track[1] - time_track[0],
+                         self.channel.getTimeStep())
+
+    def test_time_track_follows_length(self):
+        self.assertEqual(len(self.channel.getElapsedTimeTrack()), 100)
+        self.channel.attributes['Length'] = 50
+        self.assertEqual(len(self.channel.getElapsedTimeTrack()), 50)
+        self.assertAlmostEqual(self.channel.getElapsedTimeTrack()[-1],
+                               49 / 60000)
+
+    def test_append_data_extends_time_track(self):
+        time_track = self.channel.getTimeTrack()
+        self.channel.appendData(np.arange(50))
+        self.channel.appendData(np.arange(50, 60))
+        self.assertEqual(self.channel.attributes['Length'], 160)
+        self.assertTrue(np.array_equal(self.channel.data[100:],
+                                       np.arange(60)))
+        self.channel._recalculateTimeArray()
+        self.assertTrue(np.array_equal(self.channel.getTimeTrack()[:100],
+                                       time_track))
+        self.assertEqual(len(self.channel.getElapsedTimeTrack()), 160)
+
+    def test_append_data_to_blocks(self):
+        data = self.channel.data
+        self.channel.appendData(np.arange(50))
+        self.assertTrue(np.array_equal(self.channel.readData(90, 110),
+                                       np.append(data[90:], np.arange(10))))
+        chunks = list(self.channel.iterData(60))
+        self.assertEqual([len(c) for c in chunks], [60, 60, 30])
+        self.assertTrue(np.array_equal(np.concatenate(chunks),
+                                       np.append(data, np.arange(50))))
+
+    def test_statistics_are_cached(self):
+        data = self.channel.data
+        data[5] = np.nan
+        statistics = self.channel.getStatistics(chunk_length=30)
+        self.assertEqual(statistics['nan_count'], 1)
+        self.assertEqual(statistics['count'], 99)
+        self.assertAlmostEqual(statistics['mean'], np.nanmean(data))
+        self.assertAlmostEqual(statistics['std'], np.nanstd(data))
+        self.assertEqual(statistics['max'], np.nanmax(data))
+        # Appended values are added to the statistics
+        self.channel.appendData(np.array([-1.0, 7.0]))
+        statistics = self.channel.getStatistics()
+        self.assertEqual((statistics['min'], statistics['max']), (-1.0, 7.0))
+        self.assertAlmostEqual(statistics['std'],
+                               np.nanstd(self.channel.data))
+        # New data replaces them
+        self.channel.data = np.ones(3)
+        self.assertEqual(self.channel.getStatistics()['std'], 0)
+
+    def test_channels_share_time_base(self):
+        other = Channel('TestChannel02', device='Virtual',
+                        meas_array=np.random.random(100))
+        other.setStartTime(self.channel.getStartTime())
+        self.assertIs(other.getTimeBase(), self.channel.getTimeBase())
+        self.assertIs(other.getTimeTrack(), self.channel.getTimeTrack())
+        self.assertFalse(other.getTimeTrack().flags.writeable)
+
+    def test_attributes_are_typed_with_overflow(self):
+        attributes = self.channel.attributes
+        attributes['Length'] = np.int64(100)
+        self.assertIs(type(attributes['Length']), int)
+        self.assertEqual(list(attributes), ['Device', 'TimeInterval',
+                                            'Length', 'StartTime'])
+        attributes['IAmp'] = 1E6
+        self.assertEqual(attributes['IAmp'], 1E6)
+        self.assertIn('IAmp', attributes)
+        self.assertEqual(len(attributes), 5)
+        del attributes['IAmp']
+        self.assertNotIn('IAmp', attributes)
+        with self.assertRaises(KeyError):
+            del attributes['Length']
+        self.assertFalse(hasattr(self.channel, '__dict__'))
+
     def test_toggle_write_to_file(self):
         current_write_state = self.channel.write_to_file
         self.channel.toggleWrite()
@@ -90,12 +190,791 @@ class TestChannelRegistry(unittest.TestCase):
             self.assertIsInstance(k, str)
             self.assertIsInstance(v, Channel)
 
+    def test_hierarchical_index(self):
+        for name in ('ADWin/ISample', 'ADWin/VSample', 'IPS/Magnetfield'):
+            chan = Channel(name, device=name.split('/')[0],
+                           meas_array=np.random.random(100))
+            chan.setParent('proc01')
+            self.channel_registry.addChannel(chan)
+        self.channel_registry['proc/R'] = self.test_channel
+
+        registry = self.channel_registry
+        self.assertEqual(registry.getParents(), ['proc01', 'proc'])
+        self.assertEqual(registry.getDevices('proc01'), ['ADWin', 'IPS'])
+        self.assertEqual(registry.getChannels('proc01', 'ADWin'),
+                         ['ISample', 'Time_m', 'VSample'])
+        self.assertEqual(registry.getTimeTrack('proc01', 'IPS'),
+                         'proc01/IPS/Time_m')
+        # Keys without a device are indexed under the channel's device
+        self.assertEqual(registry.getChannels('proc', 'Virtual'), ['R'])
+        self.assertEqual(registry.getKey('proc', 'Virtual', 'R'), 'proc/R')
+        self.assertEqual(registry.getKey('proc01', 'ADWin', 'ISample'),
+                         'proc01/ADWin/ISample')
+
+        del registry['proc01/IPS/Magnetfield']
+        registry.pop('proc01/IPS/Time_m')
+        registry.pop('proc/R')
+        self.assertEqual(registry.getParents(), ['proc01'])
+        self.assertEqual(registry.getDevices('proc01'), ['ADWin'])
+        self.assertIsNone(registry.getTimeTrack('proc01', 'IPS'))
+
+        registry.clear()
+        self.assertEqual(registry.getParents(), [])
+
+    def test_existing_time_track_is_used(self):
+        time = Channel('IPS/Time', device='IPS', meas_array=np.arange(10.0))
+        time.setParent('proc01')
+        self.channel_registry.addChannel(time)
+        field = Channel('IPS/Magnetfield', device='IPS',
+                        meas_array=np.zeros(10))
+        field.setParent('proc01')
+        self.channel_registry.addChannel(field)
+        self.assertEqual(sorted(self.channel_registry),
+                         ['proc01/IPS/Magnetfield', 'proc01/IPS/Time'])
+
     def test_add_resistance(self):
         pass
 
     def test_add_diff_resistance(self):
         pass
 
+class TestLazyLoading(unittest.TestCase):
+    """Tests reading the channel data only when it is needed."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.i_sample = np.random.random(500) + 1
+        self.v_sample = np.random.random(500)
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': self.i_sample, 'VSample': self.v_sample},
+             'IPS': {'Magnetfield': np.linspace(0, 1, 50)}},
+            segments=4, group_properties={'ADWin': {'IAmp': 1E6,
+                                                    'VAmp': 100.0}})
+        self.channel_registry = ChannelRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lazy_load_defers_reading(self):
+        self.channel_registry.loadFromFile(self.filename, lazy=True)
+        chan = self.channel_registry['proc01/ADWin/ISample']
+        self.assertFalse(chan.isLoaded())
+        self.assertEqual(chan.attributes['Length'], 500)
+        self.assertFalse(self.channel_registry['proc01/ADWin/RSample']
+                         .isLoaded())
+
+    def test_lazy_statistics(self):
+        self.channel_registry.loadFromFile(self.filename, lazy=True)
+        chan = self.channel_registry['proc01/ADWin/ISample']
+        statistics = chan.getStatistics(chunk_length=64)
+        self.assertFalse(chan.isLoaded())
+        self.assertAlmostEqual(statistics['mean'], self.i_sample.mean())
+        self.assertEqual(statistics['min'], self.i_sample.min())
+
+    def test_lazy_data_matches_eager_data(self):
+        eager_registry = ChannelRegistry()
+        eager_registry.loadFromFile(self.filename)
+        self.channel_registry.loadFromFile(self.filename, lazy=True)
+        for key in ('proc01/ADWin/ISample', 'proc01/ADWin/RSample',
+                    'proc01/IPS/Magnetfield'):
+            self.assertTrue(np.array_equal(self.channel_registry[key].data,
+                                           eager_registry[key].data))
+        self.assertTrue(np.allclose(
+            self.channel_registry['proc01/ADWin/RSample'].data,
+            self.v_sample / self.i_sample))
+
+    def test_falls_back_to_npTDMS(self):
+        eager_registry = ChannelRegistry()
+        eager_registry.loadFromFile(self.filename)
+        with mock.patch('TDMS2HDF5.ChannelModel.TDMSReader',
+                        side_effect=UnsupportedTDMSError('DAQmx')):
+            self.channel_registry.loadFromFile(self.filename, lazy=True)
+        for key in ('proc01/ADWin/ISample', 'proc01/ADWin/RSample',
+                    'proc01/IPS/Magnetfield'):
+            self.assertTrue(np.array_equal(self.channel_registry[key].data,
+                                           eager_registry[key].data))
+
+    def test_detached_loaders(self):
+        self.channel_registry.loadFromFile(self.filename, lazy=True)
+        loaders = self.channel_registry.detachedLoaders(
+            ['proc01/ADWin/RSample', 'proc01/ADWin/ISample'])
+        self.assertEqual(sorted(chan.name for (chan, _) in loaders),
+                         ['ADWin/ISample', 'ADWin/VSample'])
+        # The loaders leave the channels alone, their data is handed over
+        results = [loader() for (_, loader) in loaders]
+        self.assertFalse(any(chan.isLoaded() for (chan, _) in loaders))
+        for ((chan, _), data) in zip(loaders, results):
+            chan.setLoadedData(data)
+        self.assertEqual(self.channel_registry.detachedLoaders(
+            ['proc01/ADWin/RSample']), [])
+        self.assertTrue(np.allclose(
+            self.channel_registry['proc01/ADWin/RSample'].data,
+            self.v_sample / self.i_sample))
+
+    def test_memmap_load(self):
+        self.channel_registry.loadFromFile(self.filename, memmap=True,
+                                           scratch_dir=self.tmp_dir)
+        i_sample = self.channel_registry['proc01/ADWin/ISample'].data
+        r_sample = self.channel_registry['proc01/ADWin/RSample'].data
+        self.assertIsInstance(i_sample, np.memmap)
+        self.assertFalse(i_sample.flags.writeable)
+        self.assertIsInstance(r_sample, np.memmap)
+        self.assertTrue(np.array_equal(i_sample, self.i_sample))
+        self.assertTrue(np.allclose(r_sample, self.v_sample / self.i_sample))
+
+    def test_chunked_calculation(self):
+        result = chunked_calculation(lambda a, b: a / b,
+                                     [self.v_sample, self.i_sample],
+                                     self.tmp_dir, chunk_length=64)
+        self.assertTrue(np.allclose(result, self.v_sample / self.i_sample))
+    def test_parallel_load_matches_serial_load(self):
+        serial_registry = ChannelRegistry()
+        serial_registry.loadFromFile(self.filename)
+        for processes in (False, True):
+            self.channel_registry.loadFromFile(self.filename, workers=3,
+                                               processes=processes)
+            self.assertEqual(list(self.channel_registry.keys()),
+                             list(serial_registry.keys()))
+            for key in serial_registry.keys():
+                self.assertTrue(np.array_equal(
+                    self.channel_registry[key].data,
+                    serial_registry[key].data))
+                self.assertEqual(self.channel_registry[key].attributes,
+                                 serial_registry[key].attributes)
+
+    def test_preview_load(self):
+        self.channel_registry.loadFromFile(self.filename, preview=50)
+        chan = self.channel_registry['proc01/ADWin/ISample']
+        self.assertFalse(chan.isLoaded())
+        (indices, values) = chan.getPreview()
+        self.assertTrue(np.array_equal(indices, np.arange(0, 500, 10)))
+        self.assertTrue(np.array_equal(values, self.i_sample[indices]))
+        (_, r_values) = self.channel_registry['proc01/ADWin/RSample']\
+            .getPreview()
+        self.assertTrue(np.allclose(r_values, self.v_sample[indices] /
+                                    self.i_sample[indices]))
+        (_, time_values) = self.channel_registry['proc01/ADWin/Time_m']\
+            .getPreview()
+        self.assertTrue(np.allclose(time_values, indices * 0.1 / 60))
+        # The full data is still read when it is needed
+        self.assertTrue(np.array_equal(chan.data, self.i_sample))
+
+    def test_preview_of_renamed_channel_in_window(self):
+        # Lakeshore/Temperature is kept as Lakeshore/TSample_LK
+        temperature = np.random.random(500) + 4
+        filename = write_measurement(
+            os.path.join(self.tmp_dir, 'renamed.tdms'),
+            {'Lakeshore': {'Temperature': temperature}})
+        self.channel_registry.loadFromFile(
+            filename, preview=20, start_time=np.timedelta64(10, 's'),
+            end_time=np.timedelta64(30, 's'))
+        chan = self.channel_registry['proc01/Lakeshore/TSample_LK']
+        (indices, values) = chan.getPreview()
+        self.assertEqual(chan.attributes['Length'], 201)
+        self.assertTrue(np.array_equal(indices, np.arange(0, 201, 11)))
+        self.assertTrue(np.array_equal(values, temperature[100:301][indices]))
+
+    def test_single_precision_load(self):
+        for lazy in (False, True):
+            self.channel_registry.loadFromFile(
+                self.filename, lazy=lazy, raw_dtype=np.float32,
+                derived_dtype=np.float32)
+            chan = self.channel_registry['proc01/ADWin/ISample']
+            self.assertEqual(next(chan.iterData(100)).dtype, np.float32)
+            self.assertEqual(chan.data.dtype, np.float32)
+            self.assertTrue(np.array_equal(chan.data,
+                                           self.i_sample.astype(np.float32)))
+            r_sample = self.channel_registry['proc01/ADWin/RSample'].data
+            self.assertEqual(r_sample.dtype, np.float32)
+            self.assertTrue(np.allclose(r_sample,
+                                        self.v_sample / self.i_sample))
+            self.assertEqual(
+                self.channel_registry['proc01/ADWin/Time_m'].data.dtype,
+                np.float64)
+
+    def test_calibration_in_double_precision(self):
+        v_ruo = np.linspace(-4.5, 9, 500)
+        self.channel_registry.derived_dtype = np.float32
+        chan = Channel('ADWin/VRuO', device='ADWin',
+                       meas_array=v_ruo.astype(np.float32))
+        chan.setParent('proc01')
+        self.channel_registry.addChannel(chan)
+        self.channel_registry.add_TSample_AD()
+        res_ruo = v_ruo.astype(np.float32).astype(np.float64) * 270.5 + 3955
+        t_sample = self.channel_registry['proc01/ADWin/TSample_AD'].data
+        self.assertEqual(t_sample.dtype, np.float32)
+        self.assertTrue(np.allclose(
+            t_sample, np.exp(8.584 - 1.156 * np.log(res_ruo - 1259.9)),
+            rtol=1E-6))
+
+    def test_window_shares_memory(self):
+        self.channel_registry.loadFromFile(self.filename)
+        view = self.channel_registry.window(first=100, stop=200)
+        chan = view['proc01/ADWin/ISample']
+        self.assertTrue(np.shares_memory(
+            chan.data, self.channel_registry['proc01/ADWin/ISample'].data))
+        self.assertEqual(chan.attributes['Length'], 100)
+        self.assertEqual(chan.attributes['IAmp'], 1E6)
+        self.assertEqual(chan.getStartTime(),
+                         np.datetime64('2014-09-23T09:06:09'))
+        self.assertIs(chan.getTimeBase(), self.channel_registry[
+            'proc01/ADWin/ISample'].getTimeBase()[100:200])
+        self.assertTrue(np.allclose(view['proc01/ADWin/Time_m'].data,
+                                    np.arange(100, 200) * 0.1 / 60))
+        # Derived channels can be added to the window
+        del view['proc01/ADWin/RSample']
+        self.assertEqual(view.add_RSample(), [])
+        self.assertTrue(np.allclose(view['proc01/ADWin/RSample'].data,
+                                    self.v_sample[100:200] /
+                                    self.i_sample[100:200]))
+
+    def test_lazy_time_window_view(self):
+        self.channel_registry.loadFromFile(self.filename, lazy=True)
+        view = self.channel_registry.window(
+            np.datetime64('2014-09-23T09:06:09'), np.timedelta64(20, 's'))
+        chan = view['proc01/ADWin/ISample']
+        self.assertEqual(chan.attributes['Length'], 101)
+        self.assertTrue(np.array_equal(
+            np.concatenate(list(chan.iterData(30))), self.i_sample[100:201]))
+        # The derived channel is calculated for the window only
+        r_sample = view['proc01/ADWin/RSample'].data
+        self.assertTrue(np.allclose(r_sample, self.v_sample[100:201] /
+                                    self.i_sample[100:201]))
+        self.assertFalse(
+            self.channel_registry['proc01/ADWin/RSample'].isLoaded())
+
+    def test_time_window_load(self):
+        start = np.datetime64('2014-09-23T09:06:09')
+        for kwargs in ({}, {'lazy': True},
+                       {'memmap': True, 'scratch_dir': self.tmp_dir}):
+            self.channel_registry.loadFromFile(
+                self.filename, start_time=start,
+                end_time=np.timedelta64(20, 's'), **kwargs)
+            chan = self.channel_registry['proc01/ADWin/ISample']
+            self.assertEqual(chan.attributes['Length'], 101)
+            self.assertEqual(chan.getStartTime(), start)
+            self.assertTrue(np.array_equal(chan.data, self.i_sample[100:201]))
+            self.assertEqual(len(chan.getTimeTrack()), 101)
+            self.assertTrue(np.allclose(
+                self.channel_registry['proc01/ADWin/RSample'].data,
+                self.v_sample[100:201] / self.i_sample[100:201]))
+            time_m = self.channel_registry['proc01/ADWin/Time_m'].data
+            self.assertAlmostEqual(time_m[0], 10 / 60)
+            self.assertAlmostEqual(time_m[-1], 20 / 60)
+
+class TestSelectiveLoading(unittest.TestCase):
+    """Tests loading only the channels matching patterns."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': np.random.random(100) + 1,
+                       'VSample': np.random.random(100)},
+             'IPS': {'Magnetfield': np.linspace(0, 1, 10),
+                     'Current': np.linspace(0, 1, 10)}})
+        self.channel_registry = ChannelRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_channel_selected(self):
+        self.assertTrue(channel_selected('ADWin/ISample'))
+        self.assertTrue(channel_selected('ADWin/ISample', ['ADWin/*']))
+        self.assertTrue(channel_selected('ADWin/ISample', ['ADWin']))
+        self.assertFalse(channel_selected('IPS/Current', ['ADWin/*',
+                                                          'IPS/Magnetfield']))
+        self.assertFalse(channel_selected('ADWin/ISample', ['ADWin'],
+                                          ['*/ISample']))
+
+    def test_include_patterns(self):
+        self.channel_registry.loadFromFile(
+            self.filename, include=['ADWin/*', 'IPS/Magnetfield'])
+        self.assertIn('proc01/ADWin/RSample', self.channel_registry)
+        self.assertIn('proc01/IPS/Magnetfield', self.channel_registry)
+        self.assertNotIn('proc01/IPS/Current', self.channel_registry)
+
+    def test_exclude_reports_missing_inputs(self):
+        self.channel_registry.loadFromFile(self.filename,
+                                           exclude=['ADWin/VSample'])
+        self.assertNotIn('proc01/ADWin/VSample', self.channel_registry)
+        self.assertNotIn('proc01/ADWin/RSample', self.channel_registry)
+        self.assertEqual(
+            self.channel_registry.missing_inputs['proc01/ADWin/RSample'],
+            ['proc01/ADWin/VSample'])
+        self.assertEqual(self.channel_registry.add_RSample(),
+                         ['proc01/ADWin/VSample'])
+
+class TestStepEncoding(unittest.TestCase):
+    """Tests keeping rarely changing channels step encoded."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.i_sample = np.random.random(1000) + 1
+        self.field = np.repeat([0.0, 1.5], [600, 400])
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': self.i_sample},
+             'IPS': {'Magnetfield': self.field}}, segments=3)
+        self.channel_registry = ChannelRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_detects_steps(self):
+        self.channel_registry.loadFromFile(self.filename, step_encoding=True)
+        chan = self.channel_registry['proc01/IPS/Magnetfield']
+        self.assertFalse(chan.isLoaded())
+        self.assertTrue(np.array_equal(chan.getSteps().indices, [0, 600]))
+        self.assertTrue(np.array_equal(chan.data, self.field))
+        self.assertIsNone(
+            self.channel_registry['proc01/ADWin/ISample'].getSteps())
+
+        self.channel_registry.loadFromFile(self.filename)
+        self.assertIsNone(
+            self.channel_registry['proc01/IPS/Magnetfield'].getSteps())
+
+    def test_update_appends_steps(self):
+        self.channel_registry.loadFromFile(self.filename, step_encoding=True)
+        (segment, _) = build_segment(
+            [("/'ADWin'/'ISample'", {}, np.ones(10)),
+             ("/'IPS'/'Magnetfield'", {}, np.full(10, 2.0))],
+            new_object_list=False)
+        with open(self.filename, 'ab') as tdms_file:
+            tdms_file.write(segment)
+
+        self.channel_registry.updateFromFile()
+        chan = self.channel_registry['proc01/IPS/Magnetfield']
+        self.assertTrue(np.array_equal(chan.getSteps().indices,
+                                       [0, 600, 1000]))
+        self.assertTrue(np.array_equal(
+            chan.data, np.append(self.field, np.full(10, 2.0))))
+
+    def test_offset_keeps_steps(self):
+        t_adwin = np.repeat([4.0, 4.2], [600, 400])
+        t_lakeshore = np.random.random(1000) + 3.9
+        filename = write_measurement(
+            os.path.join(self.tmp_dir, 'offset.tdms'),
+            {'ADWin': {'TSample': t_adwin},
+             'Lakeshore': {'Temperature': t_lakeshore}})
+        self.channel_registry.loadFromFile(filename, step_encoding=True)
+        chan = self.channel_registry['proc01/ADWin/TSample']
+        offset = t_adwin.mean() - t_lakeshore.mean()
+        self.assertTrue(np.array_equal(chan.getSteps().indices, [0, 600]))
+
+        (segment, _) = build_segment(
+            [("/'ADWin'/'TSample'", {}, np.full(10, 4.3)),
+             ("/'Lakeshore'/'Temperature'", {}, np.full(10, 4.0))],
+            new_object_list=False)
+        with open(filename, 'ab') as tdms_file:
+            tdms_file.write(segment)
+        self.channel_registry.updateFromFile()
+
+        self.assertEqual(len(chan.getSteps()), 1010)
+        self.assertEqual(len(chan.data), chan.attributes['Length'])
+        self.assertTrue(np.allclose(
+            chan.data, np.append(t_adwin, np.full(10, 4.3)) - offset))
+
+class TestDerivedChannels(unittest.TestCase):
+    """Tests calculating derived channels when they are first read."""
+
+    def setUp(self):
+        self.channel_registry = ChannelRegistry()
+        self.dv_sample = np.random.random(100)
+        self.di_sample = np.random.random(100) + 1
+        for (name, data, attributes) in (
+                ('dVSample', self.dv_sample, {'VAmp': 100.0, 'LVSens': 0.5}),
+                ('dISample', self.di_sample, {'IAmp': 1E6, 'LISens': 0.1})):
+            chan = Channel(name, device='ADWin', meas_array=data)
+            chan.setParent('proc01')
+            for (attributeName, value) in attributes.items():
+                chan.attributes[attributeName] = value
+            self.channel_registry.addChannel(chan)
+
+    def expected_dR(self, dv_sample, l_v_sens=0.5):
+        dV = dv_sample / 100.0 / 10 * l_v_sens * 1E3
+        dI = self.di_sample / 1E6 / 10 * 0.1 * 1E6
+        return dV / dI
+
+    def test_derived_channels_are_calculated_when_read(self):
+        self.assertEqual(self.channel_registry.addTransportChannels(),
+                         {'proc/V': ['proc01/ADWin/VSample'],
+                          'proc/I': ['proc01/ADWin/ISample'],
+                          'proc01/ADWin/RSample': ['proc01/ADWin/ISample',
+                                                   'proc01/ADWin/VSample'],
+                          'proc01/ADWin/dRSample': ['proc01/ADWin/dISample',
+                                                    'proc01/ADWin/dVSample'],
+                          'proc/R': ['proc01/I', 'proc01/V']})
+        for key in ('proc/dV', 'proc/dI', 'proc/dR'):
+            self.assertFalse(self.channel_registry[key].isLoaded())
+        dR = self.channel_registry['proc/dR']
+        self.assertTrue(np.allclose(dR.data, self.expected_dR(self.dv_sample)))
+        self.assertIs(dR.data, dR.data)
+
+    def test_derived_channels_are_indexed_under_their_device(self):
+        self.channel_registry.addTransportChannels()
+        registry = self.channel_registry
+        self.assertEqual(registry.getDevices('proc'), ['ADWin'])
+        self.assertEqual(sorted(registry.getChannels('proc', 'ADWin')),
+                         ['dI', 'dR', 'dV'])
+        self.assertEqual(registry.getKey('proc', 'ADWin', 'dR'), 'proc/dR')
+        self.assertEqual(registry.devices, ['ADWin'])
+        # No time tracks of bogus devices like 'dR'
+        self.assertEqual(registry.getDevices('proc01'), ['ADWin'])
+
+        del registry['proc/dR']
+        self.assertEqual(sorted(registry.getChannels('proc', 'ADWin')),
+                         ['dI', 'dV'])
+
+    def test_transport_channels_of_a_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        v_sample = np.random.random(100)
+        i_sample = np.random.random(100) + 1
+        filename = write_measurement(
+            os.path.join(tmp_dir, 'test.tdms'),
+            {'ADWin': {'VSample': v_sample, 'ISample': i_sample,
+                       'dVSample': self.dv_sample,
+                       'dISample': self.di_sample}},
+            group_properties={'ADWin': {'IAmp': 1E6, 'VAmp': 100.0,
+                                        'LVSens': 0.5, 'LISens': 0.1}})
+        registry = ChannelRegistry()
+        registry.loadFromFile(filename, lazy=True)
+        self.assertEqual(registry.addTransportChannels(), {})
+        for key in ('proc/V', 'proc/dV', 'proc/I', 'proc/dI', 'proc/R',
+                    'proc/dR', 'proc01/ADWin/RSample',
+                    'proc01/ADWin/dRSample'):
+            self.assertIn(key, registry)
+        self.assertTrue(np.allclose(registry['proc/dR'].data,
+                                    self.expected_dR(self.dv_sample)))
+        # All of them were calculated in one pass, streaming the inputs
+        self.assertTrue(registry['proc/R'].isLoaded())
+        self.assertFalse(registry['proc01/ADWin/VSample'].isLoaded())
+        self.assertTrue(np.allclose(registry['proc/R'].data,
+                                    (v_sample / 100.0 * 1E3) /
+                                    (i_sample / 1E6 * 1E6)))
+
+    def test_transport_channels_are_calculated_in_one_pass(self):
+        reads = []
+
+        def lazy(key, data):
+            chan = self.channel_registry[key]
+            chan.setLoader(lambda: reads.append((key, 'all')) or data,
+                           len(data),
+                           lambda chunk_length: reads.append(key) or
+                           (data[i:i + chunk_length]
+                            for i in range(0, len(data), chunk_length)))
+
+        lazy('proc01/dVSample', self.dv_sample)
+        lazy('proc01/dISample', self.di_sample)
+        self.channel_registry.addTransportChannels()
+        self.assertEqual(reads, [])
+
+        self.channel_registry.setMemoryBudget(None)
+        dR = self.channel_registry['proc/dR'].data
+        # The results calculated along with it are handed to the channels
+        for key in ('proc/dV', 'proc/dI'):
+            self.assertTrue(self.channel_registry[key].isLoaded())
+        # Only dR, dV and dI are in memory, the inputs were streamed
+        usage = self.channel_registry.getMemoryUsage()
+        self.assertEqual(usage['used_bytes'], 3 * 800)
+        dV = self.channel_registry['proc/dV'].data
+        dI = self.channel_registry['proc/dI'].data
+        self.assertEqual(sorted(reads),
+                         ['proc01/dISample', 'proc01/dVSample'])
+        self.assertTrue(np.allclose(dR, self.expected_dR(self.dv_sample)))
+        self.assertTrue(np.allclose(dV / dI, dR))
+
+        # A changed input calculates all of them again
+        self.channel_registry['proc01/dVSample'].data = 2 * self.dv_sample
+        self.assertTrue(np.allclose(self.channel_registry['proc/dR'].data,
+                                    self.expected_dR(2 * self.dv_sample)))
+        self.assertTrue(np.allclose(self.channel_registry['proc/dV'].data,
+                                    2 * dV))
+
+    def test_changed_attribute_invalidates_dependents(self):
+        self.channel_registry.addTransportChannels()
+        dR = self.channel_registry['proc/dR']
+        dR.data
+        self.channel_registry['proc01/dVSample'].attributes['LVSens'] = 2.0
+        self.assertFalse(dR.isLoaded())
+        self.assertTrue(np.allclose(dR.data,
+                                    self.expected_dR(self.dv_sample, 2.0)))
+
+    def test_changed_input_invalidates_dependents(self):
+        self.channel_registry.addTransportChannels()
+        dR = self.channel_registry['proc/dR']
+        dR.data
+        self.channel_registry['proc01/dVSample'].data = 2 * self.dv_sample
+        self.assertFalse(dR.isLoaded())
+        self.assertTrue(np.allclose(dR.data,
+                                    self.expected_dR(2 * self.dv_sample)))
+
+        # Replacing the input channel derives the channels from the new one
+        chan = Channel('dVSample', device='ADWin',
+                       meas_array=3 * self.dv_sample)
+        chan.setParent('proc01')
+        chan.attributes['VAmp'] = 100.0
+        chan.attributes['LVSens'] = 1.0
+        self.channel_registry.addChannel(chan)
+        self.assertTrue(np.allclose(dR.data,
+                                    self.expected_dR(3 * self.dv_sample,
+                                                     1.0)))
+
+    def test_expression_channel(self):
+        registry = self.channel_registry
+        self.assertEqual(registry.addExpression(
+            'proc01/Rdiff', 'dVSample / dISample * LVSens / 10'), [])
+        chan = registry['proc01/Rdiff']
+        self.assertFalse(chan.isLoaded())
+        expected = self.dv_sample / self.di_sample * 0.5 / 10
+        self.assertTrue(np.allclose(np.concatenate(list(chan.iterData(32))),
+                                    expected))
+        self.assertTrue(np.allclose(chan.data, expected))
+
+        registry['proc01/dVSample'].attributes['LVSens'] = 1.0
+        self.assertTrue(np.allclose(chan.data, 2 * expected))
+
+        self.assertEqual(registry.addExpression('proc01/x', 'dVSample * k'),
+                         ['k'])
+        self.assertEqual(registry.missing_inputs['proc01/x'], ['k'])
+        with self.assertRaises(ValueError):
+            registry.addExpression('proc01/x', 'dVSample *')
+        # Attributes that are not numbers fail when the channel is added
+        with self.assertRaises(ValueError):
+            registry.addExpression('proc01/x', 'dVSample * Device')
+        self.assertNotIn('proc01/x', registry)
+
+    def test_expression_of_other_devices(self):
+        field = Channel('IPS/Magnetfield', device='IPS',
+                        meas_array=np.linspace(0, 1, 100))
+        field.setParent('proc01')
+        self.channel_registry.addChannel(field)
+        self.channel_registry.addExpression(
+            'proc01/IPS/Scaled', 'sqrt(B) * dI',
+            {'B': 'proc01/IPS/Magnetfield', 'dI': 'proc01/dISample'})
+        self.assertEqual(self.channel_registry.missing_inputs, {})
+        self.assertTrue(np.allclose(
+            self.channel_registry['proc01/IPS/Scaled'].data,
+            np.sqrt(np.linspace(0, 1, 100)) * self.di_sample))
+
+class TestHistory(unittest.TestCase):
+    """Tests undoing, redoing and replaying processing steps."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.i_sample = np.random.random(500) + 1
+        self.v_sample = np.random.random(500)
+        self.t_adwin = np.random.random(500) + 4.0
+        self.t_lakeshore = np.random.random(500) + 3.9
+        self.field = np.linspace(0, 1, 50)
+        self.field[[10, 11, 30]] = 0.0
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': self.i_sample, 'VSample': self.v_sample,
+                       'TSample': self.t_adwin},
+             'Lakeshore': {'Temperature': self.t_lakeshore},
+             'IPS': {'Magnetfield': self.field}},
+            segments=2, group_properties={'ADWin': {'IAmp': 1E6,
+                                                    'VAmp': 100.0}})
+        self.channel_registry = ChannelRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_undo_temperature_offset(self):
+        for lazy in (False, True):
+            self.channel_registry.loadFromFile(self.filename, lazy=lazy)
+            chan = self.channel_registry['proc01/ADWin/TSample']
+            offset = self.t_adwin.mean() - self.t_lakeshore.mean()
+            self.assertTrue(np.allclose(chan.data, self.t_adwin - offset))
+            mods = list(self.channel_registry.mods)
+            changes = []
+            chan.addListener(lambda: changes.append(chan))
+
+            step = self.channel_registry.undo()
+            self.assertEqual(step.name, 'removeADWinTempOffset')
+            # The channels derived from it are calculated again
+            self.assertTrue(changes)
+            self.assertTrue(np.allclose(chan.data, self.t_adwin))
+            self.assertEqual(len(self.channel_registry.mods), len(mods) - 1)
+            self.assertIsNone(self.channel_registry._tempOffset)
+
+            self.channel_registry.redo()
+            self.assertTrue(np.allclose(chan.data, self.t_adwin - offset))
+            self.assertEqual(self.channel_registry.mods, mods)
+
+    def test_temperature_offset_with_nan(self):
+        self.t_lakeshore[5] = np.nan
+        filename = write_measurement(
+            os.path.join(self.tmp_dir, 'nan.tdms'),
+            {'ADWin': {'TSample': self.t_adwin},
+             'Lakeshore': {'Temperature': self.t_lakeshore}})
+        self.channel_registry.loadFromFile(filename)
+        offset = np.mean(self.t_adwin) - np.mean(self.t_lakeshore)
+        self.assertTrue(np.isnan(offset))
+        (key, tempOffset) = self.channel_registry._tempOffset
+        self.assertEqual(key, 'proc01/ADWin/TSample')
+        self.assertTrue(np.isnan(tempOffset))
+
+    def test_undo_magnetfield_zeros(self):
+        self.channel_registry.loadFromFile(self.filename)
+        field = self.channel_registry['proc01/IPS/Magnetfield']
+        time = field.time
+        self.channel_registry.removeMagetfieldZeros()
+        self.assertEqual(len(field.data), 46)
+        self.assertEqual(field.attributes['Length'], 46)
+        self.assertTrue(np.all(field.data != 0))
+        self.assertTrue(np.array_equal(field.time, time[self.field != 0]))
+
+        self.channel_registry.undo()
+        self.assertTrue(np.array_equal(field.data, self.field))
+        self.assertEqual(field.attributes['Length'], 50)
+        self.assertTrue(np.array_equal(field.time, time))
+        self.assertTrue(np.array_equal(
+            self.channel_registry['proc01/IPS/Time_m'].data,
+            field.elapsed_time))
+
+        self.channel_registry.redo()
+        self.assertTrue(np.array_equal(field.data,
+                                       self.field[self.field != 0]))
+        self.assertEqual(field.attributes['Length'], 46)
+        self.assertTrue(np.array_equal(field.time, time[self.field != 0]))
+        self.assertTrue(np.array_equal(
+            self.channel_registry['proc01/IPS/Time_m'].data,
+            field.elapsed_time))
+
+    def test_undo_added_channels(self):
+        self.channel_registry.loadFromFile(self.filename)
+        del self.channel_registry['proc01/ADWin/RSample']
+        keys = set(self.channel_registry)
+        steps = len(self.channel_registry.history)
+        v_sample = self.channel_registry['proc01/ADWin/VSample']
+        listeners = v_sample.getListeners()
+        self.channel_registry.add_RSample()
+        self.assertIn('proc01/ADWin/RSample', self.channel_registry)
+        self.assertEqual(len(v_sample.getListeners()), len(listeners) + 1)
+
+        self.channel_registry.undo()
+        self.assertEqual(set(self.channel_registry), keys)
+        self.assertEqual(v_sample.getListeners(), listeners)
+        self.channel_registry.redo()
+        self.assertIn('proc01/ADWin/RSample', self.channel_registry)
+
+        # The steps taken by a step are undone with it
+        self.channel_registry.undo()
+        self.channel_registry.addTransportChannels()
+        self.assertEqual(len(self.channel_registry.history), steps + 1)
+        self.assertEqual(self.channel_registry.history[-1].name,
+                         'addTransportChannels')
+        self.assertIn('proc01/ADWin/RSample', self.channel_registry)
+        self.channel_registry.undo()
+        self.assertEqual(set(self.channel_registry), keys)
+
+        # A new step discards the undone ones
+        self.channel_registry.add_RSample()
+        self.assertIsNone(self.channel_registry.redo())
+
+    def test_replay_history(self):
+        self.channel_registry.loadFromFile(self.filename)
+        self.channel_registry.removeMagetfieldZeros()
+        self.channel_registry.addTransportChannels()
+
+        other_registry = ChannelRegistry()
+        other_registry.loadFromFile(self.filename)
+        other_registry.replayHistory(self.channel_registry.history)
+        self.assertEqual(other_registry.mods, self.channel_registry.mods)
+        self.assertEqual(len(other_registry.history),
+                         len(self.channel_registry.history))
+        self.assertEqual(set(other_registry), set(self.channel_registry))
+        self.assertEqual(len(other_registry['proc01/IPS/Magnetfield'].data),
+                         46)
+
+class TestFollowFile(unittest.TestCase):
+    """Tests following a TDMS file while it is being written."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.i_sample = np.random.random(100) + 1
+        self.v_sample = np.random.random(100)
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': self.i_sample, 'VSample': self.v_sample},
+             'IPS': {'Magnetfield': np.linspace(0, 1, 10)}},
+            group_properties={'ADWin': {'IAmp': 1E6, 'VAmp': 100.0}})
+        self.channel_registry = ChannelRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def append(self, i_sample, v_sample):
+        (segment, _) = build_segment(
+            [("/'ADWin'/'ISample'", {}, i_sample),
+             ("/'ADWin'/'VSample'", {}, v_sample),
+             ("/'IPS'/'Magnetfield'", {}, np.ones(len(i_sample) // 10))],
+            new_object_list=False)
+        with open(self.filename, 'ab') as tdms_file:
+            tdms_file.write(segment)
+
+    def test_update_appends_new_values(self):
+        self.channel_registry.loadFromFile(self.filename)
+        self.assertEqual(self.channel_registry.updateFromFile(), [])
+
+        new_i = np.random.random(20) + 1
+        new_v = np.random.random(20)
+        self.append(new_i, new_v)
+        updated = self.channel_registry.updateFromFile()
+
+        self.assertIn('proc01/ADWin/ISample', updated)
+        self.assertIn('proc01/ADWin/RSample', updated)
+        self.assertIn('proc01/ADWin/Time_m', updated)
+
+        chan = self.channel_registry['proc01/ADWin/ISample']
+        self.assertTrue(np.array_equal(
+            chan.data, np.concatenate((self.i_sample, new_i))))
+        self.assertEqual(len(chan.getTimeTrack()), 120)
+        self.assertTrue(np.allclose(
+            self.channel_registry['proc01/ADWin/RSample'].data,
+            np.concatenate((self.v_sample / self.i_sample, new_v / new_i))))
+
+        time_m = self.channel_registry['proc01/ADWin/Time_m'].data
+        self.assertEqual(len(time_m), 120)
+        self.assertAlmostEqual(time_m[-1], 119 * 0.1 / 60)
+
+    def test_update_renamed_channels(self):
+        # Lakeshore/Temperature is kept as Lakeshore/TSample_LK
+        temperature = np.random.random(10) + 4
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'renamed.tdms'),
+            {'Lakeshore': {'Temperature': temperature}})
+        self.channel_registry.loadFromFile(self.filename)
+        (segment, _) = build_segment(
+            [("/'Lakeshore'/'Temperature'", {}, np.full(5, 5.0))],
+            new_object_list=False)
+        with open(self.filename, 'ab') as tdms_file:
+            tdms_file.write(segment)
+
+        updated = self.channel_registry.updateFromFile()
+        self.assertIn('proc01/Lakeshore/TSample_LK', updated)
+        self.assertTrue(np.array_equal(
+            self.channel_registry['proc01/Lakeshore/TSample_LK'].data,
+            np.append(temperature, np.full(5, 5.0))))
+
+    def test_update_lazy_channels(self):
+        self.channel_registry.loadFromFile(self.filename, lazy=True)
+        new_i = np.random.random(20) + 1
+        self.append(new_i, np.random.random(20))
+        self.channel_registry.updateFromFile()
+
+        chan = self.channel_registry['proc01/ADWin/ISample']
+        self.assertFalse(chan.isLoaded())
+        self.assertEqual(chan.attributes['Length'], 120)
+        self.assertTrue(np.array_equal(
+            chan.data, np.concatenate((self.i_sample, new_i))))
+        self.assertEqual(
+            len(self.channel_registry['proc01/ADWin/RSample'].data), 120)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Test the appendable block storage of channels
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import unittest
+
+import numpy as np
+
+from TDMS2HDF5.ChunkedArray import ChunkedArray
+
+
+class TestChunkedArray(unittest.TestCase):
+    """Tests the array stored as a list of blocks."""
+
+    def setUp(self):
+        self.values = np.arange(25, dtype='float64')
+        self.array = ChunkedArray(self.values[:3], block_length=4)
+        for start in range(3, 25, 5):
+            self.array.append(self.values[start:start + 5])
+
+    def test_append_fills_blocks(self):
+        self.assertEqual(len(self.array), 25)
+        chunks = list(self.array.iterChunks())
+        # The initial values are the first block, then blocks of four
+        self.assertEqual([len(c) for c in chunks], [3, 4, 4, 4, 4, 4, 2])
+        self.assertTrue(np.array_equal(np.concatenate(chunks), self.values))
+
+    def test_read_across_blocks(self):
+        self.assertTrue(np.array_equal(self.array.read(2, 17),
+                                       self.values[2:17]))
+        self.assertTrue(np.array_equal(self.array.read(-3),
+                                       self.values[-3:]))
+        self.assertEqual(len(self.array.read(30)), 0)
+
+    def test_to_array_keeps_room(self):
+        consolidated = self.array.toArray()
+        self.assertTrue(np.array_equal(consolidated, self.values))
+        # Only one block_length of room is kept, not a second copy
+        self.assertEqual(self.array.nbytes, (25 + 4) * 8)
+        self.array.append(np.arange(4.0))
+        # The values fit into the room of the consolidated block
+        self.assertTrue(np.shares_memory(self.array.toArray(), consolidated))
+        self.assertTrue(np.array_equal(consolidated, self.values))
+        self.assertEqual(len(self.array.toArray()), 29)
+
+    def test_append_wider_values(self):
+        array = ChunkedArray(np.arange(5, dtype='int32'), block_length=4)
+        array.append(np.array([0.5]))
+        self.assertEqual(array.dtype, np.float64)
+        self.assertTrue(np.array_equal(array.toArray(),
+                                       [0, 1, 2, 3, 4, 0.5]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Test the streaming TDMS to HDF5 converter
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy as np
+
+from TDMS2HDF5.Converter import tdms_to_hdf5, STEPS_FORMAT_VERSION
+
+from tdms_factory import write_measurement
+
+
+class TestConverter(unittest.TestCase):
+    """Tests streaming a TDMS file into an HDF5 file."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.i_sample = np.random.random(5000) + 1
+        self.v_sample = np.random.random(5000)
+        self.tdms_file = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': self.i_sample, 'VSample': self.v_sample}},
+            segments=9, group_properties={'ADWin': {'IAmp': 1E6,
+                                                    'VAmp': 100.0}})
+        self.hdf5_file = os.path.join(self.tmp_dir, 'test.hdf5')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_streamed_conversion(self):
+        # Roughly 100 values per chunk
+        registry = tdms_to_hdf5(self.tdms_file, self.hdf5_file,
+                                chunk_mb=800 / 2**20)
+
+        with h5py.File(self.hdf5_file, 'r') as hdf5_file:
+            self.assertTrue(np.array_equal(
+                hdf5_file['proc01/ADWin/ISample'][:], self.i_sample))
+            self.assertTrue(np.allclose(
+                hdf5_file['proc01/ADWin/RSample'][:],
+                self.v_sample / self.i_sample))
+            self.assertEqual(hdf5_file['proc01/ADWin/ISample']
+                             .attrs['Length'], 5000)
+            self.assertIn('StartTime', hdf5_file.attrs)
+            attrs = hdf5_file['proc01/ADWin/VSample'].attrs
+            self.assertAlmostEqual(attrs['Mean'], self.v_sample.mean())
+            self.assertAlmostEqual(attrs['StdDev'], self.v_sample.std())
+            self.assertEqual(attrs['Maximum'], self.v_sample.max())
+            self.assertEqual(attrs['NaNCount'], 0)
+
+        # Nothing was read into the registry
+        self.assertFalse(registry['proc01/ADWin/ISample'].isLoaded())
+        self.assertFalse(registry['proc01/ADWin/RSample'].isLoaded())
+
+    def test_single_precision_conversion(self):
+        tdms_to_hdf5(self.tdms_file, self.hdf5_file, dtype=np.float32)
+
+        with h5py.File(self.hdf5_file, 'r') as hdf5_file:
+            self.assertEqual(hdf5_file['proc01/ADWin/ISample'].dtype,
+                             np.float32)
+            self.assertEqual(hdf5_file['proc01/ADWin/RSample'].dtype,
+                             np.float32)
+            self.assertTrue(np.allclose(
+                hdf5_file['proc01/ADWin/RSample'][:],
+                self.v_sample / self.i_sample))
+
+    def test_step_encoded_conversion(self):
+        field = np.repeat([0.0, 1.5, 0.5], [2000, 2500, 500])
+        tdms_file = write_measurement(
+            os.path.join(self.tmp_dir, 'steps.tdms'),
+            {'IPS': {'Magnetfield': field}}, segments=3)
+        tdms_to_hdf5(tdms_file, self.hdf5_file, steps=True)
+
+        with h5py.File(self.hdf5_file, 'r') as hdf5_file:
+            self.assertEqual(hdf5_file.attrs['FormatVersion'],
+                             STEPS_FORMAT_VERSION)
+            dset = hdf5_file['proc01/IPS/Magnetfield']
+            self.assertEqual(dset.attrs['Encoding'], b'steps')
+            self.assertTrue(np.array_equal(dset['Index'], [0, 2000, 4500]))
+            self.assertTrue(np.array_equal(
+                np.repeat(dset['Value'], np.diff(np.append(
+                    dset['Index'], dset.attrs['Length']))), field))
+            self.assertAlmostEqual(dset.attrs['Mean'], field.mean())
+            # Channels that change all the time are written as they are
+            self.assertEqual(hdf5_file['proc01/IPS/Time_m'].shape, (5000,))
+
+    def test_plain_arrays_by_default(self):
+        field = np.repeat([0.0, 1.5], [2000, 3000])
+        tdms_file = write_measurement(
+            os.path.join(self.tmp_dir, 'steps.tdms'),
+            {'IPS': {'Magnetfield': field}})
+        tdms_to_hdf5(tdms_file, self.hdf5_file)
+
+        with h5py.File(self.hdf5_file, 'r') as hdf5_file:
+            self.assertNotIn('FormatVersion', hdf5_file.attrs)
+            dset = hdf5_file['proc01/IPS/Magnetfield']
+            self.assertNotIn('Encoding', dset.attrs)
+            self.assertTrue(np.array_equal(dset[:], field))
+
+if __name__ == "__main__":
+    unittest.main()
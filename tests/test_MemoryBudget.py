@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Test the memory budget of the channel data
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from TDMS2HDF5.ChannelModel import Channel, ChannelRegistry
+from TDMS2HDF5.MemoryBudget import MemoryBudget
+
+from tdms_factory import write_measurement, build_segment
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """Tests spilling the least recently used channel data."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.registry = ChannelRegistry()
+        self.registry.scratch_dir = self.tmp_dir
+        for name in ('A', 'B', 'C'):
+            chan = Channel('ADWin/' + name, device='ADWin',
+                           meas_array=np.arange(1000, dtype='float64'))
+            chan.setParent('proc01')
+            self.registry.addChannel(chan)
+
+    def tearDown(self):
+        self.registry.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_least_recently_used_is_spilled(self):
+        # Room for two of the three channels
+        self.registry.setMemoryBudget(16000)
+        (a, b, c) = [self.registry['proc01/ADWin/' + name]
+                     for name in ('A', 'B', 'C')]
+        self.assertTrue(a.isSpilled())
+        self.assertFalse(b.isSpilled() or c.isSpilled())
+
+        b.data
+        self.assertTrue(np.array_equal(a.data, np.arange(1000)))
+        self.assertFalse(a.isSpilled())
+        self.assertTrue(c.isSpilled())
+        self.assertFalse(b.isSpilled())
+
+        usage = self.registry.getMemoryUsage()
+        self.assertEqual(usage['used_bytes'], 16000)
+        self.assertEqual(usage['spilled_bytes'], 8000)
+        self.assertEqual((usage['hits'], usage['misses'], usage['spills']),
+                         (1, 1, 2))
+
+    def test_spilled_data_is_streamed(self):
+        self.registry.setMemoryBudget(0)
+        chan = self.registry['proc01/ADWin/A']
+        self.assertTrue(chan.isSpilled())
+        self.assertTrue(chan.isLoaded())
+        chunks = list(chan.iterData(300))
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(np.array_equal(np.concatenate(chunks),
+                                       np.arange(1000)))
+        self.assertTrue(np.array_equal(chan.readData(10, 20),
+                                       np.arange(10, 20)))
+        self.assertTrue(chan.isSpilled())
+        self.assertEqual(chan.getStatistics()['max'], 999)
+
+    def test_budget_is_shared_and_kept(self):
+        budget = MemoryBudget(8000, self.tmp_dir)
+        self.registry.setMemoryBudget(budget)
+        other = ChannelRegistry()
+        other.setMemoryBudget(budget)
+        chan = Channel('ADWin/D', device='ADWin',
+                       meas_array=np.ones(1000))
+        chan.setParent('proc01')
+        other.addChannel(chan)
+        self.assertEqual(budget.getUsage()['used_bytes'], 8000)
+        self.assertFalse(chan.isSpilled())
+        self.assertTrue(self.registry['proc01/ADWin/C'].isSpilled())
+
+        del other['proc01/ADWin/D']
+        self.assertIsNone(chan._budget)
+        self.assertEqual(budget.getUsage()['used_bytes'], 0)
+
+        self.registry.loadFromFile(self.tmp_dir + '/missing.tdms')
+        self.assertIs(self.registry.memory_budget, budget)
+
+    def test_views_are_not_counted(self):
+        self.registry.setMemoryBudget(None)
+        chan = self.registry['proc01/ADWin/A']
+        self.assertEqual(self.registry.getMemoryUsage()['used_bytes'], 24000)
+        view = chan.window(0, 500)
+        self.assertEqual(view.getResidentBytes(), 0)
+        self.assertEqual(view.spill(), 0)
+        # The data was handed out to the view, spilling it frees nothing
+        self.assertEqual(chan.spill(), 0)
+        self.assertTrue(chan.isSpilled())
+        self.assertTrue(np.array_equal(view.data, np.arange(500)))
+        # Data the channel never handed out is freed
+        self.assertEqual(self.registry['proc01/ADWin/B'].spill(), 8000)
+
+    def test_handed_out_blocks_are_not_counted(self):
+        chan = self.registry['proc01/ADWin/A']
+        chan.appendData(np.arange(1000, 1010, dtype='float64'))
+        data = chan.data
+        chan.appendData(np.arange(1010, 1020, dtype='float64'))
+        self.assertEqual(chan.spill(self.tmp_dir), 0)
+        self.assertTrue(chan.isSpilled())
+        self.assertTrue(np.array_equal(data, np.arange(1010)))
+        self.assertTrue(np.array_equal(chan.data, np.arange(1020)))
+
+    def test_appending_keeps_spilled_values(self):
+        chan = self.registry['proc01/ADWin/A']
+        chan.appendData(np.arange(1000, 1010, dtype='float64'))
+        chan.spill(self.tmp_dir)
+        # Only the values are spilled, not the room left in the last block
+        self.assertEqual(chan.getSpilledBytes(), 1010 * 8)
+        chan.appendData(np.arange(1010, 1020, dtype='float64'))
+        self.assertEqual(chan.getSpilledBytes(), 1010 * 8)
+        chan.spill(self.tmp_dir)
+        self.assertTrue(chan.isSpilled())
+        self.assertEqual(chan.getSpilledBytes(), 1020 * 8)
+        self.assertTrue(np.array_equal(chan.readData(1005, 1015),
+                                       np.arange(1005, 1015)))
+        self.assertTrue(np.array_equal(chan.data, np.arange(1020)))
+
+
+class TestFollowWithBudget(unittest.TestCase):
+    """Tests following a file without reading the spilled data back."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.i_sample = np.random.random(1000) + 1
+        self.v_sample = np.random.random(1000)
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': self.i_sample, 'VSample': self.v_sample}},
+            group_properties={'ADWin': {'IAmp': 1E6, 'VAmp': 100.0}})
+        self.registry = ChannelRegistry()
+        self.registry.setMemoryBudget(MemoryBudget(0, self.tmp_dir))
+
+    def tearDown(self):
+        self.registry.clear()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_update_does_not_read_spilled_data(self):
+        self.registry.loadFromFile(self.filename)
+        for chan in self.registry.values():
+            chan.data
+        i_sample = self.i_sample
+        for _ in range(3):
+            misses = self.registry.getMemoryUsage()['misses']
+            new_i = np.random.random(20) + 1
+            (segment, _) = build_segment(
+                [("/'ADWin'/'ISample'", {}, new_i),
+                 ("/'ADWin'/'VSample'", {}, np.ones(20))],
+                new_object_list=False)
+            with open(self.filename, 'ab') as tdms_file:
+                tdms_file.write(segment)
+            self.registry.updateFromFile()
+            i_sample = np.append(i_sample, new_i)
+            self.assertEqual(self.registry.getMemoryUsage()['misses'], misses)
+
+        chan = self.registry['proc01/ADWin/ISample']
+        self.assertEqual(chan.getSpilledBytes(), 1060 * 8)
+        self.assertTrue(np.array_equal(chan.data, i_sample))
+
+
+if __name__ == '__main__':
+    unittest.main()
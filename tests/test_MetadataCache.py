@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Test the TDMS meta data cache
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import unittest
+import os
+import stat
+import shutil
+import tempfile
+
+import numpy as np
+
+from TDMS2HDF5.MetadataCache import MetadataCache
+from TDMS2HDF5.TDMSReader import TDMSReader
+
+from tdms_factory import write_measurement, build_segment
+
+
+class TestMetadataCache(unittest.TestCase):
+    """Tests caching the parsed structure of TDMS files."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = MetadataCache(os.path.join(self.tmp_dir, 'cache'))
+        self.data = np.arange(300, dtype='float64')
+        self.filename = write_measurement(
+            os.path.join(self.tmp_dir, 'test.tdms'),
+            {'ADWin': {'ISample': self.data}}, segments=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_second_open_uses_cache(self):
+        TDMSReader(self.filename, self.cache)
+        self.assertEqual(self.cache.misses, 1)
+        reader = TDMSReader(self.filename, self.cache)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'ISample'"), self.data))
+        self.assertIn('StartTime', reader.properties['/'])
+
+    def test_growing_file_invalidates_entry(self):
+        TDMSReader(self.filename, self.cache)
+        (segment, _) = build_segment(
+            [("/'ADWin'/'ISample'", {}, np.arange(10, dtype='float64'))],
+            new_object_list=False)
+        with open(self.filename, 'ab') as tdms_file:
+            tdms_file.write(segment)
+
+        reader = TDMSReader(self.filename, self.cache)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(reader.channelLength("/'ADWin'/'ISample'"), 310)
+
+    def test_unreadable_entry_is_a_miss(self):
+        TDMSReader(self.filename, self.cache)
+        entry_name = self.cache._entryName(self.filename)
+        # An entry pickling a class that can no longer be imported
+        for contents in (b'cmissing_module\nMissing\n(tR.', b'\x80'):
+            with open(entry_name, 'wb') as entry:
+                entry.write(contents)
+            self.assertIsNone(self.cache.load(self.filename))
+            self.assertFalse(os.path.exists(entry_name))
+
+        reader = TDMSReader(self.filename, self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 4))
+        self.assertEqual(reader.channelLength("/'ADWin'/'ISample'"), 300)
+
+    def test_evicts_least_recently_used(self):
+        other = write_measurement(os.path.join(self.tmp_dir, 'other.tdms'),
+                                  {'ADWin': {'ISample': self.data}})
+        TDMSReader(self.filename, self.cache)
+        entry_size = sum(size for (_, size, _) in self.cache._entries())
+        self.cache.max_bytes = entry_size
+        TDMSReader(other, self.cache)
+
+        self.assertEqual(len(self.cache._entries()), 1)
+        self.assertIsNotNone(self.cache.load(other))
+        self.assertIsNone(self.cache.load(self.filename))
+
+    def test_cache_dir_is_private(self):
+        TDMSReader(self.filename, self.cache)
+        mode = os.stat(self.cache.cache_dir).st_mode
+        self.assertEqual(stat.S_IMODE(mode) & 0o077, 0)
+        self.assertIsNotNone(self.cache.load(self.filename))
+
+        # Entries others could have written are not unpickled
+        os.chmod(self.cache.cache_dir, 0o777)
+        self.assertIsNone(self.cache.load(self.filename))
+        os.chmod(self.cache.cache_dir, 0o700)
+
+    def test_entries_removed_meanwhile(self):
+        TDMSReader(self.filename, self.cache)
+        entries = self.cache._entries()
+        # Another viewer evicted them after they were listed
+        self.cache.clear()
+        self.cache._entries = lambda: entries
+        self.cache.max_bytes = 0
+        self.cache.evict()
+        self.cache.clear()
+
+if __name__ == "__main__":
+    unittest.main()
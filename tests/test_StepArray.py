@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Test the step encoding of slowly changing channels
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import unittest
+
+import numpy as np
+
+from TDMS2HDF5.StepArray import (StepArray, step_encode, step_encode_stream,
+                                  SAMPLE_LENGTH)
+
+
+class TestStepArray(unittest.TestCase):
+    """Tests the step encoded arrays."""
+
+    def setUp(self):
+        self.values = np.repeat([0.0, 1.5, np.nan, 2.0, 1.5], [300, 200, 50,
+                                                               400, 50])
+
+    def test_encode_in_chunks(self):
+        steps = step_encode(np.split(self.values, [123, 500, 777]), 1000)
+        self.assertEqual(len(steps), 1000)
+        self.assertTrue(np.array_equal(steps.indices,
+                                       [0, 300, 500, 550, 950]))
+        self.assertTrue(np.array_equal(steps.toArray(), self.values,
+                                       equal_nan=True))
+
+    def test_too_many_steps(self):
+        self.assertIsNone(step_encode([np.arange(1000.0)], 1000))
+        self.assertIsNone(step_encode([self.values], 1000, ratio=0.001))
+        self.assertIsNone(step_encode([], 0))
+
+    def test_decided_from_sample(self):
+        # Steps only at the start of an array with few of them overall
+        noisy = np.concatenate((np.arange(SAMPLE_LENGTH, dtype='float64'),
+                                np.zeros(200 * SAMPLE_LENGTH)))
+        read = []
+
+        def chunks():
+            for start in range(0, len(noisy), SAMPLE_LENGTH):
+                read.append(start)
+                yield noisy[start:start + SAMPLE_LENGTH]
+
+        self.assertIsNone(step_encode(chunks(), len(noisy)))
+        self.assertEqual(read, [0])
+
+    def test_stream_reads_once(self):
+        read = []
+
+        def chunks(values):
+            for chunk in np.split(values, [123, 500, 777]):
+                read.append(len(chunk))
+                yield chunk
+
+        (steps, rest) = step_encode_stream(chunks(self.values), 1000, 300)
+        self.assertIsNone(rest)
+        self.assertTrue(np.array_equal(steps.toArray(), self.values,
+                                       equal_nan=True))
+
+        del read[:]
+        values = np.concatenate((self.values[:700], np.arange(300.0)))
+        (steps, rest) = step_encode_stream(chunks(values), 1000, 300)
+        self.assertIsNone(steps)
+        self.assertTrue(np.array_equal(np.concatenate(list(rest)), values,
+                                       equal_nan=True))
+        self.assertEqual(read, [123, 377, 277, 223])
+
+    def test_read_and_iterate(self):
+        steps = StepArray([0, 300, 500, 550, 950],
+                          [0.0, 1.5, np.nan, 2.0, 1.5], 1000)
+        self.assertTrue(np.array_equal(steps.read(290, 560),
+                                       self.values[290:560], equal_nan=True))
+        self.assertEqual(len(steps.read(990, 2000)), 10)
+        chunks = list(steps.iterChunks(300))
+        self.assertEqual([len(c) for c in chunks], [300, 300, 300, 100])
+        self.assertTrue(np.array_equal(np.concatenate(chunks), self.values,
+                                       equal_nan=True))
+
+    def test_append_continues_last_step(self):
+        steps = step_encode([self.values], 1000)
+        steps.append(np.array([1.5, 1.5, 3.0]))
+        self.assertEqual(len(steps), 1003)
+        self.assertTrue(np.array_equal(steps.indices,
+                                       [0, 300, 500, 550, 950, 1002]))
+
+if __name__ == "__main__":
+    unittest.main()
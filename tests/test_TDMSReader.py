@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Test the TDMS segment reader
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from nptdms import TdmsWriter, ChannelObject
+
+from TDMS2HDF5.TDMSReader import TDMSReader, NpTDMSReader
+
+from tdms_factory import write_measurement, build_segment, START_TIME
+
+
+class TestTDMSReader(unittest.TestCase):
+    """Tests the TDMS segment reader."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = np.arange(1000, dtype='float64')
+        self.counts = np.arange(1000, dtype='int32')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, **kwargs):
+        return write_measurement(os.path.join(self.tmp_dir, 'test.tdms'),
+                                 {'ADWin': {'ISample': self.data,
+                                            'Counts': self.counts}},
+                                 group_properties={'ADWin': {'IAmp': 1E6}},
+                                 **kwargs)
+
+    def test_reads_properties(self):
+        reader = TDMSReader(self.write())
+        self.assertEqual(reader.properties['/']['StartTime'], START_TIME)
+        self.assertEqual(reader.properties["/'ADWin'"]['IAmp'], 1E6)
+        self.assertEqual(reader.properties["/'ADWin'/'ISample'"]
+                         ['wf_increment'], 0.1)
+
+    def test_groups_and_channels(self):
+        reader = TDMSReader(self.write())
+        self.assertEqual(reader.groups(), ["/'ADWin'"])
+        self.assertEqual(reader.groupChannels("/'ADWin'"),
+                         ["/'ADWin'/'ISample'", "/'ADWin'/'Counts'"])
+
+    def test_read_segmented_channel(self):
+        reader = TDMSReader(self.write(segments=7))
+        self.assertEqual(reader.channelLength("/'ADWin'/'Counts'"), 1000)
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'Counts'"), self.counts))
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'ISample'", 123, 877),
+            self.data[123:877]))
+
+    def test_read_interleaved_channel(self):
+        reader = TDMSReader(self.write(segments=3, interleaved=True))
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'ISample'"), self.data))
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'Counts'", 10, 20),
+            self.counts[10:20]))
+
+    def test_map_contiguous_channel(self):
+        filename = self.write()
+        data = TDMSReader(filename).mapChannel("/'ADWin'/'ISample'")
+        self.assertIsInstance(data, np.memmap)
+        self.assertEqual(data.filename, os.path.abspath(filename))
+        self.assertTrue(np.array_equal(data, self.data))
+
+    def test_map_fragmented_channel(self):
+        reader = TDMSReader(self.write(segments=5))
+        data = reader.mapChannel("/'ADWin'/'Counts'", self.tmp_dir)
+        self.assertIsInstance(data, np.memmap)
+        self.assertFalse(data.flags.writeable)
+        self.assertTrue(np.array_equal(data, self.counts))
+
+    def test_map_part_of_channel(self):
+        reader = TDMSReader(self.write(segments=4))
+        # Inside one segment the values can be mapped directly
+        data = reader.mapChannel("/'ADWin'/'ISample'", start=260, stop=490)
+        self.assertEqual(os.path.realpath(data.filename),
+                         os.path.realpath(reader.filename))
+        self.assertTrue(np.array_equal(data, self.data[260:490]))
+        data = reader.mapChannel("/'ADWin'/'ISample'", self.tmp_dir, 100, 900)
+        self.assertTrue(np.array_equal(data, self.data[100:900]))
+
+    def test_strided_preview(self):
+        reader = TDMSReader(self.write(segments=3))
+        (indices, values) = reader.previewChannel("/'ADWin'/'ISample'", 100)
+        self.assertTrue(np.array_equal(indices, np.arange(0, 1000, 10)))
+        self.assertTrue(np.array_equal(values, self.data[indices]))
+
+    def test_preview_of_range(self):
+        reader = TDMSReader(self.write(segments=3))
+        (indices, values) = reader.previewChannel("/'ADWin'/'ISample'", 50,
+                                                  'stride', 250, 750)
+        self.assertTrue(np.array_equal(indices, np.arange(0, 500, 10)))
+        self.assertTrue(np.array_equal(values, self.data[250:750][indices]))
+        (indices, values) = reader.previewChannel("/'ADWin'/'ISample'", 50,
+                                                  'minmax', 250, 750)
+        self.assertTrue(np.all((indices >= 0) & (indices < 500)))
+        self.assertTrue(np.array_equal(values, self.data[250:750][indices]))
+
+    def test_minmax_preview_keeps_spikes(self):
+        self.data[567] = 1E6
+        self.data[123] = -1E6
+        reader = TDMSReader(self.write(segments=3))
+        (indices, values) = reader.previewChannel("/'ADWin'/'ISample'", 30,
+                                                  'minmax')
+        self.assertTrue(np.array_equal(values, self.data[indices]))
+        self.assertIn(567, indices)
+        self.assertIn(123, indices)
+        self.assertTrue(np.all(np.diff(indices) >= 0))
+
+    def test_iterate_channel_in_chunks(self):
+        reader = TDMSReader(self.write(segments=3))
+        chunks = list(reader.iterChannel("/'ADWin'/'ISample'", 5, 995,
+                                         chunk_length=100))
+        self.assertTrue(all(len(c) <= 100 for c in chunks))
+        self.assertTrue(np.array_equal(np.concatenate(chunks),
+                                       self.data[5:995]))
+
+    def test_reads_meta_data_from_index_file(self):
+        filename = self.write(segments=4, index_file=True)
+        # Destroy the meta data in the data file, only the index is intact
+        with open(filename, 'r+b') as tdms_file:
+            tdms_file.seek(12)
+            raw_data_offset = int(np.frombuffer(tdms_file.read(16),
+                                                '<u8')[1])
+            tdms_file.seek(28)
+            tdms_file.write(b'\x00' * raw_data_offset)
+
+        reader = TDMSReader(filename)
+        self.assertEqual(reader.properties["/'ADWin'"]['IAmp'], 1E6)
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'ISample'"), self.data))
+
+    def test_segments_missing_from_index_file(self):
+        filename = self.write(segments=2, index_file=True)
+        (segment, _) = build_segment(
+            [("/'ADWin'/'ISample'", {}, np.arange(10, dtype='float64')),
+             ("/'ADWin'/'Counts'", {}, np.arange(10, dtype='int32'))],
+            new_object_list=False)
+        with open(filename, 'ab') as tdms_file:
+            tdms_file.write(segment)
+
+        reader = TDMSReader(filename)
+        self.assertEqual(reader.channelLength("/'ADWin'/'Counts'"), 1010)
+
+    def append_segment(self, filename, length, truncate=None):
+        (segment, _) = build_segment(
+            [("/'ADWin'/'ISample'", {}, np.arange(length, dtype='float64')),
+             ("/'ADWin'/'Counts'", {}, np.arange(length, dtype='int32'))],
+            new_object_list=False)
+        with open(filename, 'ab') as tdms_file:
+            tdms_file.write(segment[:truncate])
+        return segment[truncate:] if truncate is not None else b''
+
+    def test_update_reads_appended_segments(self):
+        filename = self.write(segments=2)
+        reader = TDMSReader(filename)
+        self.assertEqual(reader.update(), {})
+
+        self.append_segment(filename, 10)
+        grown = reader.update()
+        self.assertEqual(grown["/'ADWin'/'ISample'"], (1000, 1010))
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'ISample'", 1000),
+            np.arange(10, dtype='float64')))
+
+    def test_update_completes_partially_written_segment(self):
+        filename = self.write()
+        # Cut the new segment in the middle of the ISample values
+        rest = self.append_segment(filename, 10, truncate=-80)
+        reader = TDMSReader(filename)
+        self.assertEqual(reader.channelLength("/'ADWin'/'ISample'"), 1005)
+        self.assertEqual(reader.channelLength("/'ADWin'/'Counts'"), 1000)
+
+        with open(filename, 'ab') as tdms_file:
+            tdms_file.write(rest)
+        reader.update()
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'ISample'"),
+            np.concatenate((self.data, np.arange(10)))))
+        self.assertTrue(np.array_equal(
+            reader.readChannel("/'ADWin'/'Counts'"),
+            np.concatenate((self.counts, np.arange(10)))))
+
+    def test_read_string_channel(self):
+        filename = os.path.join(self.tmp_dir, 'strings.tdms')
+        with TdmsWriter(filename) as writer:
+            writer.write_segment([
+                ChannelObject('G', 'S', ['a', 'bb', 'ccc']),
+                ChannelObject('G', 'F', np.arange(3, dtype='float64'))])
+            writer.write_segment([
+                ChannelObject('G', 'S', ['d', 'ee']),
+                ChannelObject('G', 'F', np.arange(2, dtype='float64'))])
+        reader = TDMSReader(filename)
+        self.assertEqual(list(reader.readChannel("/'G'/'S'")),
+                         ['a', 'bb', 'ccc', 'd', 'ee'])
+        self.assertEqual(list(reader.readChannel("/'G'/'S'", 2, 4)),
+                         ['ccc', 'd'])
+        self.assertTrue(np.array_equal(reader.readChannel("/'G'/'F'"),
+                                       [0, 1, 2, 0, 1]))
+
+    def test_npTDMS_reader_matches(self):
+        filename = self.write(segments=3)
+        reader = TDMSReader(filename)
+        fallback = NpTDMSReader(filename)
+        self.assertEqual(fallback.groupChannels("/'ADWin'"),
+                         reader.groupChannels("/'ADWin'"))
+        self.assertEqual(fallback.properties["/'ADWin'"]['IAmp'], 1E6)
+        for path in reader.groupChannels("/'ADWin'"):
+            self.assertTrue(np.array_equal(fallback.readChannel(path),
+                                           reader.readChannel(path)))
+            self.assertTrue(np.array_equal(
+                np.concatenate(list(fallback.iterChannel(path, 10, 500,
+                                                         chunk_length=64))),
+                reader.readChannel(path, 10, 500)))
+            for method in ('stride', 'minmax'):
+                self.assertTrue(np.array_equal(
+                    fallback.previewChannel(path, 50, method)[1],
+                    reader.previewChannel(path, 50, method)[1]))
+
+if __name__ == "__main__":
+    unittest.main()
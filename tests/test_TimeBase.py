@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+""" Test the time bases of evenly sampled channels
+
+"""
+
+__author__ = "Christopher Espy"
+__copyright__ = "Copyright (C) 2014, Christopher Espy"
+__credits__ = ["Christopher Espy"]
+__license__ = "GPL"
+__version__ = "0.5"
+__maintainer__ = "Christopher Espy"
+__email__ = "christopher.espy@uni-konstanz.de"
+__status__ = "Development"
+
+import unittest
+
+import numpy as np
+
+from TDMS2HDF5.TimeBase import time_base
+
+from tdms_factory import START_TIME
+
+
+class TestTimeBase(unittest.TestCase):
+    """Tests the time base of evenly sampled channels."""
+
+    def setUp(self):
+        self.step = np.timedelta64(100, 'ms')
+        self.base = time_base(START_TIME, self.step, 1000)
+        self.times = START_TIME + self.step * np.arange(1000)
+
+    def test_equal_timing_is_interned(self):
+        self.assertIs(time_base(START_TIME, self.step, 1000), self.base)
+        self.assertIsNot(time_base(START_TIME, self.step, 999), self.base)
+
+    def test_times_and_minutes(self):
+        self.assertTrue(np.array_equal(self.base.times(), self.times))
+        self.assertTrue(np.array_equal(self.base.times(10, 20),
+                                       self.times[10:20]))
+        self.assertAlmostEqual(self.base.minutes()[600], 1.0)
+        reference = START_TIME - np.timedelta64(1, 'm')
+        self.assertAlmostEqual(self.base.minutesAt(0, reference), 1.0)
+        chunks = list(self.base.iterMinutes(300, reference))
+        self.assertEqual([len(c) for c in chunks], [300, 300, 300, 100])
+        self.assertTrue(np.allclose(np.concatenate(chunks),
+                                    self.base.minutes(reference=reference)))
+
+    def test_slicing(self):
+        self.assertEqual(self.base[-1], self.times[-1])
+        part = self.base[10:500:3]
+        self.assertTrue(np.array_equal(part.times(), self.times[10:500:3]))
+        self.assertIs(part, time_base(self.times[10], 3 * self.step,
+                                      len(part)))
+        with self.assertRaises(IndexError):
+            self.base[1000]
+
+    def test_searchsorted(self):
+        lookup = np.array([START_TIME - self.step, self.times[5],
+                           self.times[5] + np.timedelta64(1, 'ms'),
+                           self.times[-1] + self.step], dtype='M8[us]')
+        for side in ('left', 'right'):
+            self.assertTrue(np.array_equal(
+                self.base.searchsorted(lookup, side),
+                np.searchsorted(self.times, lookup, side)))
+        self.assertEqual(self.base.searchsorted(self.times[7]), 7)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,12 +18,56 @@ import unittest
 
 from PyQt4.QtGui import QApplication
 from PyQt4.QtTest import QTest
-from PyQt4.QtCore import Qt
+from PyQt4.QtCore import Qt, QModelIndex
 
-from TDMS2HDF5.tdms2hdf5 import Presenter
+import numpy as np
+
+from TDMS2HDF5.ChannelModel import Channel, ChannelRegistry
+from TDMS2HDF5.tdms2hdf5 import Main, Presenter
 
 class TestMyMainWindow(unittest.TestCase):
     pass
 
+
+class TestSelectors(unittest.TestCase):
+    """Tests selecting channels in the x and y selectors."""
+
+    def setUp(self):
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        registry = ChannelRegistry()
+        for (name, attributes) in (('VSample', {'VAmp': 100.0}),
+                                   ('ISample', {'IAmp': 1E6})):
+            chan = Channel(name, device='ADWin',
+                           meas_array=np.random.random(10) + 1)
+            chan.setParent('proc01')
+            for (attributeName, value) in attributes.items():
+                chan.attributes[attributeName] = value
+            registry.addChannel(chan)
+        registry.addTransportChannels()
+
+        self.presenter = Presenter()
+        self.presenter.setView(Main())
+        self.presenter.setChanReg(registry)
+        self.presenter.populateSelectors()
+
+    def find(self, model, names, parent=QModelIndex()):
+        for name in names:
+            rows = [model.index(row, 0, parent)
+                    for row in range(model.rowCount(parent))]
+            (parent,) = [index for index in rows if index.data() == name]
+        return parent
+
+    def test_derived_channels_can_be_selected(self):
+        presenter = self.presenter
+        presenter.newYSelection(self.find(presenter.yModel,
+                                          ['proc', 'ADWin', 'R']))
+        self.assertEqual(presenter.ySelected, 'proc/R')
+
+        rows = range(presenter.xModel.rowCount(QModelIndex()))
+        names = [presenter.xModel.index(row, 0).data() for row in rows]
+        self.assertEqual(names, ['I', 'R', 'V'])
+        presenter.newXSelection(presenter.xModel.index(names.index('I'), 0))
+        self.assertEqual(presenter.xSelected, 'proc/I')
+
 if __name__ == "__main__":
     unittest.main()